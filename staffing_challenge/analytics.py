@@ -0,0 +1,257 @@
+from flask import Blueprint, flash, redirect, render_template, request, url_for
+from flask_login import login_required, current_user
+import click
+import datetime
+import time
+import sqlalchemy
+from sqlalchemy import func
+from sqlalchemy.orm import aliased
+from collections import Counter, defaultdict
+
+from cache import cached, conditional_get, data_changed
+from database import read_only
+from forms import ROLE_CHOICES
+from instrumentation import query_budget
+from models import db, User, Shift, ShiftArchive, ShiftCoverage, ShiftEvent, StaffPickups, StaffPickupTotals, \
+    get_user
+from queries import PAGE_SIZE, parse_date_arg
+
+
+# the Coverage dashboard and the rebuild-analytics command, along with keeping the ShiftCoverage, StaffPickups and
+# StaffPickupTotals summary tables behind them up to date as shifts change
+bp = Blueprint('analytics', __name__, cli_group=None)
+
+# the columns ShiftCoverage and StaffPickups count shifts by (StaffPickups adds user_id)
+COVERAGE_KEY = ['week_start', 'location', 'area', 'role']
+# what the dashboard can break coverage down by, and the heading for each
+BREAKDOWNS = {'week_start': 'Week', 'location': 'Location', 'area': 'Hospital Area', 'role': 'Role'}
+# with no dates chosen, the dashboard covers the weeks from COVERAGE_WEEKS_BACK ago to COVERAGE_WEEKS_AHEAD from now
+COVERAGE_WEEKS_BACK = 8
+COVERAGE_WEEKS_AHEAD = 4
+
+
+def week_start(date):
+    """
+    The Monday of the week a date is in
+    """
+    return date - datetime.timedelta(days=date.weekday())
+
+
+def add_to_counts(model, key_names, counts):
+    """
+    Adds each key's changes (a dict of column: amount) to its row of a summary table. However many keys there are
+    that's two executemany statements: an INSERT OR IGNORE of a row of zeros for each key that hasn't been seen
+    before, then an UPDATE adding the amounts. Nothing can slip in between, because the change being counted already
+    holds SQLite's write lock for the rest of the transaction
+    """
+    if not counts:
+        return
+    table = model.__table__
+    columns = sorted({column for changes in counts.values() for column in changes})
+    keys = [dict(zip(key_names, key)) for key in counts]
+    db.session.execute(table.insert().prefix_with('OR IGNORE'), keys)
+    # the parameters can't share the columns' names, or SQLAlchemy takes them as the new values
+    add = table.update()\
+        .where(sqlalchemy.and_(*[table.c[name] == sqlalchemy.bindparam(f"key_{name}") for name in key_names]))\
+        .values({table.c[column]: table.c[column] + sqlalchemy.bindparam(f"add_{column}") for column in columns})
+    db.session.execute(add, [dict({f"key_{name}": value for name, value in key.items()},
+                                  **{f"add_{column}": changes.get(column, 0) for column in columns})
+                             for key, changes in zip(keys, counts.values())])
+
+
+def count_shift_changes(shifts, pickups=0, **changes):
+    """
+    Adds changes (e.g. filled=1) to the ShiftCoverage row of each of shifts, anything with their date, location, area
+    and role such as a Shift or a query row, and pickups to the StaffPickups and StaffPickupTotals rows of whoever holds
+    each one (which needs picked_up_by_id too). Called alongside the change, before it's committed
+    """
+    coverage, staff_pickups, staff_totals = defaultdict(Counter), Counter(), Counter()
+    # shifts on the same day with the same location, area, role and holder are counted together first, as a big
+    # batch (a year of posted shifts) has many of them
+    same_day = Counter((shift.date, shift.location, shift.area, shift.role, shift.picked_up_by_id if pickups else None)
+                       for shift in shifts if shift.date is not None)
+    for (date, location, area, role, picked_up_by_id), shift_count in same_day.items():
+        key = (week_start(date), location or '', area or '', role or '')
+        coverage[key].update({column: amount * shift_count for column, amount in changes.items()})
+        if picked_up_by_id is not None:
+            staff_pickups[key + (int(picked_up_by_id),)] += pickups * shift_count
+            staff_totals[(int(picked_up_by_id),)] += pickups * shift_count
+    add_to_counts(ShiftCoverage, COVERAGE_KEY, coverage)
+    add_to_counts(StaffPickups, COVERAGE_KEY + ['user_id'],
+                  {key: {'pickups': amount} for key, amount in staff_pickups.items()})
+    add_to_counts(StaffPickupTotals, ['user_id'], {key: {'pickups': amount} for key, amount in staff_totals.items()})
+
+
+def counted_shifts(condition):
+    """
+    The fields count_shift_changes needs for the shifts matching condition
+    """
+    return db.session.query(Shift.date, Shift.location, Shift.area, Shift.role, Shift.picked_up_by_id)\
+        .filter(condition).all()
+
+
+def count_claim(shift):
+    """
+    Counts a staff member's request for a shift, and how long the shift had been up for grabs: since it was last
+    posted, denied or released, which is the shift's latest event as it can only be claimed while it's up. Shifts
+    posted before the event log started are counted without a time. Called before the claim's own event is recorded
+    """
+    put_up_at = db.session.query(ShiftEvent.created_at).filter(ShiftEvent.shift_id == shift.shift_id)\
+        .order_by(ShiftEvent.id.desc()).limit(1).scalar()
+    if put_up_at is None:
+        count_shift_changes([shift], claims=1)
+    else:
+        count_shift_changes([shift], claims=1, timed_claims=1,
+                            claim_seconds=(datetime.datetime.utcnow() - put_up_at).total_seconds())
+
+
+def every_shift(*columns):
+    """
+    The given columns of every shift, live and archived, as a subquery
+    """
+    return sqlalchemy.union_all(sqlalchemy.select([getattr(Shift, column) for column in columns]),
+                                sqlalchemy.select([getattr(ShiftArchive, column) for column in columns])).alias()
+
+
+def rebuild_analytics():
+    """
+    Empties the summary tables and counts every shift, live and archived, into them again: posted and filled from the
+    shifts as they are now, claims, their times and denials from the shift event log, and StaffPickupTotals from
+    StaffPickups once that's been counted. Done in one transaction with set-based INSERT ... SELECTs, so the dashboard
+    never sees half the counts. Returns how many coverage and pickup rows were written
+    """
+    shifts = every_shift('shift_id', 'date', 'location', 'area', 'role', 'status', 'picked_up_by_id')
+    # the databases don't share a way to find a date's week, so the Monday of each shift date is worked out with
+    # week_start() and joined in from a temporary table (a few hundred rows per year of shifts)
+    shift_weeks = sqlalchemy.Table('shift_weeks', sqlalchemy.MetaData(),
+                                   sqlalchemy.Column('date', sqlalchemy.Date, primary_key=True),
+                                   sqlalchemy.Column('week_start', sqlalchemy.Date), prefixes=['TEMPORARY'])
+    connection = db.session.connection()
+    shift_weeks.create(bind=connection)
+    dates = [date for date, in db.session.query(shifts.c.date).filter(shifts.c.date != None).distinct()]
+    if dates:
+        db.session.execute(shift_weeks.insert(), [{'date': date, 'week_start': week_start(date)} for date in dates])
+    shifts_by_week = shifts.join(shift_weeks, shift_weeks.c.date == shifts.c.date)
+    key_columns = [shift_weeks.c.week_start, func.coalesce(shifts.c.location, ''), func.coalesce(shifts.c.area, ''),
+                   func.coalesce(shifts.c.role, '')]
+    filled = sqlalchemy.and_(shifts.c.status == 'Approved', shifts.c.picked_up_by_id != None)
+
+    db.session.execute(ShiftCoverage.__table__.delete())
+    db.session.execute(StaffPickups.__table__.delete())
+    db.session.execute(StaffPickupTotals.__table__.delete())
+    db.session.execute(ShiftCoverage.__table__.insert().from_select(
+        COVERAGE_KEY + ['posted', 'filled', 'claims', 'timed_claims', 'claim_seconds', 'denied'],
+        sqlalchemy.select(key_columns + [func.count(), func.sum(sqlalchemy.case([(filled, 1)], else_=0))] +
+                          [sqlalchemy.literal(value) for value in (0, 0, 0.0, 0)])
+        .select_from(shifts_by_week).group_by(*key_columns)))
+    db.session.execute(StaffPickups.__table__.insert().from_select(
+        COVERAGE_KEY + ['user_id', 'pickups'],
+        sqlalchemy.select(key_columns + [shifts.c.picked_up_by_id, func.count()])
+        .select_from(shifts_by_week).where(filled).group_by(*key_columns, shifts.c.picked_up_by_id)))
+    db.session.execute(StaffPickupTotals.__table__.insert().from_select(
+        ['user_id', 'pickups'],
+        sqlalchemy.select([StaffPickups.user_id, func.sum(StaffPickups.pickups)]).group_by(StaffPickups.user_id)))
+
+    # each claim's time up for grabs runs from the event before it, see count_claim. The times are subtracted here
+    # rather than in SQL for the same reason as the weeks
+    previous = aliased(ShiftEvent)
+    put_up_at = sqlalchemy.select([previous.created_at])\
+        .where(sqlalchemy.and_(previous.shift_id == ShiftEvent.shift_id, previous.id < ShiftEvent.id))\
+        .order_by(previous.id.desc()).limit(1).as_scalar()
+    events = db.session.query(*key_columns, ShiftEvent.event_type, ShiftEvent.created_at, put_up_at)\
+        .select_from(ShiftEvent).join(shifts_by_week, shifts.c.shift_id == ShiftEvent.shift_id)\
+        .filter(ShiftEvent.event_type.in_(['claimed', 'denied']))
+    event_counts = defaultdict(Counter)
+    for week, location, area, role, event_type, created_at, claim_put_up_at in events:
+        counts = event_counts[(week, location, area, role)]
+        if event_type == 'denied':
+            counts['denied'] += 1
+            continue
+        counts['claims'] += 1
+        if claim_put_up_at is not None:
+            counts['timed_claims'] += 1
+            counts['claim_seconds'] += (created_at - claim_put_up_at).total_seconds()
+    add_to_counts(ShiftCoverage, COVERAGE_KEY, event_counts)
+    shift_weeks.drop(bind=connection)
+    data_changed()
+    db.session.commit()
+    return ShiftCoverage.query.count(), StaffPickups.query.count()
+
+
+@bp.cli.command('rebuild-analytics')
+def rebuild_analytics_command():
+    """
+    Recounts the Coverage dashboard's summary tables from scratch (flask rebuild-analytics). They're kept up to date as
+    shifts change, so this is for a database upgraded from before they existed, or after changing shifts by hand
+    """
+    started_at = time.perf_counter()
+    coverage_rows, pickup_rows = rebuild_analytics()
+    click.echo(f"Counted {coverage_rows} coverage rows and {pickup_rows} pickup rows in "
+               f"{time.perf_counter() - started_at:.1f} seconds")
+
+
+def coverage_report(first_week, end_date, breakdown, filters):
+    """
+    The Coverage dashboard's figures for the weeks from first_week through end_date matching filters (pairs of
+    location, area or role and a value): a row per breakdown value, and the PAGE_SIZE staff members who picked up the
+    most shifts. Both read the summary tables with a range scan over their week_start indexes, except that with no
+    filters and every week of pickups in range the leaderboard is the top of StaffPickupTotals
+    """
+    group = getattr(ShiftCoverage, breakdown)
+    coverage = db.session.query(group.label('group'), func.sum(ShiftCoverage.posted).label('posted'),
+                                func.sum(ShiftCoverage.filled).label('filled'),
+                                func.sum(ShiftCoverage.claims).label('claims'),
+                                func.sum(ShiftCoverage.timed_claims).label('timed_claims'),
+                                func.sum(ShiftCoverage.claim_seconds).label('claim_seconds'),
+                                func.sum(ShiftCoverage.denied).label('denied'))\
+        .filter(ShiftCoverage.week_start.between(first_week, end_date),
+                *[getattr(ShiftCoverage, name) == value for name, value in filters])\
+        .group_by(group).order_by(group)
+    rows = [{'group': row.group, 'posted': row.posted, 'filled': row.filled,
+             'fill_rate': row.filled / row.posted if row.posted else None, 'claims': row.claims,
+             'hours_to_claim': row.claim_seconds / row.timed_claims / 3600 if row.timed_claims else None,
+             'denied': row.denied} for row in coverage]
+    # each of these is a single lookup at one end of the StaffPickups primary key
+    first_pickup_week, last_pickup_week = db.session.query(
+        db.select([func.min(StaffPickups.week_start)]).as_scalar(),
+        db.select([func.max(StaffPickups.week_start)]).as_scalar()).one()
+    if not filters and (first_pickup_week is None or first_week <= first_pickup_week and last_pickup_week <= end_date):
+        top_pickups = db.session.query(StaffPickupTotals.user_id, StaffPickupTotals.pickups)\
+            .order_by(StaffPickupTotals.pickups.desc()).limit(PAGE_SIZE).subquery()
+    else:
+        # totalled first, so only the staff members who make the list are looked up
+        top_pickups = db.session.query(StaffPickups.user_id, func.sum(StaffPickups.pickups).label('pickups'))\
+            .filter(StaffPickups.week_start.between(first_week, end_date),
+                    *[getattr(StaffPickups, name) == value for name, value in filters])\
+            .group_by(StaffPickups.user_id).order_by(func.sum(StaffPickups.pickups).desc()).limit(PAGE_SIZE)\
+            .subquery()
+    pickups = db.session.query(User.name, User.role, User.location, top_pickups.c.pickups)\
+        .join(top_pickups, top_pickups.c.user_id == User.id).order_by(top_pickups.c.pickups.desc()).all()
+    return rows, pickups
+
+
+@bp.route('/coverage')
+@login_required
+@query_budget(5)
+@read_only
+@conditional_get
+def coverage():
+    """
+    The Coverage dashboard: shifts posted, fill rate, requests, average hours to claim and denials for each week,
+    location, area or role (the "by" parameter), over a start_date to end_date range and with location, area and role
+    filters, plus who picked up the most shifts. It's read from the summary tables, so years of shifts cost the same
+    few indexed lookups as a week. Only Admins can see it
+    """
+    if get_user(current_user.id).role != 'Admin':
+        flash('Only Admins can see the Coverage dashboard.')
+        return redirect(url_for('shifts.shift'))
+    cur_date = datetime.date.today()
+    start_date = parse_date_arg('start_date') or cur_date - datetime.timedelta(weeks=COVERAGE_WEEKS_BACK)
+    end_date = parse_date_arg('end_date') or cur_date + datetime.timedelta(weeks=COVERAGE_WEEKS_AHEAD)
+    filters = {name: request.args[name] for name in ['location', 'area', 'role'] if request.args.get(name)}
+    breakdown = request.args.get('by') if request.args.get('by') in BREAKDOWNS else 'week_start'
+    report = (week_start(start_date), end_date, breakdown, tuple(sorted(filters.items())))
+    rows, pickups = cached(('coverage',) + report, lambda: coverage_report(*report))
+    return render_template('coverage.html', rows=rows, pickups=pickups, filters=filters, breakdown=breakdown,
+                           breakdowns=BREAKDOWNS, start_date=start_date, end_date=end_date,
+                           roles=[role for role in ROLE_CHOICES if role != 'Admin'], logged_in=True)
@@ -0,0 +1,216 @@
+from flask import Blueprint, current_app, jsonify, request
+from flask_login import login_required, current_user
+
+import datetime
+import gzip
+
+from cache import cached, current_data_version
+from database import read_only
+from instrumentation import query_budget
+from models import db, Shift, ShiftEvent, get_user
+from queries import decode_cursor, encode_cursor, feed_page, keyset_page, open_shifts_query, parse_date_arg, \
+    pending_requests_query, user_shifts_query
+
+
+# version 1 of the JSON API used by the mobile app: the Shift List, a feed of the shifts that changed since the app
+# last asked, the shift event log, a staff member's shifts and an Admin's pending requests. It uses the same login as
+# the website
+bp = Blueprint('api', __name__, url_prefix='/api/v1')
+
+# the shift fields the API sends, in this order. Each shift is sent as a list of values rather than an object, so the
+# field names are only sent once per response
+SHIFT_FIELDS = ['shift_id', 'location', 'role', 'area', 'date', 'start_time', 'end_time', 'start_at', 'end_at',
+                'status', 'picked_up_by_id', 'added_by_name', 'comments']
+SHIFT_COLUMNS = [getattr(Shift, field) for field in SHIFT_FIELDS]
+# the pending request fields, the last being the name of the staff member asking for the shift
+PENDING_FIELDS = ['shift_id', 'location', 'role', 'area', 'date', 'start_time', 'end_time', 'comments', 'name']
+USER_FIELDS = ['id', 'name', 'role', 'location', 'email', 'phone_num', 'availability', 'can_float', 'shifts_worked']
+# the order the change feed walks through changed shifts in, which is also the order of its cursor
+CHANGE_ORDER = [Shift.data_version, Shift.shift_id]
+# most changed shifts (or shift events) sent at once, the feeds say when there are more waiting
+CHANGES_PAGE_SIZE = 500
+# the shift event fields the API sends (see ShiftEvent), id being the event's sequence number
+EVENT_FIELDS = ['id', 'shift_id', 'event_type', 'status', 'picked_up_by_id', 'actor_id', 'created_at']
+EVENT_COLUMNS = [getattr(ShiftEvent, field) for field in EVENT_FIELDS]
+
+
+def json_values(row, fields):
+    """
+    The values of fields on a row, with dates and times as ISO 8601 strings
+    """
+    values = [getattr(row, field) for field in fields]
+    return [value.isoformat() if isinstance(value, (datetime.date, datetime.time)) else value for value in values]
+
+
+def shift_values(rows):
+    return [json_values(row, SHIFT_FIELDS) for row in rows]
+
+
+def shift_list(values, **extra):
+    return jsonify(fields=SHIFT_FIELDS, shifts=values, **extra)
+
+
+def api_error(message, status):
+    return jsonify(error=message), status
+
+
+@bp.after_request
+def compress(response):
+    """
+    Gzips API responses of at least API_GZIP_MIN_BYTES for clients that accept it
+    """
+    if response.status_code != 200 or response.direct_passthrough or 'Content-Encoding' in response.headers or \
+            'gzip' not in request.accept_encodings:
+        return response
+    body = response.get_data()
+    if len(body) >= current_app.config['API_GZIP_MIN_BYTES']:
+        response.set_data(gzip.compress(body, compresslevel=current_app.config['API_GZIP_LEVEL']))
+        response.headers['Content-Encoding'] = 'gzip'
+    response.vary.add('Accept-Encoding')
+    return response
+
+
+@bp.route('/me')
+@login_required
+@query_budget(1)
+@read_only
+def me():
+    """
+    The logged in staff member
+    """
+    return jsonify(dict(zip(USER_FIELDS, json_values(get_user(current_user.id), USER_FIELDS))))
+
+
+@bp.route('/shifts')
+@login_required
+@query_budget(3)
+@read_only
+def shifts():
+    """
+    One page of the Shift List, with the same role, location, start_date, end_date and after (cursor) parameters and
+    the same rules about roles as the page itself. Along with the shifts and the cursor for the next page ("next") it
+    returns a "changes" cursor to start following /shifts/changes from, so after the first load an app only needs the
+    changes
+    """
+    # the version is read before the shifts, so anything changed while they're read turns up again in the feed
+    # rather than being missed
+    version = current_data_version()
+    cur_role = get_user(current_user.id).role
+    cur_date = datetime.date.today()
+    board_role = (request.args.get('role') or cur_role) if cur_role == 'Admin' else cur_role
+    start_date = max(parse_date_arg('start_date') or cur_date, cur_date)
+    board_page = (board_role, start_date, request.args.get('location'), parse_date_arg('end_date'),
+                  request.args.get('after'))
+    values, next_cursor = cached(('api_open_shifts',) + board_page, lambda: open_shift_values(*board_page))
+    # every shift changed in this version or earlier is covered above, the feed starts with the next version (shift
+    # ids start at 1)
+    changes_cursor = encode_cursor([(version.version if version else 0) + 1, 0])
+    return shift_list(values, next=next_cursor, changes=changes_cursor)
+
+
+def open_shift_values(role, start_date, location, end_date, cursor):
+    """
+    One page of the Shift List as lists of SHIFT_FIELDS values, and the cursor for the next page
+    """
+    available_shifts = open_shifts_query(role, start_date, location=location, end_date=end_date)\
+        .with_entities(*SHIFT_COLUMNS)
+    shift_page, next_cursor = keyset_page(available_shifts, [Shift.start_at, Shift.shift_id], cursor)
+    return shift_values(shift_page), next_cursor
+
+
+@bp.route('/shifts/changes')
+@login_required
+@query_budget(3)
+@read_only
+def shift_changes():
+    """
+    The shifts (of the staff member's role, or every role for Admins) that have been posted or have changed since the
+    "since" cursor, oldest change first, whatever happened to them: posted, claimed, approved, denied, released or
+    edited. A shift is on the Shift List while its status is "Posted" and picked_up_by_id is null, so an app can apply
+    the changes to the list it already has. Each response has the cursor to ask with next time, and "more" is true
+    when there are more changes waiting straight away. Phones that are up to date poll with the same cursor, so the
+    answer is cached until the next change
+    """
+    since = request.args.get('since', '')
+    if decode_cursor(since, CHANGE_ORDER) is None:
+        return api_error('since must be a cursor returned by /shifts or /shifts/changes', 400)
+    cur_role = get_user(current_user.id).role
+    values, next_cursor, more = cached(('api_shift_changes', cur_role, since),
+                                       lambda: changed_shift_values(cur_role, since))
+    return shift_list(values, cursor=next_cursor, more=more)
+
+
+def changed_shift_values(role, since):
+    """
+    The page of changed shifts after the since cursor as lists of SHIFT_FIELDS values, the cursor to continue from and
+    whether there are more
+    """
+    changed_shifts = db.session.query(*SHIFT_COLUMNS, Shift.data_version)
+    if role != 'Admin':
+        changed_shifts = changed_shifts.filter(Shift.role == role)
+    changes, next_cursor, more = feed_page(changed_shifts, CHANGE_ORDER, since, CHANGES_PAGE_SIZE)
+    return shift_values(changes), next_cursor, more
+
+
+@bp.route('/shift-events')
+@login_required
+@query_budget(3)
+@read_only
+def shift_events():
+    """
+    The shift event log (see ShiftEvent) as a change feed: every time a shift (of the staff member's role, or any role
+    for Admins) was posted, updated, claimed, approved, denied, released or assigned after the "after" cursor, in the
+    order it happened, or from the start of the log without one. Unlike /shifts/changes, which only has each shift as
+    it is now, every step is there, so reports and notifications can follow along without rescanning the shift table.
+    Each response has the cursor to ask with next time, and "more" is true when there are more events waiting straight
+    away
+    """
+    after = request.args.get('after') or encode_cursor([0])
+    if decode_cursor(after, [ShiftEvent.id]) is None:
+        return api_error('after must be a cursor returned by /shift-events', 400)
+    cur_role = get_user(current_user.id).role
+    values, next_cursor, more = cached(('api_shift_events', cur_role, after),
+                                       lambda: shift_event_values(cur_role, after))
+    return jsonify(fields=EVENT_FIELDS, events=values, cursor=next_cursor, more=more)
+
+
+def shift_event_values(role, after):
+    """
+    The page of shift events after the after cursor as lists of EVENT_FIELDS values, the cursor to continue from and
+    whether there are more
+    """
+    events = db.session.query(*EVENT_COLUMNS)
+    if role != 'Admin':
+        events = events.join(Shift, Shift.shift_id == ShiftEvent.shift_id).filter(Shift.role == role)
+    page, next_cursor, more = feed_page(events, [ShiftEvent.id], after, CHANGES_PAGE_SIZE)
+    return [json_values(row, EVENT_FIELDS) for row in page], next_cursor, more
+
+
+@bp.route('/users/<int:user_id>/shifts')
+@login_required
+@query_budget(3)
+@read_only
+def user_shifts(user_id):
+    """
+    The shifts a staff member has picked up, archived ones included, in date order a page at a time (with an "after"
+    cursor). Staff can see their own, Admins can see anyone's
+    """
+    if user_id != current_user.id and get_user(current_user.id).role != 'Admin':
+        return api_error("Only Admins can see other staff members' shifts", 403)
+    if get_user(user_id) is None:
+        return api_error('There is no staff member with that id', 404)
+    shift_page, next_cursor = keyset_page(user_shifts_query(user_id, SHIFT_FIELDS),
+                                          [Shift.start_at, Shift.shift_id], request.args.get('after'))
+    return shift_list(shift_values(shift_page), next=next_cursor)
+
+
+@bp.route('/pending')
+@login_required
+@query_budget(2)
+@read_only
+def pending():
+    """
+    Shifts the logged in Admin posted that are waiting on a pickup request, with the name of whoever asked for each
+    """
+    pending_shifts = pending_requests_query(current_user.id, datetime.date.today())
+    return jsonify(fields=PENDING_FIELDS, shifts=[json_values(row, PENDING_FIELDS) for row in pending_shifts])
@@ -0,0 +1,81 @@
+from flask import Blueprint, current_app
+import click
+import datetime
+import time
+import sqlalchemy
+from sqlalchemy import func
+
+from cache import data_changed
+from models import db, Shift, ShiftArchive
+from queries import start_of_day
+
+
+# the archive-shifts command (flask archive-shifts), which has no pages of its own
+bp = Blueprint('archive', __name__, cli_group=None)
+
+# the columns shift and shift_archive share, in the order they're copied
+SHIFT_COLUMN_NAMES = [column.name for column in Shift.__table__.columns]
+
+
+def move_shift_batch(source, target, condition, batch_size):
+    """
+    Moves up to batch_size shifts matching condition from one of the shift and shift_archive tables to the other,
+    oldest first, in one short transaction: copied with INSERT ... SELECT and then deleted by id. Returns how many
+    shifts were moved
+    """
+    shift_ids = [row.shift_id for row in db.session.execute(
+        sqlalchemy.select([source.c.shift_id]).where(condition).order_by(source.c.start_at).limit(batch_size))]
+    if not shift_ids:
+        return 0
+    values = [source.c[name] for name in SHIFT_COLUMN_NAMES]
+    names = list(SHIFT_COLUMN_NAMES)
+    if 'archived_at' in target.c:
+        values.append(sqlalchemy.literal(datetime.datetime.utcnow(), db.DateTime))
+        names.append('archived_at')
+    moving = source.c.shift_id.in_(shift_ids)
+    db.session.execute(target.insert().from_select(names, sqlalchemy.select(values).where(moving)))
+    db.session.execute(source.delete().where(moving))
+    data_changed()
+    db.session.commit()
+    return len(shift_ids)
+
+
+def archive_shifts_before(cutoff, batch_size, pause_seconds=0.0):
+    """
+    Moves every shift that started before cutoff into shift_archive, batch_size at a time, pausing for pause_seconds
+    between batches so people accepting shifts get the write lock in between. The shift with the highest id is always
+    kept, because SQLite gives a new shift the highest id plus one and archived ids mustn't be handed out again.
+    Returns how many shifts were archived
+    """
+    shift_table = Shift.__table__
+    newest_id = db.session.query(func.max(Shift.shift_id)).scalar()
+    archived = 0
+    while True:
+        moved = move_shift_batch(shift_table, ShiftArchive.__table__,
+                                 sqlalchemy.and_(shift_table.c.start_at < cutoff, shift_table.c.shift_id < newest_id),
+                                 batch_size)
+        archived += moved
+        if moved < batch_size:
+            return archived
+        time.sleep(pause_seconds)
+
+
+@bp.cli.command('archive-shifts')
+@click.option('--days', type=click.IntRange(min=1),
+              help='Archive shifts that started more than this many days ago (ARCHIVE_AFTER_DAYS by default).')
+@click.option('--batch-size', type=int, help='Shifts moved per transaction (ARCHIVE_BATCH_SIZE by default).')
+@click.option('--pause-seconds', default=0.05, show_default=True, help='Pause between batches.')
+def archive_shifts(days, batch_size, pause_seconds):
+    """
+    Moves shifts that started more than ARCHIVE_AFTER_DAYS ago from the shift table to shift_archive (flask
+    archive-shifts). Staff members' user details still show them. Meant to be run every night, e.g. from cron:
+    "0 3 * * * cd /srv/staffing && flask archive-shifts"
+    """
+    days = current_app.config['ARCHIVE_AFTER_DAYS'] if days is None else days
+    # double-booking checks look back a day from a new shift's start, so yesterday's shifts have to stay live
+    days = max(days, 1)
+    cutoff = start_of_day(datetime.date.today() - datetime.timedelta(days=days))
+    started_at = time.perf_counter()
+    archived = archive_shifts_before(cutoff, batch_size or current_app.config['ARCHIVE_BATCH_SIZE'], pause_seconds)
+    click.echo(f"Archived {archived} shifts that started before {cutoff.date()} in "
+               f"{time.perf_counter() - started_at:.1f} seconds")
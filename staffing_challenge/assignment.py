@@ -0,0 +1,122 @@
+import numpy as np
+
+
+# extra cost of sending a staff member who can float to a shift at another hospital, measured in "shifts already
+# worked" so it trades off against the fairness cost below
+FLOAT_PENALTY = 2.0
+# the longest a shift can be, so bookings that started earlier than this can't overlap a shift
+MAX_SHIFT_MINUTES = 24 * 60
+# number of shifts (in start time order) matched against the staff of their role at once
+CHUNK_SIZE = 512
+
+
+def encode_labels(*columns):
+    """
+    Replaces string columns (e.g. role or location) with integer codes that are shared across all of the columns, so
+    they can be compared with fast vectorized equality checks
+    """
+    _, codes = np.unique(np.concatenate([np.asarray(column, dtype=object).astype(str) for column in columns]),
+                         return_inverse=True)
+    return np.split(codes, np.cumsum([len(column) for column in columns])[:-1])
+
+
+def staff_positions(staff_ids, ids):
+    """
+    Returns the position of each id in staff_ids, or -1 for ids that aren't there
+    """
+    sorter = np.argsort(staff_ids)
+    positions = np.searchsorted(staff_ids, ids, sorter=sorter)
+    positions = np.minimum(positions, len(staff_ids) - 1)
+    found = sorter[positions]
+    return np.where(staff_ids[found] == ids, found, -1) if len(staff_ids) else np.full(len(ids), -1)
+
+
+def assign_shifts(shifts, staff, bookings, float_penalty=FLOAT_PENALTY, chunk_size=CHUNK_SIZE):
+    """
+    Matches open shifts to eligible staff and returns the (shift ids, staff ids) of the assignments.
+
+    shifts holds arrays of shift_id, role, location, start and end, staff holds arrays of staff_id, role, location,
+    can_float (bool) and shifts_worked, and bookings holds arrays of staff_id, start and end for shifts people already
+    have. Times are integer minutes (e.g. datetime64[m] cast to int64).
+
+    A staff member is eligible for a shift when their role matches, the shift is at their hospital or they can float,
+    and it doesn't overlap anything they're already booked for. Among eligible staff the cost is how many shifts they've
+    worked (counting the ones handed out in this run, so the work is spread around) plus FLOAT_PENALTY when they'd have
+    to float. Shifts are worked through in start time order a chunk at a time. Within a chunk every unfilled shift
+    picks its cheapest eligible staff member at once, anyone picked by several shifts keeps the one where they're
+    cheapest, and the rounds repeat until nothing else can be filled. Each round is a handful of NumPy operations over
+    the chunk's shift x staff cost matrix, which keeps thousands of shifts against tens of thousands of staff to
+    seconds without holding the full matrix in memory
+    """
+    shift_role, staff_role = encode_labels(shifts['role'], staff['role'])
+    shift_location, staff_location = encode_labels(shifts['location'], staff['location'])
+    shift_start = np.asarray(shifts['start'], dtype=np.int64)
+    shift_end = np.asarray(shifts['end'], dtype=np.int64)
+    staff_ids = np.asarray(staff['staff_id'], dtype=np.int64)
+    can_float = np.asarray(staff['can_float'], dtype=bool)
+    load = np.nan_to_num(np.asarray(staff['shifts_worked'], dtype=np.float64))
+
+    booked_staff = staff_positions(staff_ids, np.asarray(bookings['staff_id'], dtype=np.int64))
+    booked_start = np.asarray(bookings['start'], dtype=np.int64)[booked_staff >= 0]
+    booked_end = np.asarray(bookings['end'], dtype=np.int64)[booked_staff >= 0]
+    booked_staff = booked_staff[booked_staff >= 0]
+
+    assigned_shifts, assigned_staff = [], []
+    by_start = np.argsort(shift_start, kind='stable')
+    for role in np.unique(shift_role):
+        role_staff = np.nonzero(staff_role == role)[0]
+        if not len(role_staff):
+            continue
+        # maps a staff position to its column in this role's cost matrices
+        column_of = np.full(len(staff_ids), -1)
+        column_of[role_staff] = np.arange(len(role_staff))
+        role_shifts = by_start[shift_role[by_start] == role]
+
+        for chunk_start in range(0, len(role_shifts), chunk_size):
+            rows = role_shifts[chunk_start:chunk_start + chunk_size]
+            starts, ends = shift_start[rows], shift_end[rows]
+            same_location = shift_location[rows][:, None] == staff_location[role_staff][None, :]
+            eligible = same_location | can_float[role_staff][None, :]
+
+            # rule out staff who are already booked for something overlapping each shift
+            nearby = (booked_start < ends.max()) & (booked_end > starts.min()) & (column_of[booked_staff] >= 0)
+            clashes = (starts[:, None] < booked_end[nearby][None, :]) & (ends[:, None] > booked_start[nearby][None, :])
+            clash_rows, clash_bookings = np.nonzero(clashes)
+            eligible[clash_rows, column_of[booked_staff[nearby][clash_bookings]]] = False
+
+            cost = np.where(eligible, load[role_staff][None, :] + float_penalty * ~same_location, np.inf)
+            overlapping = (starts[:, None] < ends[None, :]) & (ends[:, None] > starts[None, :])
+            chunk_assigned_rows, chunk_assigned_columns = [], []
+            while True:
+                best = cost.argmin(axis=1)
+                best_cost = cost[np.arange(len(rows)), best]
+                open_rows = np.nonzero(np.isfinite(best_cost))[0]
+                if not len(open_rows):
+                    break
+                # staff picked by several shifts this round take the one where they're cheapest (earliest on ties)
+                order = np.lexsort((open_rows, best_cost[open_rows], best[open_rows]))
+                columns, first = np.unique(best[open_rows][order], return_index=True)
+                won = open_rows[order][first]
+
+                cost[won, :] = np.inf
+                picked = cost[:, columns] + 1
+                # they can't also take another shift in this chunk that overlaps the one they just got
+                picked[overlapping[:, won]] = np.inf
+                cost[:, columns] = picked
+                load[role_staff[columns]] += 1
+                chunk_assigned_rows.append(won)
+                chunk_assigned_columns.append(columns)
+
+            if chunk_assigned_rows:
+                won = np.concatenate(chunk_assigned_rows)
+                positions = role_staff[np.concatenate(chunk_assigned_columns)]
+                assigned_shifts.append(np.asarray(shifts['shift_id'])[rows[won]])
+                assigned_staff.append(staff_ids[positions])
+                # the new assignments count as bookings for the chunks that follow
+                booked_staff = np.concatenate([booked_staff, positions])
+                booked_start = np.concatenate([booked_start, starts[won]])
+                booked_end = np.concatenate([booked_end, ends[won]])
+
+    if not assigned_shifts:
+        return np.array([], dtype=np.int64), np.array([], dtype=np.int64)
+    return np.concatenate(assigned_shifts).astype(np.int64), np.concatenate(assigned_staff)
@@ -0,0 +1,141 @@
+from flask import Blueprint, render_template, request, url_for, redirect, flash
+from flask_login import login_user, LoginManager, login_required, current_user, logout_user
+from werkzeug.security import generate_password_hash, check_password_hash
+
+from cache import data_changed
+from forms import LoginForm, RegisterForm, SetPasswordForm, UploadForm, ShiftUploadForm
+from instrumentation import query_budget
+from invites import find_invited_user
+from models import db, User, get_user, find_user_by_email
+
+
+# home page, logging in and out, and registration
+bp = Blueprint('auth', __name__)
+
+# allow app to have default current user characteristics such as is_authenticated status
+login_manager = LoginManager()
+
+
+@login_manager.user_loader
+def load_user(user_id):
+    return get_user(user_id)
+
+
+@bp.route('/')
+def home():
+    """
+    Will take the user back to the home page that allows the user to either log in or register
+    """
+    return render_template("index.html")
+
+
+@bp.route('/login', methods=["GET", "POST"])
+@query_budget(1)
+def login():
+    """
+    Triggered by a user selecting the login button on the home page or on the navigation bar.
+    If successfully logged in the user will be "authenticated" and allowed to use all the app's features
+    """
+    login_form = LoginForm()
+    if request.method == "POST":
+        email = login_form.email.data
+        password = login_form.password.data
+
+        # Find user by email entered.
+        user = find_user_by_email(email)
+
+        # Email doesn't exist
+        if not user:
+            flash('That email does not exist, please try again.')
+            return redirect(url_for('auth.login'))
+        # Invited, but hasn't set a password yet
+        elif user.password is None:
+            flash("You haven't set a password yet, please use the link in your invite email.")
+            return redirect(url_for('auth.login'))
+        # Password incorrect
+        elif not check_password_hash(user.password, password):
+            flash('Password incorrect, please try again.')
+            return redirect(url_for('auth.login'))
+        # Email exists and password correct
+        else:
+            login_user(user)
+            return redirect(url_for('staff.staff'))
+
+    return render_template("login.html", logged_in=current_user.is_authenticated)
+
+
+@bp.route('/invite/<token>', methods=["GET", "POST"])
+@query_budget(3)
+def accept_invite(token):
+    """
+    The page an invite email links to, where a staff member added by an Admin or a roster upload sets their password.
+    The password is only hashed here, when they first need it, and the invite can't be used again afterwards
+    """
+    user = find_invited_user(token)
+    if not user:
+        flash('That invite link has expired or has already been used, please ask an Admin to send a new one.')
+        return redirect(url_for('auth.login'))
+    password_form = SetPasswordForm()
+    if password_form.validate_on_submit():
+        user.password = generate_password_hash(password_form.password.data, method='pbkdf2:sha256', salt_length=8)
+        user.invite_token_hash = None
+        user.invite_expires_at = None
+        db.session.commit()
+        login_user(user)
+        return redirect(url_for('staff.staff'))
+
+    return render_template("set_password.html", form=password_form, user=user)
+
+
+# registration function
+@bp.route('/register', methods=["GET", "POST"])
+def register():
+    """
+    Triggered by a user selecting the Register button on the home page or on the navigation bar.
+    Currently, registering will add the user to the "Staff List", however that might change to eventually exclude Admin
+    users from being included in the "Staff List"
+    """
+    registration_form = RegisterForm()
+    if request.method == "POST":
+        if find_user_by_email(registration_form.email.data):
+            # User already exists
+            flash("You've already signed up with that email, log in instead!")
+            return redirect(url_for('auth.login'))
+        hash_and_salted_password = generate_password_hash(
+            registration_form.password.data,
+            method='pbkdf2:sha256',
+            salt_length=8
+        )
+        new_user = User(
+            name=registration_form.name.data,
+            role=registration_form.role.data,
+            location=registration_form.location.data,
+            email=registration_form.email.data,
+            phone_num=registration_form.phone_num.data,
+            availability=registration_form.availability.data,
+            can_float=registration_form.can_float.data,
+            password=hash_and_salted_password
+        )
+        db.session.add(new_user)
+        data_changed()
+        db.session.commit()
+        login_user(new_user)
+        if new_user.role == "Admin":
+            return render_template("batch_files.html", user=new_user, staff_upload_form=UploadForm(prefix='staff'),
+                                   shift_upload_form=ShiftUploadForm(prefix='shifts'), logged_in=True)
+        else:
+            return redirect(url_for('staff.staff'))
+
+    return render_template("register.html", form=registration_form)
+
+
+# logout
+@bp.route('/logout')
+@login_required
+def logout():
+    """
+    Will log the user out and un-authenticate the user's session so access to the app's features is no longer allowed
+    until the user logs back in
+    """
+    logout_user()
+    return render_template("index.html")
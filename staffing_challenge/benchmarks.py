@@ -0,0 +1,1152 @@
+import click
+import datetime
+import gzip
+import io
+import itertools
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import numpy as np
+import sqlalchemy
+from sqlalchemy import func
+from werkzeug.security import generate_password_hash
+
+from analytics import count_shift_changes, counted_shifts, rebuild_analytics
+from app import create_app
+from archive import archive_shifts_before, move_shift_batch
+from cache import data_changed
+from forms import ROLE_CHOICES
+from models import db, User, Shift, ShiftArchive, ShiftEvent, ShiftTemplate, EmailOutbox, find_user_by_email, \
+    format_shift_time, record_shift_events
+from queries import encode_cursor, start_of_day
+from schedules import generate_shifts
+
+
+# the benchmarks run against their own database so they never touch db. Relative sqlite paths are resolved
+# from this folder
+DEFAULT_DATABASE_URL = 'sqlite:///benchmark.db'
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+# every generated account (admins, staff and the load driver's own accounts) logs in with this password
+BENCHMARK_PASSWORD = 'benchmark'
+# rows written per executemany while generating data
+INSERT_BATCH_SIZE = 20000
+# shift patterns used for generated shifts: (start hour, length in hours)
+SHIFT_PATTERNS = [(7, 8), (7, 12), (11, 8), (15, 8), (19, 12), (23, 8)]
+# a scenario whose p95 latency grows by more than this fraction over the baseline is reported as a regression
+DEFAULT_TOLERANCE = 0.25
+# the longest (p95) a new worker process may take to import and build the app and serve its first page
+COLD_START_BUDGET_SECONDS = 0.75
+# the longest (p50) posting a year of shifts for a whole hospital from its templates may take
+SCHEDULE_BUDGET_SECONDS = 1.0
+# the baseline's scenarios for the schedule command, posting the year and then generating it again, which the run
+# command keeps when it stores its own
+SCHEDULE_SCENARIOS = ['schedule_year_first', 'schedule_year_again']
+# how the app connected to SQLite before pooling, WAL and the read engine, for the mixed benchmark to compare against
+LEGACY_DATABASE_CONFIG = {'DATABASE_POOL_SIZE': 0, 'DATABASE_SPLIT_READS': False, 'SQLITE_JOURNAL_MODE': 'DELETE',
+                          'SQLITE_SYNCHRONOUS': 'FULL', 'SQLITE_MMAP_SIZE': 0}
+# modules that only some requests need, so starting the app and serving a page mustn't import them
+DEFERRED_MODULES = ['pandas', 'openpyxl', 'numpy', 'smtplib']
+# run in a fresh interpreter for each cold start measurement, with the database URL as its argument
+COLD_START_SCRIPT = '''
+import json, sys, time
+started_at = time.perf_counter()
+from app import create_app
+imported_at = time.perf_counter()
+app = create_app({'SQLALCHEMY_DATABASE_URI': sys.argv[1]})
+created_at = time.perf_counter()
+status = app.test_client().get('/login').status_code
+served_at = time.perf_counter()
+print(json.dumps({'import': imported_at - started_at, 'create_app': created_at - imported_at,
+                  'first_request': served_at - created_at, 'total': served_at - started_at, 'status': status,
+                  'modules': sorted(set(sys.modules) & set(sys.argv[2:]))}))
+'''
+
+
+def load_app(database_url, config=None):
+    """
+    Builds the app pointed at the benchmark database, with CSRF checks off so the test clients can post forms
+    directly, and makes it the current app
+    """
+    app = create_app(dict(config or {}, SQLALCHEMY_DATABASE_URI=database_url, WTF_CSRF_ENABLED=False))
+    app.app_context().push()
+    return app
+
+
+def insert_rows(table, columns, batch_size=INSERT_BATCH_SIZE):
+    """
+    Inserts rows given as a dict of equal length column lists with one executemany per batch
+    """
+    total = len(next(iter(columns.values())))
+    for batch_start in range(0, total, batch_size):
+        batch = {name: values[batch_start:batch_start + batch_size] for name, values in columns.items()}
+        db.session.execute(table.insert(), [dict(zip(batch, row)) for row in zip(*batch.values())])
+    db.session.commit()
+
+
+@click.group()
+def cli():
+    """
+    Synthetic data generator and load-test suite for the staffing app
+    """
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--hospitals', default=5, show_default=True)
+@click.option('--areas', default=8, show_default=True, help='Areas per hospital.')
+@click.option('--staff', 'staff_count', default=10000, show_default=True)
+@click.option('--shifts', 'shift_count', default=1000000, show_default=True)
+@click.option('--history-days', default=730, show_default=True, help='How far back the shift history goes.')
+@click.option('--future-days', default=60, show_default=True, help='How far ahead shifts have been posted.')
+@click.option('--seed', default=0, show_default=True)
+def generate(database_url, hospitals, areas, staff_count, shift_count, history_days, future_days, seed):
+    """
+    Replaces the benchmark database with synthetic hospitals, staff and shifts. Each hospital has an admin
+    (admin1@example.com, ...), staff are staff1@example.com onwards, and all of them use the benchmark password.
+    Past shifts are mostly approved, future ones are a mix of open, requested and approved
+    """
+    load_app(database_url)
+    started_at = time.perf_counter()
+    rng = np.random.default_rng(seed)
+    db.drop_all()
+    db.create_all()
+
+    locations = np.array([f"Hospital {number}" for number in range(1, hospitals + 1)])
+    staff_roles = np.array([role for role in ROLE_CHOICES if role != 'Admin'])
+    # ids are handed out in insert order, admins first
+    admin_ids = np.arange(1, hospitals + 1)
+    staff_ids = np.arange(hospitals + 1, hospitals + staff_count + 1)
+    staff_role = rng.choice(len(staff_roles), staff_count, p=[0.1, 0.2, 0.5, 0.2])
+    staff_location = rng.integers(0, hospitals, staff_count)
+
+    # shifts: a random day, hospital, area, pattern and role (in proportion to the staff in each role)
+    today = datetime.date.today()
+    day = np.sort(rng.integers(-history_days, future_days, shift_count))
+    location = rng.integers(0, hospitals, shift_count)
+    area = rng.integers(1, areas + 1, shift_count)
+    pattern = rng.integers(0, len(SHIFT_PATTERNS), shift_count)
+    role = rng.choice(staff_role, shift_count)
+    start_hour = np.array([start for start, _ in SHIFT_PATTERNS])[pattern]
+    length = np.array([hours for _, hours in SHIFT_PATTERNS])[pattern]
+    start_at = np.datetime64(today, 'h') + day * 24 + start_hour
+    end_at = start_at + length
+
+    # who picked each shift up: a random staff member with the shift's role
+    status = np.where(day < 0,
+                      rng.choice(['Approved', 'Posted'], shift_count, p=[0.9, 0.1]),
+                      rng.choice(['Approved', 'Requested', 'Posted'], shift_count, p=[0.15, 0.25, 0.6]))
+    picked_up_by = np.zeros(shift_count, dtype=np.int64)
+    for role_code in range(len(staff_roles)):
+        shifts_in_role = np.nonzero((role == role_code) & (status != 'Posted'))[0]
+        staff_in_role = staff_ids[staff_role == role_code]
+        if len(staff_in_role):
+            picked_up_by[shifts_in_role] = rng.choice(staff_in_role, len(shifts_in_role))
+        else:
+            status[shifts_in_role] = 'Posted'
+    picked_up_by[status == 'Posted'] = 0
+    shifts_worked = np.bincount(picked_up_by[status == 'Approved'], minlength=hospitals + staff_count + 1)
+
+    password = generate_password_hash(password=BENCHMARK_PASSWORD, method='pbkdf2:sha256', salt_length=8)
+    user_ids = np.concatenate([admin_ids, staff_ids])
+    names = [f"Admin {number}" for number in admin_ids] + [f"Staff Member {number:06d}" for number in staff_ids]
+    emails = [f"admin{number}@example.com" for number in admin_ids] + \
+        [f"staff{number - hospitals}@example.com" for number in staff_ids]
+    insert_rows(User.__table__, {
+        'id': user_ids.tolist(),
+        'name': names,
+        'role': ['Admin'] * hospitals + staff_roles[staff_role].tolist(),
+        'location': locations.tolist() + locations[staff_location].tolist(),
+        'email': emails,
+        'phone_num': ['555-0100'] * len(user_ids),
+        'availability': ['Yes'] * hospitals + rng.choice(['Yes', 'No'], staff_count, p=[0.8, 0.2]).tolist(),
+        'can_float': ['N/A'] * hospitals + rng.choice(['Yes', 'No'], staff_count).tolist(),
+        'password': [password] * len(user_ids),
+        'shifts_worked': shifts_worked[user_ids].tolist(),
+    })
+
+    time_labels = {hour: format_shift_time(datetime.time(hour % 24)) for hour in range(48)}
+    start_at = start_at.astype(datetime.datetime)
+    end_at = end_at.astype(datetime.datetime)
+    insert_rows(Shift.__table__, {
+        'location': locations[location].tolist(),
+        'role': staff_roles[role].tolist(),
+        'area': [f"Area {number}" for number in area.tolist()],
+        'date': [value.date() for value in start_at],
+        'start_time': [time_labels[hour] for hour in start_hour.tolist()],
+        'end_time': [time_labels[hour] for hour in (start_hour + length).tolist()],
+        'start_at': start_at.tolist(),
+        'end_at': end_at.tolist(),
+        'added_by_id': admin_ids[location].tolist(),
+        'added_by_name': [f"Admin {number}" for number in admin_ids[location].tolist()],
+        'picked_up_by_id': [staff_id or None for staff_id in picked_up_by.tolist()],
+        'comments': [None] * shift_count,
+        'status': status.tolist(),
+    })
+    rebuild_analytics()
+    click.echo(f"Generated {hospitals} hospitals, {staff_count} staff and {shift_count} shifts "
+               f"in {time.perf_counter() - started_at:.1f}s")
+
+
+def staff_upload_file(rows, prefix):
+    """
+    A staff roster CSV with the given number of new staff members
+    """
+    lines = [','.join(['name', 'role', 'location', 'email', 'phone_num', 'can_float'])]
+    lines += [f"Uploaded {prefix} {number},RN,Hospital 1,upload-{prefix}-{number}@example.com,555-0100,Yes"
+              for number in range(rows)]
+    return '\n'.join(lines).encode()
+
+
+def shift_upload_file(rows, hospitals):
+    """
+    A shift CSV with the given number of 7am-7pm RN shifts. Row i is always the same shift, so repeated uploads in
+    upsert mode update the shifts the first one posted
+    """
+    first_day = datetime.date.today() + datetime.timedelta(days=1)
+    lines = [','.join(['location', 'role', 'area', 'date', 'start_time', 'end_time'])]
+    for number in range(rows):
+        lines.append(','.join([
+            f"Hospital {number % hospitals + 1}", 'RN', f"Upload Area {number % 2000}",
+            (first_day + datetime.timedelta(days=number // 2000)).isoformat(), '7am', '7pm',
+        ]))
+    return '\n'.join(lines).encode()
+
+
+class Scenario:
+    """
+    One benchmarked request: who makes it (an email, or a list handed out to the threads in turn), how many times and
+    from how many threads, the statuses that count as success, and the endpoint whose SQL statement counts are
+    reported. prepare(iteration) builds each request's arguments and cleanup(arguments, response) undoes its writes,
+    and neither is timed
+    """
+
+    def __init__(self, name, send, account=None, endpoint=None, requests=None, concurrency=None, expect=(200,),
+                 prepare=None, cleanup=None):
+        self.name = name
+        self.send = send
+        self.account = account
+        self.endpoint = endpoint
+        self.requests = requests
+        self.concurrency = concurrency
+        self.expect = expect
+        self.prepare = prepare or (lambda iteration: iteration)
+        self.cleanup = cleanup
+
+
+def ensure_account(email, role, location='Hospital 1'):
+    """
+    Returns the id of the load driver's account with the given email, creating it (with no shifts) if needed
+    """
+    user = find_user_by_email(email)
+    if user is None:
+        user = User(name=email.split('@')[0], role=role, location=location, email=email,
+                             phone_num='555-0100', availability='Yes', can_float='Yes', shifts_worked=0,
+                             password=generate_password_hash(password=BENCHMARK_PASSWORD,
+                                                                      method='pbkdf2:sha256', salt_length=8))
+        db.session.add(user)
+        db.session.commit()
+    return user.id
+
+
+def logged_in_client(app, email):
+    client = app.test_client()
+    response = client.post('/login', data={'email': email, 'password': BENCHMARK_PASSWORD})
+    if response.status_code != 302:
+        raise click.ClickException(f"Could not log in as {email}, has the benchmark database been generated?")
+    return client
+
+
+def release_shift(app, shift_id):
+    """
+    Puts a shift claimed during a benchmark back on the board, so runs don't use up the open shifts
+    """
+    with app.app_context():
+        Shift.query.filter_by(shift_id=shift_id)\
+            .update({Shift.picked_up_by_id: None, Shift.status: 'Posted'}, synchronize_session=False)
+        record_shift_events('released', Shift.shift_id == shift_id)
+        data_changed()
+        db.session.commit()
+
+
+def runner_accounts(count):
+    """
+    The emails of the load driver's RN accounts, created if needed
+    """
+    emails = [f"bench-rn-{number}@example.com" for number in range(count)]
+    for email in emails:
+        ensure_account(email, 'RN')
+    return emails
+
+
+def release_runner_shifts(runner_emails):
+    """
+    Puts back any shifts the runners still hold, e.g. because removing one failed in an earlier run, so they start out
+    with no bookings that could clash with the shifts they claim
+    """
+    runner_ids = db.session.query(User.id).filter(User.email.in_(runner_emails))
+    held_ids = [row.shift_id for row in db.session.query(Shift.shift_id)
+                .filter(Shift.picked_up_by_id.in_(runner_ids.subquery()))]
+    Shift.query.filter(Shift.shift_id.in_(held_ids))\
+        .update({Shift.picked_up_by_id: None, Shift.status: 'Posted'}, synchronize_session=False)
+    record_shift_events('released', Shift.shift_id.in_(held_ids))
+    data_changed()
+    db.session.commit()
+
+
+def open_rn_shifts(limit=5000):
+    """
+    Ids of open RN shifts from two days out, for the benchmarks to claim (and give back)
+    """
+    return [row.shift_id for row in db.session.query(Shift.shift_id)
+            .filter(Shift.picked_up_by_id == None, Shift.status == 'Posted', Shift.role == 'RN',
+                    Shift.start_at >= start_of_day(datetime.date.today() + datetime.timedelta(days=2)))
+            .limit(limit)]
+
+
+def build_scenarios(app, concurrency):
+    """
+    The benchmark scenarios, covering every page of the app plus the uploads, a race for a single shift and the
+    auto-assignment engine
+    """
+    hospitals = User.query.filter_by(role='Admin').count()
+    runner_emails = runner_accounts(max(concurrency, 2))
+    admin = find_user_by_email('admin1@example.com')
+    if admin is None:
+        raise click.ClickException("The benchmark database is empty, run 'python benchmarks.py generate' first")
+    busiest_staff = [row.picked_up_by_id for row in db.session.query(Shift.picked_up_by_id)
+                     .filter(Shift.picked_up_by_id != None).limit(1000)]
+    second_page = encode_cursor(['Staff Member 000500', 0])
+    open_shifts = open_rn_shifts()
+    pending = [row.shift_id for row in db.session.query(Shift.shift_id)
+               .filter(Shift.added_by_id == admin.id, Shift.status == 'Requested').limit(1000)]
+    db.session.remove()
+    if not open_shifts:
+        raise click.ClickException('There are no open RN shifts left to benchmark claiming')
+    # each claim takes the next open shift, and cleanup puts it back
+    next_open_shift = itertools.cycle(open_shifts).__next__
+    run_token = f"{int(time.time())}"
+    shift_files = {rows: shift_upload_file(rows, hospitals) for rows in (1000, 10000, 100000)}
+
+    def upload(path, field, mode=None):
+        def send(client, arguments):
+            data = {f"{field}-file": (io.BytesIO(arguments), f"{field}.csv"), f"{field}-submit": 'Upload'}
+            if mode:
+                data[f"{field}-mode"] = mode
+            return client.post(path, data=data, content_type='multipart/form-data')
+        return send
+
+    def accept_shift(client, shift_id):
+        return client.post('/acceptshift', data={'id': shift_id})
+
+    def revalidate(path):
+        # a browser refreshing a page it already has, sending back the ETag it got the first time
+        etags = {}
+
+        def send(client, arguments):
+            if client not in etags:
+                etags[client] = client.get(path).headers.get('ETag')
+            return client.get(path, headers={'If-None-Match': etags[client]})
+        return send
+
+    scenarios = [
+        Scenario('staff', lambda client, i: client.get('/staff'), 'admin1@example.com', 'staff.staff'),
+        Scenario('staff_filtered_page_2',
+                 lambda client, i: client.get('/staff', query_string={'role': 'RN', 'location': 'Hospital 1',
+                                                                      'after': second_page}),
+                 'admin1@example.com', 'staff.staff'),
+        Scenario('staff_revalidate', revalidate('/staff'), 'admin1@example.com', 'staff.staff', expect=(304,)),
+        Scenario('shift_rn', lambda client, i: client.get('/shift'), runner_emails[0], 'shifts.shift'),
+        Scenario('shift_rn_revalidate', revalidate('/shift'), runner_emails[0], 'shifts.shift', expect=(304,)),
+        Scenario('shift_admin_filtered',
+                 lambda client, i: client.get('/shift', query_string={'role': 'RN', 'location': 'Hospital 2'}),
+                 'admin1@example.com', 'shifts.shift'),
+        Scenario('pending_requests', lambda client, i: client.get('/pendingrequests'), 'admin1@example.com',
+                 'shifts.pending_requests'),
+        Scenario('coverage', lambda client, i: client.get('/coverage'), 'admin1@example.com', 'analytics.coverage'),
+        Scenario('user_details',
+                 lambda client, i: client.get('/userdetails',
+                                              query_string={'id': busiest_staff[i % len(busiest_staff)]}),
+                 'admin1@example.com', 'staff.user_details'),
+        Scenario('accept_shift_get',
+                 lambda client, i: client.get('/acceptshift', query_string={'id': open_shifts[i % len(open_shifts)]}),
+                 runner_emails[0], 'shifts.accept_shift'),
+        # each thread claims as its own runner, so nobody is ever booked for an overlapping shift
+        Scenario('accept_shift_post', accept_shift, runner_emails, 'shifts.accept_shift', expect=(302,),
+                 prepare=lambda i: next_open_shift(),
+                 cleanup=lambda shift_id, response: release_shift(app, shift_id)),
+        Scenario('add_shift',
+                 lambda client, i: client.post('/addshift', data={
+                     'location': 'Hospital 1', 'role': 'RN', 'area': 'Benchmark Area',
+                     'date': (datetime.date.today() + datetime.timedelta(days=90)).isoformat(),
+                     'start_time': '7am', 'end_time': '7pm', 'comments': ''}),
+                 'admin1@example.com', 'shifts.add_shift', expect=(302,)),
+        Scenario('staff_upload_1k', upload('/upload', 'staff'), 'admin1@example.com', 'uploads.upload',
+                 requests=5, concurrency=1, prepare=lambda i: staff_upload_file(1000, f"{run_token}-{i}")),
+    ]
+    for rows, repeats in ((1000, 5), (10000, 3), (100000, 1)):
+        scenarios.append(Scenario(f"shift_upload_{rows // 1000}k", upload('/shift_upload', 'shifts', 'upsert'),
+                                  'admin1@example.com', 'uploads.shift_upload', requests=repeats, concurrency=1,
+                                  prepare=lambda i, rows=rows: shift_files[rows]))
+    if pending:
+        scenarios.append(Scenario('approve_request',
+                                  lambda client, shift_id: client.post('/approverequest', data={'id': shift_id}),
+                                  'admin1@example.com', 'shifts.approve_request', requests=min(len(pending), 50),
+                                  expect=(302,), prepare=lambda i: pending[i]))
+    scenarios.append(Scenario('assign_engine_5k_shifts_30k_staff', lambda client, i: assign_synthetic(i),
+                              requests=3, concurrency=1, expect=(None,)))
+    return scenarios, runner_emails, open_shifts
+
+
+def assign_synthetic(seed, shift_count=5000, staff_count=30000, hospitals=5):
+    """
+    Runs the auto-assignment engine on random shifts, staff and bookings over two weeks
+    """
+    from assignment import assign_shifts
+    rng = np.random.default_rng(seed)
+    roles = np.array(['CRNA', 'Medical Assistant', 'RN', 'Scrub Tech'])
+    start = rng.integers(0, 14 * 24, shift_count) * 60
+    staff_ids = np.arange(staff_count)
+    booked = rng.integers(0, 14 * 24, staff_count * 3) * 60
+    assign_shifts(
+        {'shift_id': np.arange(shift_count), 'role': rng.choice(roles, shift_count),
+         'location': rng.integers(0, hospitals, shift_count), 'start': start, 'end': start + 12 * 60},
+        {'staff_id': staff_ids, 'role': rng.choice(roles, staff_count),
+         'location': rng.integers(0, hospitals, staff_count),
+         'can_float': rng.random(staff_count) < 0.3, 'shifts_worked': rng.integers(0, 200, staff_count)},
+        {'staff_id': rng.choice(staff_ids, len(booked)), 'start': booked, 'end': booked + 8 * 60})
+
+
+def latency_summary(latencies):
+    """
+    The p50, p95 and p99 of a list of latencies in seconds, in milliseconds
+    """
+    milliseconds = 1000 * np.array(latencies or [0])
+    return {f"p{percentile}_ms": round(float(np.percentile(milliseconds, percentile)), 2)
+            for percentile in (50, 95, 99)}
+
+
+def run_scenario(app, scenario, requests, concurrency):
+    """
+    Makes the scenario's requests from its threads (each with its own logged in test client) and returns the latency
+    percentiles, throughput, failures and SQL statements per request
+    """
+    requests = scenario.requests or requests
+    concurrency = min(scenario.concurrency or concurrency, requests)
+    accounts = scenario.account if isinstance(scenario.account, list) else [scenario.account]
+    clients = [logged_in_client(app, accounts[thread % len(accounts)]) if scenario.account else None
+               for thread in range(concurrency)]
+    iterations = iter(range(requests))
+    lock = threading.Lock()
+    latencies, failures = [], []
+    route_metrics = app.extensions['route_metrics']
+    route_metrics.reset()
+
+    def worker(client):
+        while True:
+            with lock:
+                iteration = next(iterations, None)
+            if iteration is None:
+                return
+            arguments = scenario.prepare(iteration)
+            started_at = time.perf_counter()
+            response = scenario.send(client, arguments)
+            elapsed = time.perf_counter() - started_at
+            status = getattr(response, 'status_code', None)
+            if scenario.cleanup:
+                scenario.cleanup(arguments, response)
+            with lock:
+                latencies.append(elapsed)
+                if status not in scenario.expect:
+                    failures.append(status)
+
+    started_at = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(client,)) for client in clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started_at
+
+    route = route_metrics.snapshot().get(scenario.endpoint, {})
+    return dict(latency_summary(latencies), requests=requests, concurrency=concurrency, failures=len(failures),
+                throughput_per_second=round(requests / wall_seconds, 2),
+                sql_statements=round(route['avg_sql_statements'], 2) if route else None)
+
+
+def run_claim_race(app, runner_emails, open_shifts, races):
+    """
+    Has every runner account try to claim the same open shift at the same moment, races times over. Exactly one of
+    them should win each race, anything else is reported as a failure
+    """
+    clients = [logged_in_client(app, email) for email in runner_emails]
+    barrier = threading.Barrier(len(clients))
+    latencies, failures = [], 0
+    started_at = time.perf_counter()
+    for race in range(races):
+        shift_id = open_shifts[race % len(open_shifts)]
+        statuses = [None] * len(clients)
+
+        def contender(position):
+            barrier.wait()
+            request_started = time.perf_counter()
+            statuses[position] = clients[position].post('/acceptshift', data={'id': shift_id}).status_code
+            latencies.append(time.perf_counter() - request_started)
+
+        threads = [threading.Thread(target=contender, args=(position,)) for position in range(len(clients))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if statuses.count(302) != 1 or statuses.count(409) != len(clients) - 1:
+            failures += 1
+        release_shift(app, shift_id)
+    wall_seconds = time.perf_counter() - started_at
+
+    return dict(latency_summary(latencies), requests=len(latencies), concurrency=len(clients), failures=failures,
+                throughput_per_second=round(len(latencies) / wall_seconds, 2), sql_statements=None)
+
+
+def run_mixed_workload(app, runner_emails, open_shifts, turns, write_share, seed):
+    """
+    Has every runner (one thread each) browse the Shift List and Staff List, and for write_share of its turns accept
+    a shift and then remove it again, until they've taken turns turns between them. Each runner claims from its own slice of
+    open_shifts so they never compete for a shift. Returns throughput, read and write latency and the failed requests
+    (e.g. "database is locked" errors)
+    """
+    lock = threading.Lock()
+    taken = itertools.count()
+    reads, writes, failures = [], [], []
+
+    def timed(latencies, expected, send):
+        started_at = time.perf_counter()
+        status = send().status_code
+        elapsed = time.perf_counter() - started_at
+        with lock:
+            latencies.append(elapsed)
+            if status != expected:
+                failures.append(status)
+
+    def runner(position):
+        client = logged_in_client(app, runner_emails[position])
+        rng = np.random.default_rng(seed + position)
+        my_shifts = itertools.cycle(open_shifts[position::len(runner_emails)])
+        while next(taken) < turns:
+            if rng.random() < write_share:
+                shift_id = next(my_shifts)
+                timed(writes, 302, lambda: client.post('/acceptshift', data={'id': shift_id}))
+                timed(writes, 302, lambda: client.post('/removeshift', data={'id': shift_id}))
+            else:
+                timed(reads, 200, lambda: client.get('/shift' if rng.random() < 0.5 else '/staff'))
+
+    threads = [threading.Thread(target=runner, args=(position,)) for position in range(len(runner_emails))]
+    started_at = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall_seconds = time.perf_counter() - started_at
+    made = len(reads) + len(writes)
+    return {'requests': made, 'throughput_per_second': round(made / wall_seconds, 2), 'reads': latency_summary(reads),
+            'writes': latency_summary(writes), 'failures': len(failures)}
+
+
+def run_polling(app, mode, runner_emails, open_shifts, polls, write_interval):
+    """
+    Has every runner but the last poll for the RN Shift List polls times, the way the mobile app does during a shift
+    drop, while the last runner keeps accepting and removing shifts (one every write_interval seconds) so there are
+    changes to pick up. mode is "page" (the Shift List page), "api" (the /api/v1/shifts JSON, gzipped) or "changes"
+    (the /api/v1/shifts/changes feed, gzipped, following its cursor). Returns latency, throughput and the bytes sent
+    per poll
+    """
+    lock = threading.Lock()
+    latencies, sizes, failures = [], [], []
+    polling = threading.Event()
+    polling.set()
+    gzip_headers = {'Accept-Encoding': 'gzip'}
+
+    def poller(email):
+        client = logged_in_client(app, email)
+        cursor = client.get('/api/v1/shifts').get_json()['changes'] if mode == 'changes' else None
+        for _ in range(polls):
+            started_at = time.perf_counter()
+            if mode == 'page':
+                response = client.get('/shift')
+            elif mode == 'api':
+                response = client.get('/api/v1/shifts', headers=gzip_headers)
+            else:
+                response = client.get('/api/v1/shifts/changes', query_string={'since': cursor}, headers=gzip_headers)
+            elapsed = time.perf_counter() - started_at
+            if mode == 'changes' and response.status_code == 200:
+                body = gzip.decompress(response.data) if response.content_encoding == 'gzip' else response.data
+                cursor = json.loads(body)['cursor']
+            with lock:
+                latencies.append(elapsed)
+                sizes.append(len(response.data))
+                if response.status_code != 200:
+                    failures.append(response.status_code)
+
+    def writer():
+        client = logged_in_client(app, runner_emails[-1])
+        for shift_id in itertools.cycle(open_shifts):
+            if not polling.is_set():
+                return
+            client.post('/acceptshift', data={'id': shift_id})
+            client.post('/removeshift', data={'id': shift_id})
+            time.sleep(write_interval)
+
+    pollers = [threading.Thread(target=poller, args=(email,)) for email in runner_emails[:-1]]
+    write_thread = threading.Thread(target=writer)
+    write_thread.start()
+    started_at = time.perf_counter()
+    for thread in pollers:
+        thread.start()
+    for thread in pollers:
+        thread.join()
+    wall_seconds = time.perf_counter() - started_at
+    polling.clear()
+    write_thread.join()
+    return dict(latency_summary(latencies), polls=len(latencies), failures=len(failures),
+                throughput_per_second=round(len(latencies) / wall_seconds, 2),
+                bytes_per_poll=round(float(np.mean(sizes))), total_bytes=int(np.sum(sizes)))
+
+
+def run_fanout(app, runner_emails, open_shifts, streams, changes, write_interval):
+    """
+    Opens streams Shift List event streams for RN shifts (shared between the runner accounts, since each stream only
+    needs a login cookie) while the last runner accepts and removes changes shifts, one every write_interval seconds.
+    Every stream should get a "claimed" and a "posted" event for each. Returns how long events took to arrive (from
+    just before the change was posted), how many arrived out of how many were expected and how many streams got
+    through connecting
+    """
+    lock = threading.Lock()
+    changed_at, received, connected = {}, [], []
+    clients = [logged_in_client(app, email) for email in runner_emails[:-1]]
+
+    def listener(client):
+        response = client.get('/shifts/events', buffered=False)
+        with lock:
+            connected.append(response.status_code == 200)
+        for chunk in response.response:
+            lines = dict(line.split(': ', 1) for line in chunk.decode().splitlines()
+                         if line.startswith(('event:', 'data:')))
+            if lines.get('event') in ('claimed', 'posted'):
+                with lock:
+                    received.append((lines['event'], json.loads(lines['data'])['shift_id'], time.perf_counter()))
+
+    listeners = [threading.Thread(target=listener, args=(clients[number % len(clients)],), daemon=True)
+                 for number in range(streams)]
+    for thread in listeners:
+        thread.start()
+    while len(connected) < streams:
+        time.sleep(0.05)
+    # give the watcher a poll to note where the changes start from
+    time.sleep(2 * app.config['SSE_POLL_SECONDS'])
+
+    writer = logged_in_client(app, runner_emails[-1])
+    for shift_id in open_shifts[:changes]:
+        changed_at['claimed', shift_id] = time.perf_counter()
+        writer.post('/acceptshift', data={'id': shift_id})
+        time.sleep(write_interval)
+        changed_at['posted', shift_id] = time.perf_counter()
+        writer.post('/removeshift', data={'id': shift_id})
+        time.sleep(write_interval)
+    time.sleep(2 * app.config['SSE_POLL_SECONDS'] + 0.5)
+    app.extensions['shift_events'].disconnect_all()
+    for thread in listeners:
+        thread.join(timeout=5)
+
+    latencies = [received_at - changed_at[event_type, shift_id] for event_type, shift_id, received_at in received
+                 if (event_type, shift_id) in changed_at]
+    return dict(latency_summary(latencies), streams=sum(connected), delivered=len(latencies),
+                expected=streams * 2 * min(changes, len(open_shifts)))
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    Lists the scenarios that got slower than the baseline allows, started running more SQL statements per request,
+    or started failing
+    """
+    regressions = []
+    for name, result in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if result['p95_ms'] > before['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {result['p95_ms']}ms, baseline {before['p95_ms']}ms")
+        if None not in (result['sql_statements'], before['sql_statements']) and \
+                result['sql_statements'] > before['sql_statements']:
+            regressions.append(f"{name}: {result['sql_statements']} SQL statements per request, "
+                               f"baseline {before['sql_statements']}")
+        if result['failures'] > before['failures']:
+            regressions.append(f"{name}: {result['failures']} failed requests, baseline {before['failures']}")
+    return regressions
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--requests', default=200, show_default=True, help='Requests per scenario (uploads make fewer).')
+@click.option('--concurrency', default=8, show_default=True, help='Threads making requests at once.')
+@click.option('--races', default=20, show_default=True, help='Times every runner races for the same shift.')
+@click.option('--only', multiple=True, help='Only run the named scenarios.')
+@click.option('--baseline', 'baseline_path', default=BASELINE_PATH, show_default=True)
+@click.option('--save-baseline', is_flag=True, help='Store these results as the new baseline.')
+@click.option('--tolerance', default=DEFAULT_TOLERANCE, show_default=True,
+              help='Allowed p95 slowdown over the baseline, as a fraction.')
+def run(database_url, requests, concurrency, races, only, baseline_path, save_baseline, tolerance):
+    """
+    Drives every route through Flask test clients from concurrent threads and reports p50/p95/p99 latency, throughput
+    and SQL statements per request, then compares them with the stored baseline. Exits with status 1 on a regression
+    """
+    app = load_app(database_url)
+    scenarios, runner_emails, open_shifts = build_scenarios(app, concurrency)
+    results = {}
+    click.echo(f"{'scenario':<36}{'requests':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}"
+               f"{'sql':>7}{'failed':>8}")
+    for scenario in scenarios + [None]:
+        name = scenario.name if scenario else 'accept_shift_race'
+        if only and name not in only:
+            continue
+        if scenario:
+            result = run_scenario(app, scenario, requests, concurrency)
+        else:
+            result = run_claim_race(app, runner_emails, open_shifts, races)
+        results[name] = result
+        click.echo(f"{name:<36}{result['requests']:>9}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                   f"{result['p99_ms']:>10}{result['throughput_per_second']:>10}"
+                   f"{'-' if result['sql_statements'] is None else result['sql_statements']:>7}"
+                   f"{result['failures']:>8}")
+
+    if save_baseline:
+        scenarios = dict(results)
+        if os.path.exists(baseline_path):
+            with open(baseline_path) as baseline_file:
+                stored = json.load(baseline_file).get('scenarios', {})
+            scenarios.update({name: stored[name] for name in SCHEDULE_SCENARIOS if name in stored})
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump({'python': platform.python_version(), 'machine': platform.machine(),
+                       'recorded': datetime.date.today().isoformat(), 'requests': requests,
+                       'concurrency': concurrency, 'scenarios': scenarios}, baseline_file, indent=2, sort_keys=True)
+        click.echo(f"Saved baseline to {baseline_path}")
+        return
+    if not os.path.exists(baseline_path):
+        click.echo('No baseline to compare with, run with --save-baseline to store one')
+        return
+    with open(baseline_path) as baseline_file:
+        baseline = json.load(baseline_file)['scenarios']
+    regressions = compare_to_baseline(results, baseline, tolerance)
+    for regression in regressions:
+        click.echo(f"REGRESSION {regression}", err=True)
+    if regressions:
+        raise SystemExit(1)
+    click.echo('No regressions against the baseline')
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--turns', default=2000, show_default=True, help='Turns between all runners (writes are two requests).')
+@click.option('--concurrency', default=16, show_default=True, help='Runners browsing and accepting at once.')
+@click.option('--write-share', default=0.2, show_default=True, help='Share of turns that accept and remove a shift.')
+@click.option('--seed', default=0, show_default=True)
+def mixed(database_url, turns, concurrency, write_share, seed):
+    """
+    Runs the same mix of browsing and accepting shifts with the old database settings (a new connection per request,
+    a rollback journal with full syncs, no memory mapping and no read engine) and then with the current settings, and
+    compares their throughput, latency and failures
+    """
+    click.echo(f"{'settings':<10}{'requests':>9}{'req/s':>9}{'read p50':>10}{'read p95':>10}{'read p99':>10}"
+               f"{'write p50':>11}{'write p95':>11}{'write p99':>11}{'failed':>8}")
+    for name, config in [('legacy', LEGACY_DATABASE_CONFIG), ('current', {})]:
+        app = load_app(database_url, config)
+        runner_emails = runner_accounts(concurrency)
+        release_runner_shifts(runner_emails)
+        open_shifts = open_rn_shifts()
+        db.session.remove()
+        result = run_mixed_workload(app, runner_emails, open_shifts, turns, write_share, seed)
+        for bind in (None, 'read'):
+            db.get_engine(app, bind=bind).dispose()
+        reads, writes = result['reads'], result['writes']
+        click.echo(f"{name:<10}{result['requests']:>9}{result['throughput_per_second']:>9}{reads['p50_ms']:>10}"
+                   f"{reads['p95_ms']:>10}{reads['p99_ms']:>10}{writes['p50_ms']:>11}{writes['p95_ms']:>11}"
+                   f"{writes['p99_ms']:>11}{result['failures']:>8}")
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--clients', default=16, show_default=True, help='Phones polling at once.')
+@click.option('--polls', default=100, show_default=True, help='Polls made by each phone.')
+@click.option('--write-interval', default=0.05, show_default=True, help='Seconds between shifts changing.')
+def poll(database_url, clients, polls, write_interval):
+    """
+    Compares polling the Shift List page with polling the JSON API's shift list and its change feed while shifts keep
+    being accepted and removed: latency, throughput and bytes sent per poll
+    """
+    app = load_app(database_url)
+    runner_emails = runner_accounts(clients + 1)
+    release_runner_shifts(runner_emails)
+    open_shifts = open_rn_shifts()
+    db.session.remove()
+    click.echo(f"{'polling':<10}{'polls':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'bytes/poll':>12}"
+               f"{'total MB':>10}{'failed':>8}")
+    for mode in ['page', 'api', 'changes']:
+        result = run_polling(app, mode, runner_emails, open_shifts, polls, write_interval)
+        click.echo(f"{mode:<10}{result['polls']:>7}{result['throughput_per_second']:>9}{result['p50_ms']:>9}"
+                   f"{result['p95_ms']:>9}{result['p99_ms']:>9}{result['bytes_per_poll']:>12}"
+                   f"{result['total_bytes'] / 1e6:>10.2f}{result['failures']:>8}")
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--streams', default=200, show_default=True, help='Shift Lists open at once.')
+@click.option('--changes', default=20, show_default=True, help='Shifts accepted and then removed.')
+@click.option('--write-interval', default=0.05, show_default=True, help='Seconds between shifts changing.')
+@click.option('--poll-seconds', default=0.25, show_default=True, help='SSE_POLL_SECONDS for the run.')
+def fanout(database_url, streams, changes, write_interval, poll_seconds):
+    """
+    Pushes shift changes to many open Shift List event streams at once: how long each change takes to reach every
+    stream, and whether any were dropped
+    """
+    app = load_app(database_url, {'SSE_POLL_SECONDS': poll_seconds, 'SSE_QUEUE_SIZE': 4 * changes})
+    runner_emails = runner_accounts(min(streams, 16) + 1)
+    release_runner_shifts(runner_emails)
+    open_shifts = open_rn_shifts(changes)
+    db.session.remove()
+    result = run_fanout(app, runner_emails, open_shifts, streams, changes, write_interval)
+    click.echo(f"{'streams':>8}{'delivered':>11}{'expected':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    click.echo(f"{result['streams']:>8}{result['delivered']:>11}{result['expected']:>10}{result['p50_ms']:>9}"
+               f"{result['p95_ms']:>9}{result['p99_ms']:>9}")
+
+
+def restore_archived_shifts(batch_size):
+    """
+    Moves every archived shift back into the shift table, so the history benchmark leaves the database as it found it
+    """
+    while move_shift_batch(ShiftArchive.__table__, Shift.__table__, sqlalchemy.true(), batch_size) == batch_size:
+        pass
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--requests', default=200, show_default=True, help='Requests per page at each step.')
+@click.option('--concurrency', default=4, show_default=True, help='Threads making requests at once.')
+@click.option('--horizons', default='365,180,90,30', show_default=True,
+              help='Archive horizons to step through, in days.')
+@click.option('--batch-size', default=5000, show_default=True, help='Shifts moved per transaction.')
+@click.option('--keep-archived', is_flag=True, help='Leave the shifts archived instead of putting them back.')
+def history(database_url, requests, concurrency, horizons, batch_size, keep_archived):
+    """
+    Measures the Shift List and user details (with the cache off, so every request queries) with all the generated
+    history in the shift table, then again after archiving everything older than each horizon in turn: how long each
+    archive run takes and whether the pages depend on how much history the shift table holds. Puts the archived shifts
+    back afterwards
+    """
+    app = load_app(database_url, {'CACHE_TTL_SECONDS': 0})
+    runner_email = runner_accounts(1)[0]
+    release_runner_shifts([runner_email])
+    # staff members with shifts from the start of the history up to now
+    history_staff = [row.picked_up_by_id for row in db.session.query(Shift.picked_up_by_id)
+                     .filter(Shift.picked_up_by_id != None).order_by(Shift.start_at).limit(200)]
+    db.session.remove()
+    scenarios = [
+        Scenario('shift_rn', lambda client, i: client.get('/shift'), runner_email, 'shifts.shift'),
+        Scenario('user_details',
+                 lambda client, i: client.get('/userdetails',
+                                              query_string={'id': history_staff[i % len(history_staff)]}),
+                 'admin1@example.com', 'staff.user_details'),
+    ]
+    click.echo(f"{'archived before':<17}{'live shifts':>12}{'archived':>10}{'archive s':>11}"
+               f"{'shift p50':>11}{'shift p95':>11}{'details p50':>13}{'details p95':>13}")
+    try:
+        for horizon in [None] + [int(days) for days in horizons.split(',')]:
+            archive_seconds = 0.0
+            if horizon is not None:
+                started_at = time.perf_counter()
+                archive_shifts_before(start_of_day(datetime.date.today() - datetime.timedelta(days=horizon)),
+                                      batch_size)
+                archive_seconds = time.perf_counter() - started_at
+            live, archived = Shift.query.count(), ShiftArchive.query.count()
+            db.session.remove()
+            board, details = [run_scenario(app, scenario, requests, concurrency) for scenario in scenarios]
+            click.echo(f"{f'{horizon} days' if horizon else 'nothing':<17}{live:>12}{archived:>10}"
+                       f"{archive_seconds:>11.1f}{board['p50_ms']:>11}{board['p95_ms']:>11}"
+                       f"{details['p50_ms']:>13}{details['p95_ms']:>13}")
+    finally:
+        if not keep_archived:
+            restore_archived_shifts(batch_size)
+        db.session.remove()
+
+
+def run_export(client, path, query_string=None):
+    """
+    Downloads an export, reading it a chunk at a time the way a browser does, and returns how long the first byte and
+    the whole file took, its size and how much this process's peak memory grew while it was made
+    """
+    peak_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started_at = time.perf_counter()
+    response = client.get(path, query_string=query_string, buffered=False)
+    first_byte_seconds, size = None, 0
+    for chunk in response.response:
+        if first_byte_seconds is None and chunk:
+            first_byte_seconds = time.perf_counter() - started_at
+        size += len(chunk)
+    response.close()
+    return {'status': response.status_code, 'first_byte_ms': round(1000 * (first_byte_seconds or 0), 1),
+            'seconds': round(time.perf_counter() - started_at, 2), 'megabytes': round(size / 1e6, 1),
+            'peak_growth_mb': round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - peak_before) / 1024, 1)}
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--formats', default='csv,xlsx', show_default=True, help='Export formats to time.')
+def export(database_url, formats):
+    """
+    Times the staff, user history and date range exports (the whole generated history, a million or so shifts) in
+    each format: time to the first byte, total time, size and how much the process's peak memory grew. The CSVs go
+    first, so the peak they leave behind doesn't hide the Excel exports' growth
+    """
+    # with the database memory-mapped, every page the export reads would count towards the process's memory
+    app = load_app(database_url, {'SQLITE_MMAP_SIZE': 0})
+    client = logged_in_client(app, 'admin1@example.com')
+    busiest_staff = db.session.query(Shift.picked_up_by_id).filter(Shift.picked_up_by_id != None)\
+        .group_by(Shift.picked_up_by_id).order_by(func.count().desc()).limit(1).scalar()
+    first_day, last_day = db.session.query(func.min(Shift.date), func.max(Shift.date)).one()
+    db.session.remove()
+    exports = [('staff', '/export/staff.{}', None),
+               ('user_history', f"/export/users/{busiest_staff}/shifts.{{}}", None),
+               ('all_shifts', '/export/shifts.{}', {'start_date': first_day.isoformat(),
+                                                    'end_date': last_day.isoformat()})]
+    click.echo(f"{'export':<24}{'status':>7}{'first byte ms':>15}{'seconds':>9}{'MB':>8}{'peak growth MB':>16}")
+    for file_format in formats.split(','):
+        for name, path, query_string in exports:
+            result = run_export(client, path.format(file_format), query_string)
+            click.echo(f"{f'{name}.{file_format}':<24}{result['status']:>7}{result['first_byte_ms']:>15}"
+                       f"{result['seconds']:>9}{result['megabytes']:>8}{result['peak_growth_mb']:>16}")
+
+
+def scan_coverage(first_day, last_day):
+    """
+    The Coverage dashboard's weekly fill rates worked out from the shift table itself, the way a report had to be
+    before the summary tables
+    """
+    shift_week = func.date(Shift.date, 'weekday 0', '-6 days')
+    return db.session.query(shift_week, func.count(),
+                            func.sum(sqlalchemy.case([(Shift.status == 'Approved', 1)], else_=0)))\
+        .filter(Shift.date.between(first_day, last_day)).group_by(shift_week).all()
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--requests', default=50, show_default=True, help='Dashboard loads and table scans timed.')
+def coverage(database_url, requests):
+    """
+    Times rebuilding the coverage summary tables from the whole generated history, then the Coverage dashboard (with
+    the cache off) over the last month and over all of it, against the same weekly fill rates worked out by scanning
+    the shift table
+    """
+    app = load_app(database_url, {'CACHE_TTL_SECONDS': 0})
+    started_at = time.perf_counter()
+    coverage_rows, pickup_rows = rebuild_analytics()
+    click.echo(f"Rebuilt {coverage_rows} coverage rows and {pickup_rows} pickup rows from "
+               f"{Shift.query.count() + ShiftArchive.query.count()} shifts in {time.perf_counter() - started_at:.1f}s")
+    first_day, last_day = db.session.query(func.min(Shift.date), func.max(Shift.date)).one()
+    db.session.remove()
+    month = {'start_date': (last_day - datetime.timedelta(days=30)).isoformat(), 'end_date': last_day.isoformat()}
+    everything = {'start_date': first_day.isoformat(), 'end_date': last_day.isoformat()}
+    scenarios = [
+        Scenario('dashboard_month', lambda client, i: client.get('/coverage', query_string=month),
+                 'admin1@example.com', 'analytics.coverage'),
+        Scenario('dashboard_all_weeks', lambda client, i: client.get('/coverage', query_string=everything),
+                 'admin1@example.com', 'analytics.coverage'),
+        Scenario('dashboard_all_by_area', lambda client, i: client.get('/coverage', query_string=dict(
+            everything, by='area', location='Hospital 1')), 'admin1@example.com', 'analytics.coverage'),
+    ]
+    click.echo(f"{'report':<24}{'p50 ms':>10}{'p95 ms':>10}{'sql':>6}")
+    for scenario in scenarios:
+        result = run_scenario(app, scenario, requests, 1)
+        click.echo(f"{scenario.name:<24}{result['p50_ms']:>10}{result['p95_ms']:>10}{result['sql_statements']:>6}")
+    for name, (start_date, end_date) in [('scan_month', (last_day - datetime.timedelta(days=30), last_day)),
+                                         ('scan_all_weeks', (first_day, last_day))]:
+        latencies = []
+        for _ in range(min(requests, 5)):
+            started_at = time.perf_counter()
+            scan_coverage(start_date, end_date)
+            latencies.append(time.perf_counter() - started_at)
+        db.session.remove()
+        result = latency_summary(latencies)
+        click.echo(f"{name:<24}{result['p50_ms']:>10}{result['p95_ms']:>10}{1:>6}")
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--rows', default=10000, show_default=True, help='New staff members in the roster.')
+@click.option('--hash-sample', default=50, show_default=True,
+              help='Passwords hashed to time hashing one per staff member.')
+def provision(database_url, rows, hash_sample):
+    """
+    Times provisioning a roster of new staff with flask provision-staff, which sends each of them an invite, against
+    hashing a password for each of them the way Add User used to (timed on a sample and scaled up to the roster). The
+    staff and invite emails it adds are deleted afterwards
+    """
+    app = load_app(database_url)
+    started_at = time.perf_counter()
+    for number in range(hash_sample):
+        generate_password_hash(password=f"password{number}", method='pbkdf2:sha256', salt_length=8)
+    hash_seconds = (time.perf_counter() - started_at) / hash_sample * rows
+
+    prefix = f"provision-{int(time.time())}"
+    with tempfile.NamedTemporaryFile(suffix='.csv', delete=False) as roster:
+        roster.write(staff_upload_file(rows, prefix))
+    try:
+        started_at = time.perf_counter()
+        result = app.test_cli_runner().invoke(args=['provision-staff', roster.name])
+        invite_seconds = time.perf_counter() - started_at
+        if result.exit_code:
+            raise click.ClickException(result.output or str(result.exception))
+        click.echo(result.output.strip())
+    finally:
+        os.remove(roster.name)
+        EmailOutbox.query.filter(EmailOutbox.to_addrs.like(f"upload-{prefix}-%")).delete(synchronize_session=False)
+        User.query.filter(User.email.like(f"upload-{prefix}-%")).delete(synchronize_session=False)
+        data_changed()
+        db.session.commit()
+
+    click.echo(f"{'provisioning':<28}{'seconds':>10}{'staff/sec':>11}")
+    for name, seconds in [('hash a password each', hash_seconds), ('invites (provision-staff)', invite_seconds)]:
+        click.echo(f"{name:<28}{seconds:>10.2f}{rows / seconds:>11.0f}")
+
+
+def remove_generated_shifts(template_ids):
+    """
+    Deletes the shifts (and their events and coverage counts) that the given shift templates posted
+    """
+    generated = Shift.template_id.in_(template_ids)
+    count_shift_changes(counted_shifts(generated), posted=-1)
+    ShiftEvent.query.filter(ShiftEvent.shift_id.in_(db.session.query(Shift.shift_id).filter(generated)))\
+        .delete(synchronize_session=False)
+    Shift.query.filter(generated).delete(synchronize_session=False)
+    data_changed()
+    db.session.commit()
+
+
+@cli.command()
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--areas', default=8, show_default=True, help='Areas in the hospital, each with a template per role.')
+@click.option('--days', default=365, show_default=True, help='How far ahead to post the shifts.')
+@click.option('--runs', default=5, show_default=True, help='Times the year is generated (and generated again).')
+@click.option('--budget', default=SCHEDULE_BUDGET_SECONDS, show_default=True,
+              help='Allowed p50 for posting the year, in seconds.')
+@click.option('--baseline', 'baseline_path', default=BASELINE_PATH, show_default=True)
+@click.option('--save-baseline', is_flag=True, help='Store these results in the baseline alongside the routes.')
+@click.option('--tolerance', default=DEFAULT_TOLERANCE, show_default=True,
+              help='Allowed p95 slowdown over the baseline, as a fraction.')
+def schedule(database_url, areas, days, runs, budget, baseline_path, save_baseline, tolerance):
+    """
+    Times posting a year of shifts for a whole hospital from its shift templates (weekday days, weekend days and
+    nights for every area and role) with generate_shifts, then generating the same year again, which should post
+    nothing, runs times over. The templates and the shifts they posted are deleted afterwards. Exits with status 1 if
+    posting the year takes longer than the budget or either step regressed against the baseline
+    """
+    load_app(database_url)
+    roles = [role for role in ROLE_CHOICES if role != 'Admin']
+    admin = find_user_by_email('admin1@example.com')
+    if admin is None:
+        raise click.ClickException("The benchmark database is empty, run 'python benchmarks.py generate' first")
+    first_day = datetime.date.today()
+    templates = [ShiftTemplate(location='Hospital 1', area=f"Area {area}", role=role, days_of_week=days_of_week,
+                               start_time=start_time, end_time=end_time, start_date=first_day,
+                               added_by_id=admin.id, added_by_name=admin.name)
+                 for area in range(1, areas + 1) for role in roles
+                 for days_of_week, start_time, end_time in [('0,1,2,3,4', '7am', '7pm'), ('5,6', '7am', '7pm'),
+                                                            ('0,1,2,3,4,5,6', '7pm', '7am')]]
+    db.session.add_all(templates)
+    db.session.commit()
+    template_ids = [template.id for template in templates]
+    latencies = {name: [] for name in SCHEDULE_SCENARIOS}
+    try:
+        click.echo(f"{'run':<24}{'posted':>9}{'skipped':>9}{'seconds':>9}")
+        for _ in range(runs):
+            for name in latencies:
+                started_at = time.perf_counter()
+                posted, skipped = generate_shifts(first_day, first_day + datetime.timedelta(days=days), 'Hospital 1')
+                data_changed()
+                db.session.commit()
+                latencies[name].append(time.perf_counter() - started_at)
+                click.echo(f"{name:<24}{posted:>9}{skipped:>9}{latencies[name][-1]:>9.2f}")
+            remove_generated_shifts(template_ids)
+    finally:
+        remove_generated_shifts(template_ids)
+        ShiftTemplate.query.filter(ShiftTemplate.id.in_(template_ids)).delete(synchronize_session=False)
+        db.session.commit()
+
+    results = {name: dict(latency_summary(times), requests=runs, concurrency=1, failures=0, sql_statements=None,
+                          throughput_per_second=round(runs / sum(times), 2))
+               for name, times in latencies.items()}
+    click.echo(f"{'step':<24}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, result in results.items():
+        click.echo(f"{name:<24}{result['p50_ms']:>10}{result['p95_ms']:>10}")
+    baseline = {}
+    if os.path.exists(baseline_path):
+        with open(baseline_path) as baseline_file:
+            baseline = json.load(baseline_file)
+    if save_baseline:
+        baseline.setdefault('scenarios', {}).update(results)
+        with open(baseline_path, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2, sort_keys=True)
+        click.echo(f"Saved baseline to {baseline_path}")
+    problems = compare_to_baseline(results, baseline.get('scenarios', {}), tolerance) if not save_baseline else []
+    first_p50 = results[SCHEDULE_SCENARIOS[0]]['p50_ms'] / 1000
+    if first_p50 > budget:
+        problems.append(f"posting the year takes {first_p50:.3f}s (p50), the budget is {budget:.3f}s")
+    for problem in problems:
+        click.echo(f"REGRESSION {problem}", err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo('Schedule generation is within budget')
+
+
+@cli.command('cold-start')
+@click.option('--database-url', default=DEFAULT_DATABASE_URL, show_default=True)
+@click.option('--runs', default=10, show_default=True, help='Fresh processes to start.')
+@click.option('--budget', default=COLD_START_BUDGET_SECONDS, show_default=True, help='Allowed p95, in seconds.')
+def cold_start(database_url, runs, budget):
+    """
+    Starts the app in fresh Python processes, the way a new gunicorn or App Engine instance does, timing the import,
+    create_app and the first page served. Exits with status 1 if the p95 is over the budget, or if starting up
+    imported any of the modules that are meant to wait until a request needs them
+    """
+    folder = os.path.dirname(os.path.abspath(__file__))
+    timings, loaded = [], set()
+    for _ in range(runs):
+        finished = subprocess.run([sys.executable, '-c', COLD_START_SCRIPT, database_url] + DEFERRED_MODULES,
+                                  cwd=folder, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                                  universal_newlines=True, check=True)
+        timing = json.loads(finished.stdout.strip().splitlines()[-1])
+        if timing['status'] != 200:
+            raise click.ClickException(f"The first page came back with status {timing['status']}")
+        timings.append(timing)
+        loaded.update(timing['modules'])
+
+    click.echo(f"{'step':<16}{'p50 ms':>10}{'p95 ms':>10}")
+    for step in ['import', 'create_app', 'first_request', 'total']:
+        milliseconds = 1000 * np.array([timing[step] for timing in timings])
+        click.echo(f"{step:<16}{np.percentile(milliseconds, 50):>10.1f}{np.percentile(milliseconds, 95):>10.1f}")
+    total_p95 = float(np.percentile([timing['total'] for timing in timings], 95))
+    problems = []
+    if total_p95 > budget:
+        problems.append(f"cold start p95 is {total_p95:.3f}s, the budget is {budget:.3f}s")
+    if loaded:
+        problems.append(f"starting the app imported {', '.join(sorted(loaded))}")
+    for problem in problems:
+        click.echo(f"REGRESSION {problem}", err=True)
+    if problems:
+        raise SystemExit(1)
+    click.echo('Cold start is within budget')
+
+
+if __name__ == '__main__':
+    cli()
@@ -0,0 +1,171 @@
+from flask import current_app, g, render_template, request, session
+from flask_login import current_user
+from markupsafe import Markup
+
+import datetime
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from models import db, DataVersion
+
+
+class VersionedCache:
+    """
+    An in-memory cache of query results and rendered table bodies with a time to live and least-recently-used eviction,
+    shared by every thread serving requests. Each entry remembers the data version (see DataVersion) it was loaded
+    under and is only used while that's still the current version, so one committed change makes everything loaded
+    before it stale without walking the cache, in every worker. Stale and expired entries count as misses and are
+    reloaded, and the least recently used entries are dropped once there are max_entries
+    """
+
+    def __init__(self, max_entries, ttl_seconds, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, version, load):
+        """
+        Returns the value cached for key under version, or calls load() to get it and caches that
+        """
+        if self.ttl_seconds <= 0 or self.max_entries <= 0:
+            return load()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version and entry[1] > self.clock():
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+
+        value = load()
+        with self.lock:
+            self.entries[key] = (version, self.clock() + self.ttl_seconds, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def stats(self):
+        """
+        Hit, miss and eviction counts so far, along with the current size
+        """
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {'entries': len(self.entries), 'max_entries': self.max_entries, 'ttl_seconds': self.ttl_seconds,
+                    'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'hit_rate': self.hits / lookups if lookups else 0.0}
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+
+def current_data_version():
+    """
+    The DataVersion row as of the start of this request (read once per request), or None if the database doesn't have
+    one yet, in which case nothing is cached
+    """
+    if 'data_version' not in g:
+        g.data_version = db.session.query(DataVersion.version, DataVersion.changed_at).first()
+    return g.data_version
+
+
+def cached(key, load):
+    """
+    The value of load() from the app's cache, kept until the data version moves on (see VersionedCache.get)
+    """
+    version = current_data_version()
+    if version is None:
+        return load()
+    return current_app.extensions['data_cache'].get(key, version.version, load)
+
+
+def render_fragment(template_name, **context):
+    """
+    Renders part of a page (e.g. the rows of a table) as markup that can be cached and dropped into the page unescaped
+    """
+    return Markup(render_template(template_name, **context))
+
+
+def data_changed():
+    """
+    Called just before committing a change to staff or shifts. Moves the data version on in the same transaction, so
+    the change and the new version are seen together: cached facets and table rows are reloaded and pages that are
+    conditionally requested are sent again
+    """
+    db.session.query(DataVersion).update({DataVersion.version: DataVersion.version + 1,
+                                          DataVersion.changed_at: datetime.datetime.utcnow()},
+                                         synchronize_session=False)
+    g.pop('data_version', None)
+
+
+def conditional_get(view):
+    """
+    Marks a page that only changes when the data version does, so a browser refreshing it with the ETag it was given
+    gets a 304 Not Modified after just the version check. Goes below @app.route (the attribute is carried through
+    @login_required), like read_only
+    """
+    view.conditional_get = True
+    return view
+
+
+def release_stamp(root_path):
+    """
+    The last time any of the app's code or templates changed, so a deploy that changes how a page looks gives it a new
+    ETag even though the data hasn't changed
+    """
+    paths = [os.path.join(folder, name) for folder, _, names in os.walk(root_path) for name in names
+             if name.endswith(('.py', '.html'))]
+    return datetime.datetime.utcfromtimestamp(int(max(os.path.getmtime(path) for path in paths)))
+
+
+def init_cache(app):
+    """
+    Keeps a VersionedCache in app.extensions['data_cache'], sized by the CACHE_MAX_ENTRIES and CACHE_TTL_SECONDS
+    settings (a TTL of 0 turns caching off), and answers conditional GETs for conditional_get pages.
+
+    A page's strong ETag covers everything it's rendered from: the data version, the logged in user, the full URL,
+    today's date (the Shift List and Pending Requests start from today) and the release stamp. No Last-Modified is
+    sent: HTTP dates only go down to the second, so a page fetched in the same second as a change could be answered
+    with a 304 for ever after. Pages with a message waiting to be flashed are always sent in full, since showing the
+    message is what changes them
+    """
+    data_cache = VersionedCache(app.config['CACHE_MAX_ENTRIES'], app.config['CACHE_TTL_SECONDS'])
+    app.extensions['data_cache'] = data_cache
+    released_at = release_stamp(app.root_path)
+
+    @app.before_request
+    def answer_conditional_get():
+        view = app.view_functions.get(request.endpoint)
+        if request.method not in ('GET', 'HEAD') or not getattr(view, 'conditional_get', False) or \
+                '_flashes' in session or not current_user.is_authenticated:
+            return None
+        version = current_data_version()
+        if version is None:
+            return None
+        today = datetime.date.today()
+        page_key = f"{version.version}:{current_user.id}:{request.full_path}:{today}:{released_at.isoformat()}"
+        g.etag = hashlib.sha1(page_key.encode()).hexdigest()
+        return app.response_class(status=304) if request.if_none_match.contains(g.etag) else None
+
+    @app.after_request
+    def add_validators(response):
+        if 'etag' in g and response.status_code in (200, 304):
+            response.set_etag(g.etag)
+            # browsers have to check back every time, and shouldn't reuse the page for someone else logging in
+            response.cache_control.private = True
+            response.cache_control.no_cache = True
+            response.vary.add('Cookie')
+        return response
+
+    return data_cache
@@ -0,0 +1,101 @@
+from flask import g, has_request_context, request
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, get_state
+from sqlalchemy import event, orm
+from sqlalchemy.pool import QueuePool
+
+import functools
+
+
+def read_only(view):
+    """
+    Marks a route whose GET requests only read from the database, so they can be served from the read engine. Goes
+    below @app.route (the attribute is carried through @login_required), like query_budget
+    """
+    view.read_only = True
+    return view
+
+
+def in_memory_sqlite(url):
+    return url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:')
+
+
+class RoutingSession(SignallingSession):
+    """
+    The app's session. While a GET request to a read_only route is being served every query goes to the "read" engine,
+    everything else uses the main one
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        if has_request_context() and g.get('read_only'):
+            return get_state(self.app).db.get_engine(self.app, bind='read')
+        return super().get_bind(mapper, clause)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    Flask-SQLAlchemy with the app's DATABASE_POOL_* settings applied to every engine and RoutingSession as the session
+    """
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def apply_driver_hacks(self, app, sa_url, options):
+        if app.config['DATABASE_POOL_SIZE'] and not in_memory_sqlite(sa_url):
+            options.update(pool_size=app.config['DATABASE_POOL_SIZE'],
+                           max_overflow=app.config['DATABASE_MAX_OVERFLOW'],
+                           pool_timeout=app.config['DATABASE_POOL_TIMEOUT'],
+                           pool_recycle=app.config['DATABASE_POOL_RECYCLE'])
+            if sa_url.drivername.startswith('sqlite'):
+                # SQLAlchemy 1.3 opens a new connection for every checkout of a SQLite file by default. A pooled
+                # connection is only used by one thread at a time, so it can be handed to whichever thread needs it
+                options['poolclass'] = QueuePool
+                options.setdefault('connect_args', {})['check_same_thread'] = False
+        super().apply_driver_hacks(app, sa_url, options)
+
+
+def apply_sqlite_pragmas(config, read_only_connection, dbapi_connection, connection_record):
+    """
+    Applies the SQLITE_* settings to a new SQLite connection, and makes read engine connections query_only so a
+    read_only route that tries to write fails instead of quietly writing through the read engine
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute(f"PRAGMA busy_timeout = {int(config['SQLITE_BUSY_TIMEOUT_MS'])}")
+    if config['SQLITE_JOURNAL_MODE']:
+        cursor.execute(f"PRAGMA journal_mode = {config['SQLITE_JOURNAL_MODE']}")
+    if config['SQLITE_SYNCHRONOUS']:
+        cursor.execute(f"PRAGMA synchronous = {config['SQLITE_SYNCHRONOUS']}")
+    cursor.execute(f"PRAGMA mmap_size = {int(config['SQLITE_MMAP_SIZE'])}")
+    if read_only_connection:
+        cursor.execute('PRAGMA query_only = ON')
+    cursor.close()
+
+
+def init_database(app, db):
+    """
+    Connects db to the app with two engines: the main one, and a "read" engine (READ_DATABASE_URL, or the main database
+    again) used by GET requests to read_only routes when DATABASE_SPLIT_READS is on. Keeping browsing on its own
+    connections means a page of shifts never holds a connection that someone accepting a shift is waiting for, and
+    READ_DATABASE_URL can point the reads at a replica. An in-memory SQLite database can't be shared between engines,
+    so its reads are never split.
+
+    The engines are created here so the SQLite pragmas can be attached to them, but neither connects until it's used
+    """
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.setdefault('read', app.config['READ_DATABASE_URL'] or app.config['SQLALCHEMY_DATABASE_URI'])
+    app.config['SQLALCHEMY_BINDS'] = binds
+    db.init_app(app)
+
+    with app.app_context():
+        main_engine = db.get_engine(app)
+        if in_memory_sqlite(main_engine.url):
+            app.config['DATABASE_SPLIT_READS'] = False
+        for engine, read_only_connection in [(main_engine, False), (db.get_engine(app, bind='read'), True)]:
+            if engine.dialect.name == 'sqlite':
+                event.listen(engine, 'connect', functools.partial(apply_sqlite_pragmas, app.config,
+                                                                  read_only_connection))
+
+    @app.before_request
+    def route_reads():
+        view = app.view_functions.get(request.endpoint)
+        g.read_only = app.config['DATABASE_SPLIT_READS'] and request.method in ('GET', 'HEAD') and \
+            getattr(view, 'read_only', False)
@@ -0,0 +1,238 @@
+from flask import Blueprint, Response, current_app, request
+from flask_login import login_required, current_user
+
+import datetime
+import json
+import queue
+import threading
+import time
+
+from sqlalchemy import func
+
+from api import SHIFT_FIELDS, json_values
+from database import read_only
+from instrumentation import query_budget
+from models import db, Shift, ShiftEvent, get_user
+from queries import decode_cursor, encode_cursor, feed_page, parse_date_arg
+
+
+# the Shift List's live updates: a server-sent events stream of shifts being posted, claimed, approved and put back.
+# Each stream holds a connection open for as long as the page is, so serve the app with an async worker that can keep
+# thousands of them idle, e.g. gunicorn -k gevent --worker-connections 2000 "app:create_app()". Plain threaded workers
+# work too, but need a thread per open stream
+bp = Blueprint('events', __name__)
+
+# the event sent for each type of ShiftEvent: a shift going up (or back up, or up with new details) on the Shift List
+# is "posted", someone asking for it is "claimed" and it being given to someone is "approved"
+EVENT_TYPES = {'posted': 'posted', 'updated': 'posted', 'denied': 'posted', 'released': 'posted',
+               'claimed': 'claimed', 'approved': 'approved', 'assigned': 'approved'}
+# most logged events read at once by the watcher, and sent to a reconnecting stream before it's told to reload
+EVENT_BATCH_SIZE = 500
+# the shift's fields as they were straight after the event: the status and holder come from the event, everything
+# else from the shift
+EVENT_SHIFT_COLUMNS = [getattr(ShiftEvent if field in ('status', 'picked_up_by_id') else Shift, field)
+                       for field in SHIFT_FIELDS]
+
+
+def logged_events(after, limit=EVENT_BATCH_SIZE):
+    """
+    Up to limit shift events logged after the after cursor (see /api/v1/shift-events) with their shifts, oldest first,
+    and the cursor for the last of them (after again when there are none)
+    """
+    events = db.session.query(ShiftEvent.id, ShiftEvent.event_type, *EVENT_SHIFT_COLUMNS)\
+        .join(Shift, Shift.shift_id == ShiftEvent.shift_id)
+    rows, cursor, _ = feed_page(events, [ShiftEvent.id], after, limit)
+    return rows, cursor
+
+
+def shift_event(row):
+    """
+    A logged shift event as a server-sent event: its type, its sequence number's cursor as the id (so a reconnecting
+    browser can say where it got up to) and the shift's fields as JSON
+    """
+    return {'type': EVENT_TYPES.get(row.event_type, 'changed'), 'id': encode_cursor([row.id]),
+            'shift': dict(zip(SHIFT_FIELDS, json_values(row, SHIFT_FIELDS)))}
+
+
+def format_event(event):
+    return f"event: {event['type']}\nid: {event['id']}\ndata: {json.dumps(event['shift'], separators=(',', ':'))}\n\n"
+
+
+class Subscription:
+    """
+    One open stream: the role, location and first and last days (each None for no filter) it wants shifts for, and
+    the events waiting to be sent to it. A stream that falls more than its queue behind is told to reload instead of
+    being sent a partial list
+    """
+
+    def __init__(self, role, location, queue_size, start_date=None, end_date=None):
+        self.role = role
+        self.location = location
+        self.start_date = start_date
+        self.end_date = end_date
+        self.events = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def wants(self, shift):
+        # the same shifts the Shift List shows: this role and location, from today (or the later start_date) through
+        # end_date
+        start_at = shift['start_at'] or ''
+        first_day = max(self.start_date or datetime.date.today(), datetime.date.today())
+        return (self.role is None or shift['role'] == self.role) and \
+            (self.location is None or shift['location'] == self.location) and \
+            start_at >= first_day.isoformat() and \
+            (self.end_date is None or start_at < (self.end_date + datetime.timedelta(days=1)).isoformat())
+
+    def offer(self, event):
+        try:
+            self.events.put_nowait(event)
+        except queue.Full:
+            self.overflowed = True
+
+
+class ShiftEventBroker:
+    """
+    Fans shift changes out to every open stream in this process. While any stream is open a watcher thread reads the
+    shift events logged since its last check every SSE_POLL_SECONDS and offers each one to the streams that want it.
+    So however many streams are open, and whichever worker made the change, the database sees one small query per
+    worker per poll, and every step a shift goes through is sent even when several happen between polls
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.watcher = None
+        self.cursor = None
+        self.published = 0
+
+    def subscribe(self, role, location, start_date=None, end_date=None):
+        subscription = Subscription(role, location, self.app.config['SSE_QUEUE_SIZE'], start_date, end_date)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            if self.watcher is None:
+                self.watcher = threading.Thread(target=self.watch, name='shift-event-watcher', daemon=True)
+                self.watcher.start()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def disconnect_all(self):
+        """
+        Ends every open stream (their browsers will reconnect), e.g. before shutting down
+        """
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            subscription.offer(None)
+
+    def publish(self, event):
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(event['shift']):
+                subscription.offer(event)
+        self.published += 1
+
+    def check_for_changes(self):
+        """
+        Publishes the shift events logged since the last check. The first check only notes where the log is up to
+        """
+        if self.cursor is None:
+            self.cursor = encode_cursor([db.session.query(func.coalesce(func.max(ShiftEvent.id), 0)).scalar()])
+            return
+        while True:
+            rows, self.cursor = logged_events(self.cursor)
+            for row in rows:
+                self.publish(shift_event(row))
+            if len(rows) < EVENT_BATCH_SIZE:
+                break
+
+    def watch(self):
+        while True:
+            with self.app.app_context():
+                try:
+                    if self.subscriptions:
+                        self.check_for_changes()
+                    else:
+                        # with nobody listening there's nothing to catch up on when the next stream opens
+                        self.cursor = None
+                except Exception:
+                    self.app.logger.exception('Checking for shift changes failed')
+                finally:
+                    db.session.remove()
+            time.sleep(self.app.config['SSE_POLL_SECONDS'])
+
+
+def event_stream(broker, subscription, missed, keepalive_seconds):
+    """
+    The body of a stream: the events it missed while disconnected, then each event as it's published, with a comment
+    line every keepalive_seconds so proxies don't close an idle stream
+    """
+    try:
+        yield 'retry: 3000\n\n'
+        for event in missed:
+            yield format_event(event)
+        while not subscription.overflowed:
+            try:
+                event = subscription.events.get(timeout=keepalive_seconds)
+            except queue.Empty:
+                yield ': keepalive\n\n'
+                continue
+            if event is None:
+                return
+            yield format_event(event)
+        yield 'event: reload\ndata: {}\n\n'
+    finally:
+        broker.unsubscribe(subscription)
+
+
+def missed_events(subscription, last_event_id):
+    """
+    The events a reconnecting stream missed since the one it last got (its Last-Event-ID). If there are too many, it's
+    marked as overflowed so it's told to reload the Shift List instead
+    """
+    if not last_event_id or decode_cursor(last_event_id, [ShiftEvent.id]) is None:
+        return []
+    rows, _ = logged_events(last_event_id)
+    if len(rows) == EVENT_BATCH_SIZE:
+        subscription.overflowed = True
+        return []
+    events = [shift_event(row) for row in rows]
+    return [event for event in events if subscription.wants(event['shift'])]
+
+
+@bp.route('/shifts/events')
+@login_required
+@query_budget(2)
+@read_only
+def shift_events():
+    """
+    A server-sent events stream of changes to the shifts on the logged in staff member's Shift List: "posted" when a
+    shift goes up (or back up after being denied or removed), "claimed" when someone requests it and "approved" when
+    it's theirs. It takes the Shift List's role, location, start_date and end_date filters, with the same rules about
+    roles as the page: an Admin who hasn't picked a role gets every role. Browsers reconnect on their own, and pick up
+    what they missed from the Last-Event-ID they send
+    """
+    cur_role = get_user(current_user.id).role
+    role = (request.args.get('role') or None) if cur_role == 'Admin' else cur_role
+    broker = current_app.extensions['shift_events']
+    subscription = broker.subscribe(role, request.args.get('location') or None, parse_date_arg('start_date'),
+                                    parse_date_arg('end_date'))
+    # subscribing first means nothing is lost between catching up and going live, at worst an event comes twice
+    missed = missed_events(subscription, request.headers.get('Last-Event-ID'))
+    # the stream can stay open for hours, it mustn't keep a database connection checked out all that time
+    db.session.remove()
+    return Response(event_stream(broker, subscription, missed, current_app.config['SSE_KEEPALIVE_SECONDS']),
+                    mimetype='text/event-stream', headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def init_events(app):
+    """
+    Keeps the app's ShiftEventBroker in app.extensions['shift_events']. Its watcher thread starts with the first stream
+    """
+    broker = ShiftEventBroker(app)
+    app.extensions['shift_events'] = broker
+    return broker
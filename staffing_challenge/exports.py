@@ -0,0 +1,82 @@
+from flask import Response, stream_with_context
+
+import csv
+import io
+import tempfile
+
+
+# rows fetched from the database cursor at a time, which is also how many rows go into each chunk of a CSV download
+EXPORT_BATCH_SIZE = 1000
+# bytes sent at a time from a finished Excel file
+XLSX_CHUNK_BYTES = 64 * 1024
+# rows an Excel worksheet can hold, a longer export carries on in another sheet
+XLSX_MAX_ROWS = 1048576
+EXPORT_MIMETYPES = {'csv': 'text/csv',
+                    'xlsx': 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'}
+# the columns of each export, in order
+STAFF_EXPORT_FIELDS = ['id', 'name', 'role', 'location', 'email', 'phone_num', 'availability', 'can_float',
+                       'shifts_worked']
+SHIFT_EXPORT_FIELDS = ['shift_id', 'location', 'role', 'area', 'date', 'start_time', 'end_time', 'start_at', 'end_at',
+                       'status', 'picked_up_by_id', 'added_by_id', 'added_by_name', 'comments']
+
+
+def csv_chunks(fields, rows):
+    """
+    Writes the header and then rows as CSV, yielding the header straight away and then EXPORT_BATCH_SIZE rows at a
+    time, so only one chunk is ever held in memory
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(fields)
+    yield buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    for number, row in enumerate(rows, 1):
+        writer.writerow(row)
+        if number % EXPORT_BATCH_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
+
+
+def xlsx_chunks(fields, rows, title):
+    """
+    Writes the header and rows to an Excel workbook in openpyxl's write-only mode, which streams each sheet's rows to
+    a temporary file instead of keeping them in memory, then sends the finished file a chunk at a time. An .xlsx is a
+    zip that can only be put together once every row is in, so unlike a CSV nothing is sent until then
+    """
+    # openpyxl is only loaded once someone asks for an Excel export
+    import openpyxl
+    workbook = openpyxl.Workbook(write_only=True)
+    sheet, sheet_rows = None, XLSX_MAX_ROWS
+    for row in rows:
+        if sheet_rows == XLSX_MAX_ROWS:
+            sheet = workbook.create_sheet(f"{title} {len(workbook.worksheets) + 1}" if sheet else title)
+            sheet.append(fields)
+            sheet_rows = 1
+        sheet.append(list(row))
+        sheet_rows += 1
+    if sheet is None:
+        workbook.create_sheet(title).append(fields)
+    with tempfile.TemporaryFile() as spool:
+        workbook.save(spool)
+        spool.seek(0)
+        for chunk in iter(lambda: spool.read(XLSX_CHUNK_BYTES), b''):
+            yield chunk
+
+
+def export_response(file_name, file_format, fields, query, sheet_title):
+    """
+    A download of query's rows (which should select fields, in order) as a CSV file or an Excel file with its rows on
+    sheet_title, streamed from the database cursor EXPORT_BATCH_SIZE rows at a time so however many rows there are the
+    export runs in the same memory. The request context (and the database session with it) stays open until the last
+    chunk is sent
+    """
+    rows = query.yield_per(EXPORT_BATCH_SIZE)
+    if file_format == 'csv':
+        chunks = csv_chunks(fields, rows)
+    else:
+        chunks = xlsx_chunks(fields, rows, sheet_title)
+    return Response(stream_with_context(chunks), mimetype=EXPORT_MIMETYPES[file_format],
+                    headers={'Content-Disposition': f'attachment; filename="{file_name}.{file_format}"'})
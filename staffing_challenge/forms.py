@@ -0,0 +1,115 @@
+from flask_wtf import FlaskForm
+from flask_wtf.file import FileField, FileAllowed, FileRequired
+from wtforms import StringField, PasswordField, SubmitField, SelectField, SelectMultipleField
+from wtforms.fields.html5 import DateField
+from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional
+
+
+# valid values for the staff pick-list fields, shared by the forms and the batch upload validation
+ROLE_CHOICES = ["Admin", "CRNA", "Medical Assistant", "RN", "Scrub Tech"]
+FLOAT_CHOICES = ["Yes", "No", "N/A"]
+AVAILABILITY_CHOICES = ["Yes", "No"]
+# the days a shift template can be posted on, as Python weekday numbers (Monday is 0)
+WEEKDAY_CHOICES = [(0, 'Monday'), (1, 'Tuesday'), (2, 'Wednesday'), (3, 'Thursday'), (4, 'Friday'), (5, 'Saturday'),
+                   (6, 'Sunday')]
+
+
+# class to indicate the fields that'll be used on the Batch Files page's upload forms
+class UploadForm(FlaskForm):
+    file = FileField(label='Completed template (.xlsx or .csv)',
+                     validators=[FileRequired(), FileAllowed(['xlsx', 'csv'], 'Only .xlsx and .csv files are accepted')])
+    submit = SubmitField(label="Upload")
+
+
+# class to indicate the fields that'll be used on the Batch Files page's shift upload form
+class ShiftUploadForm(FlaskForm):
+    file = FileField(label='Completed template (.xlsx or .csv)',
+                     validators=[FileRequired(), FileAllowed(['xlsx', 'csv'], 'Only .xlsx and .csv files are accepted')])
+    mode = SelectField(label='Shifts already posted',
+                       choices=[('insert', 'Skip them'), ('upsert', 'Update their end time and comments'),
+                                ('dry_run', 'Dry run (check the file without saving anything)')])
+    submit = SubmitField(label="Upload")
+
+
+# class to indicate the fields that'll be used on the Auto-Assign Shifts form
+class AutoAssignForm(FlaskForm):
+    start_date = DateField(label='Fill open shifts from', format='%Y-%m-%d', validators=[DataRequired()])
+    end_date = DateField(label='Through', format='%Y-%m-%d', validators=[DataRequired()])
+    preview = SubmitField(label="Preview Assignments")
+    commit = SubmitField(label="Assign Shifts")
+
+
+# class to indicate the fields that'll be used on the app's login form
+class LoginForm(FlaskForm):
+    email = StringField(label='Email', validators=[DataRequired(), Email()])
+    password = PasswordField(label='Password', validators=[DataRequired()])
+    submit = SubmitField(label="Log In")
+
+
+# class to indicate the fields that'll be used on the page an invite email links to
+class SetPasswordForm(FlaskForm):
+    password = PasswordField(label='Password', validators=[Length(min=8)])
+    confirm = PasswordField(label='Confirm Password', validators=[EqualTo('password', message='Passwords must match')])
+    submit = SubmitField(label="Set Password")
+
+
+# class to indicate the fields that'll be used on the app's registration form
+class RegisterForm(FlaskForm):
+    name = StringField(label='Name', validators=[DataRequired()])
+    role = SelectField(label='Role', choices=ROLE_CHOICES, validators=[DataRequired()])
+    location = StringField(label='Hospital', validators=[DataRequired()])
+    email = StringField(label='Email', validators=[DataRequired(), Email()])
+    phone_num = StringField(label='Phone Number', validators=[DataRequired()])
+    can_float = SelectField(label='Float to other areas?', choices=FLOAT_CHOICES, validators=[DataRequired()])
+    availability = SelectField(label='Staff member currently available?', choices=AVAILABILITY_CHOICES
+                               , validators=[DataRequired()])
+    password = PasswordField(label='Password', validators=[Length(min=8)])
+    submit = SubmitField(label="Register")
+
+
+# class to indicate the fields that'll be used on the app's Add User form
+class UserForm(FlaskForm):
+    name = StringField(label='Name', validators=[DataRequired()])
+    role = SelectField(label='Role', choices=ROLE_CHOICES, validators=[DataRequired()])
+    location = StringField(label='Hospital', validators=[DataRequired()])
+    email = StringField(label='Email', validators=[DataRequired(), Email()])
+    phone_num = StringField(label='Phone Number', validators=[DataRequired()])
+    can_float = SelectField(label='Float to other areas?', choices=FLOAT_CHOICES, validators=[DataRequired()])
+    availability = SelectField(label='Staff member currently available?', choices=AVAILABILITY_CHOICES
+                               , validators=[DataRequired()])
+    submit = SubmitField(label="Add User")
+
+
+# class to indicate the fields that'll be used on the app's Add Shift form
+class ShiftForm(FlaskForm):
+    location = StringField(label='Hospital', validators=[DataRequired()])
+    role = SelectField(label='Role', choices=["RN", "CRNA", "Medical Assistant", "Scrub Tech"]
+                       , validators=[DataRequired()])
+    area = StringField(label='Area (e.g. ICU)', validators=[DataRequired()])
+    date = DateField(label='Shift Date', format='%Y-%m-%d', validators=[DataRequired()])
+    start_time = StringField(label='Start Time (e.g. 8am)', validators=[DataRequired()])
+    end_time = StringField(label='End Time (e.g. 5pm)', validators=[DataRequired()])
+    comments = StringField(label='Comments (competencies, random notes, etc.)')
+    submit = SubmitField(label="Add Shift")
+
+
+# class to indicate the fields that'll be used on the Shift Templates page's Add Template form
+class ShiftTemplateForm(FlaskForm):
+    location = StringField(label='Hospital', validators=[DataRequired()])
+    role = SelectField(label='Role', choices=["RN", "CRNA", "Medical Assistant", "Scrub Tech"]
+                       , validators=[DataRequired()])
+    area = StringField(label='Area (e.g. ICU)', validators=[DataRequired()])
+    days_of_week = SelectMultipleField(label='Days of the week', choices=WEEKDAY_CHOICES, coerce=int,
+                                       validators=[DataRequired()])
+    start_time = StringField(label='Start Time (e.g. 8am)', validators=[DataRequired()])
+    end_time = StringField(label='End Time (e.g. 5pm)', validators=[DataRequired()])
+    start_date = DateField(label='First Day', format='%Y-%m-%d', validators=[DataRequired()])
+    end_date = DateField(label='Last Day (leave blank to keep going)', format='%Y-%m-%d', validators=[Optional()])
+    comments = StringField(label='Comments (competencies, random notes, etc.)')
+    submit = SubmitField(label="Add Template")
+
+
+# class to indicate the fields that'll be used on the Shift Templates page's Post Shifts form
+class GenerateShiftsForm(FlaskForm):
+    end_date = DateField(label='Post shifts from the templates through', format='%Y-%m-%d', validators=[DataRequired()])
+    submit = SubmitField(label="Post Shifts")
@@ -0,0 +1,336 @@
+import sqlalchemy
+from sqlalchemy import func
+
+import time
+import zipfile
+import openpyxl
+import pandas as pd
+
+from cache import data_changed
+from forms import FLOAT_CHOICES, ROLE_CHOICES
+from invites import invite_email, new_invite
+from models import db, User, Shift, EmailOutbox, TIME_PATTERN, record_shift_events
+from shifts import post_new_shifts
+
+
+# number of rows from an uploaded file that are validated and inserted together
+UPLOAD_CHUNK_SIZE = 500
+STAFF_UPLOAD_COLUMNS = ['name', 'role', 'location', 'email', 'phone_num', 'can_float']
+SHIFT_UPLOAD_COLUMNS = ['location', 'role', 'area', 'date', 'start_time', 'end_time']
+# columns that together identify a shift, used to spot shifts that have already been posted
+SHIFT_KEY_COLUMNS = ['location', 'area', 'role', 'date', 'start_time']
+EMAIL_PATTERN = r'^[^@\s]+@[^@\s]+\.[^@\s]+$'
+
+
+def read_upload_chunks(upload_file, columns, optional_columns=(), chunk_size=UPLOAD_CHUNK_SIZE):
+    """
+    Streams an uploaded .csv or .xlsx file as DataFrames of at most chunk_size rows, so a large file is never fully
+    loaded into memory. Every value comes back as a stripped string ('' when blank, including optional columns the
+    file leaves out) and each chunk is indexed by the row's line number in the original file so problems can be
+    reported back against it
+    """
+    if upload_file.filename.lower().endswith('.csv'):
+        chunks = (chunk.set_axis(chunk.index + 2) for chunk in
+                  pd.read_csv(upload_file.stream, dtype=str, chunksize=chunk_size))
+    else:
+        chunks = read_excel_chunks(upload_file.stream, chunk_size)
+
+    for chunk in chunks:
+        chunk.columns = [str(column).strip() for column in chunk.columns]
+        missing = [column for column in columns if column not in chunk.columns]
+        if missing:
+            raise ValueError(f"The file is missing the following columns: {', '.join(missing)}")
+        for column in optional_columns:
+            if column not in chunk.columns:
+                chunk[column] = ''
+        chunk = chunk[list(columns) + list(optional_columns)].astype('string').fillna('')
+        yield chunk.apply(lambda column: column.str.strip())
+
+
+def read_excel_chunks(stream, chunk_size):
+    """
+    Uses openpyxl's read-only mode to walk the first worksheet of an Excel file row by row, yielding DataFrames of at
+    most chunk_size non-blank rows
+    """
+    workbook = openpyxl.load_workbook(stream, read_only=True, data_only=True)
+    rows = workbook.active.iter_rows(values_only=True)
+    header = ['' if value is None else str(value) for value in next(rows, ())]
+    batch, line_numbers, read_any = [], [], False
+    for line_number, row in enumerate(rows, start=2):
+        if all(value is None for value in row):
+            continue
+        batch.append(row[:len(header)])
+        line_numbers.append(line_number)
+        if len(batch) == chunk_size:
+            yield pd.DataFrame(batch, columns=header, index=pd.Index(line_numbers, dtype='int64'))
+            batch, line_numbers, read_any = [], [], True
+    if batch or not read_any:
+        yield pd.DataFrame(batch, columns=header, index=pd.Index(line_numbers, dtype='int64'))
+    workbook.close()
+
+
+def collect_problems(problems):
+    """
+    Turns a Series of accumulated "; "-separated problem messages into a list of (line number, message) pairs for the
+    rows that have at least one problem
+    """
+    flagged = problems[problems != '']
+    return [(line_number, message.rstrip('; ')) for line_number, message in flagged.items()]
+
+
+def validate_staff_chunk(chunk, seen_emails):
+    """
+    Checks a chunk of roster rows column by column and returns the rows that can be added along with the problems
+    found in the rest. An email counts as a duplicate if it already belongs to a staff member or appeared earlier in
+    the file, which is tracked through seen_emails (updated in place)
+    """
+    problems = pd.Series('', index=chunk.index, dtype=object)
+    for column in ['name', 'role', 'location', 'email']:
+        problems[chunk[column] == ''] += f'{column} is required; '
+    problems[(chunk['role'] != '') & ~chunk['role'].isin(ROLE_CHOICES)] += 'role is not a valid choice; '
+    problems[(chunk['can_float'] != '') & ~chunk['can_float'].isin(FLOAT_CHOICES)] += 'can_float must be Yes, No or N/A; '
+    problems[(chunk['email'] != '') & ~chunk['email'].str.match(EMAIL_PATTERN)] += 'email is not valid; '
+
+    email_keys = chunk['email'].str.lower()
+    candidate_emails = email_keys[email_keys != ''].unique().tolist()
+    existing_emails = {email for (email,) in db.session.query(func.lower(User.email))
+                       .filter(func.lower(User.email).in_(candidate_emails))}
+    problems[email_keys.isin(existing_emails - seen_emails)] += 'a staff member with this email already exists; '
+    problems[(email_keys != '') & (email_keys.duplicated() | email_keys.isin(seen_emails))] += \
+        'email appears more than once in the file; '
+
+    valid_rows = chunk[problems == '']
+    seen_emails.update(email_keys[problems == ''])
+    return valid_rows, collect_problems(problems)
+
+
+def finish_upload_report(report, started_at):
+    """
+    Adds the elapsed time and throughput to an upload report
+    """
+    report['seconds'] = time.perf_counter() - started_at
+    report['rows_per_second'] = report['rows_read'] / report['seconds'] if report['seconds'] else 0
+    return report
+
+
+def import_staff_roster(upload_file):
+    """
+    Adds every valid row of an uploaded staff roster as a new staff member. All of the inserts for the file happen in
+    one transaction (written a chunk at a time with bulk inserts), so a failure part way through leaves the staff
+    table untouched. Like staff added through the Add User form, each new staff member is emailed an invite to set
+    their own password, so no passwords are hashed however big the roster is
+    """
+    started_at = time.perf_counter()
+    report = {'rows_read': 0, 'inserted': 0, 'invited': 0, 'errors': []}
+    seen_emails = set()
+    try:
+        for chunk in read_upload_chunks(upload_file, STAFF_UPLOAD_COLUMNS):
+            valid_rows, errors = validate_staff_chunk(chunk, seen_emails)
+            invites = [new_invite() for _ in range(len(valid_rows))]
+            new_users = valid_rows.assign(can_float=valid_rows['can_float'].replace('', 'N/A'), availability='Yes',
+                                          shifts_worked=0).to_dict('records')
+            for new_user, (_, token_hash, expires_at) in zip(new_users, invites):
+                new_user.update(invite_token_hash=token_hash, invite_expires_at=expires_at)
+            db.session.bulk_insert_mappings(User, new_users)
+            db.session.bulk_insert_mappings(EmailOutbox, [invite_email(new_user['name'], new_user['email'], token)
+                                                          for new_user, (token, _, _) in zip(new_users, invites)])
+            report['rows_read'] += len(chunk)
+            report['inserted'] += len(new_users)
+            report['invited'] += len(invites)
+            report['errors'].extend(errors)
+        data_changed()
+        db.session.commit()
+    except (ValueError, zipfile.BadZipFile) as error:
+        db.session.rollback()
+        report['inserted'] = report['invited'] = 0
+        report['errors'] = [(None, f"The file could not be uploaded: {error}")]
+    except Exception:
+        db.session.rollback()
+        raise
+    return finish_upload_report(report, started_at)
+
+
+def parse_shift_times(times):
+    """
+    Parses a Series of time strings such as "8am", "7:30 PM", "730am", "14:00" or "08:00:00" into a DataFrame of hour
+    (0-23) and minute columns. Values that can't be read as a time get NaN in both columns
+    """
+    parts = times.str.lower().str.replace(' ', '', regex=False).str.replace(r'^(\d{1,2}:\d{2}):00', r'\1', regex=True) \
+        .str.extract(TIME_PATTERN)
+    hour = pd.to_numeric(parts['hour'], errors='coerce')
+    minute = pd.to_numeric(parts['minute'], errors='coerce').fillna(0)
+    has_meridiem = parts['meridiem'].notna()
+    valid = (minute < 60) & ((has_meridiem & hour.between(1, 12)) | (~has_meridiem & hour.between(0, 23)))
+    hour = hour.where(~has_meridiem, hour % 12 + (parts['meridiem'] == 'pm') * 12)
+    return pd.DataFrame({'hour': hour.where(valid), 'minute': minute.where(valid)})
+
+
+def format_shift_times(parsed):
+    """
+    Turns the hour/minute columns from parse_shift_times back into the app's display format, e.g. "8am" or "7:30pm"
+    """
+    hour = parsed['hour'].astype('Int64')
+    minute = parsed['minute'].astype('Int64')
+    twelve_hour = ((hour + 11) % 12 + 1).astype('string')
+    minutes = (':' + minute.astype('string').str.zfill(2)).where(minute != 0, '')
+    return twelve_hour + minutes + hour.lt(12).map({True: 'am', False: 'pm'}).astype('string')
+
+
+def shift_datetime_columns(dates, start_hours, end_hours):
+    """
+    The column-wise version of shift_datetimes: combines a Series of dates with the hour/minute frames from
+    parse_shift_times into start_at and end_at Series, moving end_at to the next day for overnight shifts
+    """
+    days = pd.to_datetime(dates)
+    start_at = days + pd.to_timedelta(start_hours['hour'] * 60 + start_hours['minute'], unit='min')
+    end_at = days + pd.to_timedelta(end_hours['hour'] * 60 + end_hours['minute'], unit='min')
+    end_at = end_at.where(end_at > start_at, end_at + pd.Timedelta(days=1))
+    return start_at.astype(object).where(start_at.notna(), None), end_at.astype(object).where(end_at.notna(), None)
+
+
+def normalize_shift_chunk(chunk):
+    """
+    Converts a chunk of uploaded shift rows into the stored representation (real dates and consistently formatted
+    times, plus start_at/end_at datetimes) and returns it along with a Series of the problems found in each row
+    """
+    problems = pd.Series('', index=chunk.index, dtype=object)
+    for column in SHIFT_UPLOAD_COLUMNS:
+        problems[chunk[column] == ''] += f'{column} is required; '
+    problems[(chunk['role'] != '') & ~chunk['role'].isin(ROLE_CHOICES)] += 'role is not a valid choice; '
+
+    # a file only holds a handful of distinct dates, so each one is parsed once and mapped back onto the rows
+    distinct_dates = chunk['date'].unique()
+    dates = chunk['date'].map(dict(zip(distinct_dates, (pd.to_datetime(value, errors='coerce')
+                                                         for value in distinct_dates))))
+    dates = pd.to_datetime(dates)
+    problems[(chunk['date'] != '') & dates.isna()] += 'date is not a valid date; '
+    normalized = chunk.assign(date=dates.dt.date)
+    parsed = {}
+    for column in ['start_time', 'end_time']:
+        parsed[column] = parse_shift_times(chunk[column])
+        problems[(chunk[column] != '') & parsed[column]['hour'].isna()] += f'{column} is not a valid time; '
+        normalized[column] = format_shift_times(parsed[column])
+    normalized['start_at'], normalized['end_at'] = shift_datetime_columns(dates, parsed['start_time'],
+                                                                          parsed['end_time'])
+    return normalized, problems
+
+
+def find_posted_shifts(chunk):
+    """
+    Looks up the shifts already in the database that share a location, area, role, date and start time with a row in
+    the chunk. Returns a DataFrame of the matching shifts' ids, claim status and current end_at and comments (as
+    posted_end_at and posted_comments) keyed on those columns
+    """
+    posted = pd.DataFrame(columns=SHIFT_KEY_COLUMNS + ['shift_id', 'picked_up_by_id', 'posted_end_at',
+                                                       'posted_comments'])
+    if chunk.empty:
+        return posted
+    query = db.session.query(Shift.location, Shift.area, Shift.role, Shift.date, Shift.start_time, Shift.shift_id,
+                             Shift.picked_up_by_id, Shift.end_at, Shift.comments)\
+        .filter(Shift.date.between(chunk['date'].min(), chunk['date'].max()),
+                Shift.location.in_(chunk['location'].unique().tolist()))
+    posted = pd.DataFrame(query.all(), columns=posted.columns)
+    posted['start_time'] = format_shift_times(parse_shift_times(posted['start_time'].astype('string')))
+    return posted.drop_duplicates(SHIFT_KEY_COLUMNS)
+
+
+def shift_details_changed(matches):
+    """
+    Whether each row matched to a posted shift would change that shift's end time or comments (a missing comment and a
+    blank one being the same)
+    """
+    def comments(value):
+        return '' if pd.isna(value) else value
+    return pd.Series([not (row.end_at == row.posted_end_at and comments(row.comments) == comments(row.posted_comments))
+                      for row in matches.itertuples()], index=matches.index, dtype=bool)
+
+
+def update_posted_shifts(updates, actor_id):
+    """
+    Sets the end time and comments of the already posted shifts in updates (matches from find_posted_shifts). Like
+    claim_shift, the UPDATE is conditional and only matches a shift while it's still up for grabs, as it was when it
+    was looked up, so a shift someone picks up in the meantime is left alone. Records an "updated" event for each
+    shift changed and returns the index (line numbers) of the rows that were
+    """
+    if updates.empty:
+        return updates.index
+    shift_table = Shift.__table__
+    # the parameters can't share the columns' names, or SQLAlchemy takes them as the new values
+    update = shift_table.update()\
+        .where(sqlalchemy.and_(shift_table.c.shift_id == sqlalchemy.bindparam('updated_shift_id'),
+                               shift_table.c.picked_up_by_id == None, shift_table.c.status == 'Posted'))\
+        .values(end_time=sqlalchemy.bindparam('new_end_time'), end_at=sqlalchemy.bindparam('new_end_at'),
+                comments=sqlalchemy.bindparam('new_comments'))
+    shift_ids = [int(shift_id) for shift_id in updates['shift_id']]
+    updated = db.session.execute(update, [
+        {'updated_shift_id': shift_id, 'new_end_time': row.end_time, 'new_end_at': row.end_at,
+         'new_comments': row.comments} for shift_id, row in zip(shift_ids, updates.itertuples())]).rowcount
+    if updated < len(shift_ids):
+        # some were picked up after they were looked up. This transaction has held the write lock since the UPDATE, so
+        # the shifts that are still up for grabs are exactly the ones it changed
+        open_ids = {shift_id for shift_id, in db.session.query(Shift.shift_id).filter(
+            Shift.shift_id.in_(shift_ids), Shift.picked_up_by_id == None, Shift.status == 'Posted')}
+        updates = updates[[shift_id in open_ids for shift_id in shift_ids]]
+        shift_ids = [shift_id for shift_id in shift_ids if shift_id in open_ids]
+    if shift_ids:
+        record_shift_events('updated', Shift.shift_id.in_(shift_ids), actor_id)
+    return updates.index
+
+
+def import_shifts(upload_file, mode, added_by):
+    """
+    Posts every valid row of an uploaded shift file as a new shift. A row that matches a shift which is already
+    posted (same location, area, role, date and start time) is skipped in "insert" mode, and in "upsert" mode updates
+    that shift's end time and comments as long as nobody has claimed it yet (rows that match the shift as it is are
+    counted as unchanged). In "dry_run" mode the file is fully checked and reported on but nothing is saved.
+    Everything is written in one transaction
+    """
+    started_at = time.perf_counter()
+    report = {'rows_read': 0, 'inserted': 0, 'updated': 0, 'unchanged': 0, 'errors': [], 'dry_run': mode == 'dry_run'}
+    seen_keys = set()
+    try:
+        for chunk in read_upload_chunks(upload_file, SHIFT_UPLOAD_COLUMNS, optional_columns=['comments']):
+            normalized, problems = normalize_shift_chunk(chunk)
+            keys = pd.Series(list(zip(*[normalized[column] for column in SHIFT_KEY_COLUMNS])), index=chunk.index)
+            problems[(problems == '') & (keys.duplicated() | keys.isin(seen_keys))] += \
+                'shift appears more than once in the file; '
+
+            candidates = normalized[problems == ''].reset_index().rename(columns={'index': 'line_number'})
+            matches = candidates.merge(find_posted_shifts(candidates), on=SHIFT_KEY_COLUMNS, how='left') \
+                .set_index('line_number')
+            already_posted = matches['shift_id'].notna()
+            if mode == 'upsert':
+                open_matches = matches[already_posted & matches['picked_up_by_id'].isna()]
+                # rows that would leave their shift as it is aren't written, so they don't show up as edits in the
+                # shift event log or the change feed
+                changed = shift_details_changed(open_matches)
+                updated_lines = update_posted_shifts(open_matches[changed], added_by.id)
+                unchanged_lines = open_matches[~changed].index
+                # the rest had been picked up, either before they were looked up or since
+                picked_up = already_posted & ~matches.index.isin(updated_lines) & ~matches.index.isin(unchanged_lines)
+                problems[picked_up[picked_up].index] += 'shift is already posted and has been picked up; '
+                report['updated'] += len(updated_lines)
+                report['unchanged'] += len(unchanged_lines)
+            else:
+                problems[already_posted[already_posted].index] += 'shift has already been posted; '
+
+            new_shifts = matches[~already_posted][SHIFT_UPLOAD_COLUMNS + ['comments', 'start_at', 'end_at']] \
+                .assign(added_by_id=added_by.id, added_by_name=added_by.name, status='Posted')
+            post_new_shifts(new_shifts.to_dict('records'), added_by.id)
+            seen_keys.update(keys[problems == ''])
+            report['rows_read'] += len(chunk)
+            report['inserted'] += len(new_shifts)
+            report['errors'].extend(collect_problems(problems))
+
+        if report['dry_run']:
+            db.session.rollback()
+        else:
+            data_changed()
+            db.session.commit()
+    except (ValueError, zipfile.BadZipFile) as error:
+        db.session.rollback()
+        report.update(inserted=0, updated=0, unchanged=0, errors=[(None, f"The file could not be uploaded: {error}")])
+    except Exception:
+        db.session.rollback()
+        raise
+    return finish_upload_report(report, started_at)
@@ -0,0 +1,146 @@
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+import json
+import logging
+import threading
+import time
+
+
+logger = logging.getLogger('staffing.metrics')
+
+
+class QueryBudgetExceeded(Exception):
+    """
+    Raised when a request runs more SQL statements than its route's query budget while budgets are enforced
+    """
+
+
+def query_budget(max_queries):
+    """
+    Declares the most SQL statements a route should need per request. Goes below @app.route (the attribute is carried
+    through @login_required), and can be overridden per endpoint with the QUERY_BUDGETS config setting
+    """
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+    return decorator
+
+
+class RouteMetrics:
+    """
+    Running per-endpoint totals of request count, latency, SQL statements, database time and template render time,
+    shared by every thread serving requests
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.routes = {}
+
+    def record(self, endpoint, latency, sql_count, sql_seconds, template_seconds, over_budget):
+        with self.lock:
+            route = self.routes.setdefault(endpoint, {
+                'requests': 0, 'total_seconds': 0.0, 'max_seconds': 0.0, 'sql_statements': 0, 'max_sql_statements': 0,
+                'sql_seconds': 0.0, 'template_seconds': 0.0, 'over_budget': 0,
+            })
+            route['requests'] += 1
+            route['total_seconds'] += latency
+            route['max_seconds'] = max(route['max_seconds'], latency)
+            route['sql_statements'] += sql_count
+            route['max_sql_statements'] = max(route['max_sql_statements'], sql_count)
+            route['sql_seconds'] += sql_seconds
+            route['template_seconds'] += template_seconds
+            route['over_budget'] += over_budget
+
+    def snapshot(self):
+        """
+        The totals so far, with per-request averages, keyed by endpoint
+        """
+        with self.lock:
+            return {endpoint: dict(route,
+                                   avg_ms=1000 * route['total_seconds'] / route['requests'],
+                                   avg_sql_statements=route['sql_statements'] / route['requests'],
+                                   avg_sql_ms=1000 * route['sql_seconds'] / route['requests'],
+                                   avg_template_ms=1000 * route['template_seconds'] / route['requests'])
+                    for endpoint, route in self.routes.items()}
+
+    def reset(self):
+        with self.lock:
+            self.routes = {}
+
+
+def measuring_request():
+    return has_request_context() and 'request_started' in g
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def start_statement_timer(conn, cursor, statement, parameters, context, executemany):
+    if measuring_request():
+        g.statement_started = time.perf_counter()
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def record_statement(conn, cursor, statement, parameters, context, executemany):
+    if measuring_request() and 'statement_started' in g:
+        g.sql_count += 1
+        g.sql_seconds += time.perf_counter() - g.pop('statement_started')
+
+
+def start_template_timer(sender, template, context, **extra):
+    if measuring_request():
+        g.template_started = time.perf_counter()
+
+
+def record_template(sender, template, context, **extra):
+    if measuring_request() and 'template_started' in g:
+        g.template_seconds += time.perf_counter() - g.pop('template_started')
+
+
+def init_instrumentation(app):
+    """
+    Measures every request the app serves: SQL statements and time (from SQLAlchemy's engine events), template render
+    time (from Flask's template signals) and overall latency. Each request is logged as a JSON line on the
+    staffing.metrics logger and added to the RouteMetrics kept in app.extensions['route_metrics'].
+
+    A request that runs more statements than its route's query budget is logged as a warning, or raises
+    QueryBudgetExceeded when QUERY_BUDGETS_ENFORCED is set, which is how tests can fail on a new N+1 query
+    """
+    metrics = RouteMetrics()
+    app.extensions['route_metrics'] = metrics
+    app.config.setdefault('QUERY_BUDGETS', {})
+    app.config.setdefault('QUERY_BUDGETS_ENFORCED', False)
+    before_render_template.connect(start_template_timer, app)
+    template_rendered.connect(record_template, app)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_started = time.perf_counter()
+        g.sql_count = 0
+        g.sql_seconds = 0.0
+        g.template_seconds = 0.0
+
+    @app.after_request
+    def record_request(response):
+        if 'request_started' not in g:
+            return response
+        latency = time.perf_counter() - g.request_started
+        endpoint = request.endpoint or 'unknown'
+        view = app.view_functions.get(request.endpoint)
+        budget = app.config['QUERY_BUDGETS'].get(endpoint, getattr(view, 'query_budget', None))
+        over_budget = budget is not None and g.sql_count > budget
+
+        metrics.record(endpoint, latency, g.sql_count, g.sql_seconds, g.template_seconds, over_budget)
+        logger.info(json.dumps({
+            'endpoint': endpoint, 'method': request.method, 'status': response.status_code,
+            'latency_ms': round(1000 * latency, 2), 'sql_statements': g.sql_count,
+            'sql_ms': round(1000 * g.sql_seconds, 2), 'template_ms': round(1000 * g.template_seconds, 2),
+        }))
+        if over_budget:
+            message = f"{request.method} {request.path} ran {g.sql_count} SQL statements, its budget is {budget}"
+            if app.config['QUERY_BUDGETS_ENFORCED']:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
+
+    return metrics
@@ -0,0 +1,70 @@
+from flask import current_app, url_for
+
+import datetime
+import hashlib
+import re
+import secrets
+
+from models import db, User, EmailOutbox
+
+
+# bytes of randomness in an invite token. The link carries the token itself and the database only its SHA-256: the
+# invite email in the outbox has the link until it's been sent (or given up on), when it's redacted
+INVITE_TOKEN_BYTES = 32
+# an invite link's token in an email body, as made by url_for('auth.accept_invite') from token_urlsafe
+INVITE_LINK_PATTERN = re.compile(r'/invite/[A-Za-z0-9_-]+')
+
+
+def hash_invite_token(token):
+    """
+    The SHA-256 hex digest stored for an invite token. Tokens are random, not chosen by people, so a fast hash keeps
+    them as safe as a slow password hash would, which is what lets a whole roster be invited without any PBKDF2 work
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
+
+
+def new_invite():
+    """
+    A fresh invite: the token to send out, the hash to store for it and when it expires
+    """
+    token = secrets.token_urlsafe(INVITE_TOKEN_BYTES)
+    expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=current_app.config['INVITE_EXPIRY_DAYS'])
+    return token, hash_invite_token(token), expires_at
+
+
+def invite_email(name, email, token):
+    """
+    The columns of the outbox email inviting a new staff member to set their password. Needs a request context for the
+    link, which commands get from app.test_request_context(base_url=APP_BASE_URL)
+    """
+    link = url_for('auth.accept_invite', token=token, _external=True)
+    contents = f"Hi {name},\n\n" \
+               f"You've been added to the staffing app. Use the link below to set your password and log in:\n" \
+               f"{link}\n\n" \
+               f"The link works once and expires in {current_app.config['INVITE_EXPIRY_DAYS']} days.\n\n" \
+                "From,\nYour trusty pals at iQueue"
+    return {'to_addrs': email, 'subject': "You're invited to the staffing app", 'body': contents}
+
+
+def redact_invite_links(body):
+    """
+    An email body with the token taken out of any invite link in it, for keeping once the email has gone
+    """
+    return INVITE_LINK_PATTERN.sub('/invite/[redacted]', body) if body else body
+
+
+def issue_invite(user):
+    """
+    Gives a staff member a new invite, replacing any earlier one, and adds the email with its link to the outbox. Both
+    are saved by the caller's commit
+    """
+    token, user.invite_token_hash, user.invite_expires_at = new_invite()
+    db.session.add(EmailOutbox(**invite_email(user.name, user.email, token)))
+
+
+def find_invited_user(token):
+    """
+    The staff member an unused, unexpired invite token belongs to, or None
+    """
+    return User.query.filter(User.invite_token_hash == hash_invite_token(token),
+                             User.invite_expires_at > datetime.datetime.utcnow()).first()
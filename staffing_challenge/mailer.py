@@ -0,0 +1,86 @@
+from flask import current_app
+
+import datetime
+import smtplib
+from email.message import EmailMessage
+
+from invites import redact_invite_links
+from models import db, EmailOutbox
+
+
+class OutboxMailer:
+    """
+    Keeps a single SMTP connection open while the outbox worker has email to send instead of connecting, starting TLS
+    and logging in again for every message. The connection is re-opened if the server drops it
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self.connection = None
+
+    def connect(self):
+        connection = smtplib.SMTP(self.config['SMTP_HOST'], self.config['SMTP_PORT'], timeout=30)
+        if self.config['SMTP_USE_TLS']:
+            connection.starttls()
+        if self.config['EMAIL_PASSWORD']:
+            connection.login(self.config['EMAIL'], self.config['EMAIL_PASSWORD'])
+        return connection
+
+    def send(self, message):
+        if self.connection is None:
+            self.connection = self.connect()
+        try:
+            self.connection.send_message(message)
+        except smtplib.SMTPServerDisconnected:
+            self.connection = self.connect()
+            self.connection.send_message(message)
+
+    def close(self):
+        if self.connection is not None:
+            try:
+                self.connection.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self.connection = None
+
+
+def drain_outbox(mailer, batch_size=None):
+    """
+    Sends the next batch of queued emails that are due and returns how many were attempted. A message that fails is
+    retried with an exponentially growing delay until it runs out of attempts, at which point it's marked as Failed.
+    Each message's outcome is committed as soon as the SMTP server has answered for it, so delivery is at least once:
+    if the worker dies between the server accepting a message and that commit, that one message is sent again. Once a
+    message is Sent or Failed its body no longer needs any invite link it had, so the link's token is redacted
+    """
+    batch_size = batch_size or current_app.config['OUTBOX_BATCH_SIZE']
+    now = datetime.datetime.utcnow()
+    due_emails = EmailOutbox.query\
+        .filter(EmailOutbox.status == 'Pending', EmailOutbox.next_attempt_at <= now)\
+        .order_by(EmailOutbox.next_attempt_at, EmailOutbox.id)\
+        .limit(batch_size).all()
+
+    for queued_email in due_emails:
+        message = EmailMessage()
+        message['From'] = current_app.config['EMAIL']
+        message['To'] = queued_email.to_addrs
+        message['Subject'] = queued_email.subject
+        message.set_content(queued_email.body)
+        try:
+            mailer.send(message)
+        except (smtplib.SMTPException, OSError) as error:
+            mailer.close()
+            queued_email.attempts = queued_email.attempts + 1
+            queued_email.last_error = str(error)[:1000]
+            if queued_email.attempts >= current_app.config['OUTBOX_MAX_ATTEMPTS']:
+                queued_email.status = 'Failed'
+                queued_email.body = redact_invite_links(queued_email.body)
+            else:
+                retry_delay = current_app.config['OUTBOX_RETRY_SECONDS'] * 2 ** (queued_email.attempts - 1)
+                queued_email.next_attempt_at = now + datetime.timedelta(seconds=retry_delay)
+        else:
+            queued_email.attempts = queued_email.attempts + 1
+            queued_email.status = 'Sent'
+            queued_email.sent_at = datetime.datetime.utcnow()
+            queued_email.body = redact_invite_links(queued_email.body)
+        db.session.commit()
+    return len(due_emails)
@@ -0,0 +1,306 @@
+from flask import g
+from flask_login import UserMixin
+import sqlalchemy
+from sqlalchemy import func
+
+import datetime
+import re
+
+from database import RoutingSQLAlchemy
+
+
+# times are entered like "8am", "7:30 PM", "730am", "14:00" or "08:00:00"; shifts can run past midnight but are never
+# longer than MAX_SHIFT_HOURS, which bounds how far back an overlap check has to look
+TIME_PATTERN = r'^(?P<hour>\d{1,2}):?(?P<minute>\d{2})?(?P<meridiem>am|pm)?$'
+MAX_SHIFT_HOURS = 24
+
+# the app's database, connected to an app by create_app (see database.py)
+db = RoutingSQLAlchemy()
+
+
+# user class and db table
+class User(UserMixin, db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(1000))
+    role = db.Column(db.String(100))
+    location = db.Column(db.String(100))
+    email = db.Column(db.String(100))
+    phone_num = db.Column(db.String(100))
+    availability = db.Column(db.String(100))
+    can_float = db.Column(db.String(100))
+    password = db.Column(db.String(100))
+    shifts_worked = db.Column(db.Integer)
+    # a one-time invite to set a password (see invites.py): the SHA-256 of the token that was sent out and when it
+    # expires. Invited staff have no password until they've used it
+    invite_token_hash = db.Column(db.String(64))
+    invite_expires_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        # Staff List: staff in name order, paged by (name, id)
+        db.Index('ix_user_name', 'name', 'id'),
+        # invite links
+        db.Index('uq_user_invite_token', 'invite_token_hash', unique=True),
+    )
+
+
+# emails are unique regardless of case, which also lets the login lookup on lower(email) use an index
+db.Index('uq_user_email', func.lower(User.email), unique=True)
+
+
+# a single row counting the committed changes to staff and shifts, bumped by cache.data_changed. Cached pages and the
+# ETags given to browsers are tied to the version they were built from
+class DataVersion(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.datetime.utcnow)
+
+
+# the data version that a transaction writing a shift commits as: data_changed moves the version on just before the
+# commit, and SQLite only lets one transaction write at a time, so nobody else can take the same number first
+NEXT_DATA_VERSION = db.select([DataVersion.version + 1]).as_scalar()
+
+
+# shift class and db table
+class Shift(db.Model):
+    __table_args__ = (
+        # Shift List: unclaimed shifts for a role from today onwards
+        db.Index('ix_shift_open_board', 'picked_up_by_id', 'role', 'start_at'),
+        # Pending Requests: an admin's requested shifts from today onwards
+        db.Index('ix_shift_pending', 'added_by_id', 'status', 'start_at'),
+        # user details and double-booking checks: a staff member's shifts in time order (also the admin Shift List)
+        db.Index('ix_shift_picked_up_by', 'picked_up_by_id', 'start_at', 'end_at'),
+        # shift uploads: finding shifts that have already been posted
+        db.Index('ix_shift_posting', 'location', 'date', 'area', 'role', 'start_time'),
+        # auto-assignment: everyone's bookings around a date range
+        db.Index('ix_shift_schedule', 'start_at', 'picked_up_by_id', 'end_at'),
+        # the API's change feed: shifts changed since a (data_version, shift_id) cursor
+        db.Index('ix_shift_changes', 'data_version', 'shift_id'),
+        # a shift template posts at most one shift a day, however many times it's generated
+        db.Index('uq_shift_template_date', 'template_id', 'date', unique=True),
+    )
+
+    shift_id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(100))
+    role = db.Column(db.String(100))
+    area = db.Column(db.String(100))
+    date = db.Column(db.Date)
+    start_time = db.Column(db.String(100))
+    end_time = db.Column(db.String(100))
+    # start_time/end_time as real datetimes (end_at is on the next day for overnight shifts)
+    start_at = db.Column(db.DateTime)
+    end_at = db.Column(db.DateTime)
+    added_by_id = db.Column(db.Integer)
+    added_by_name = db.Column(db.String)
+    picked_up_by_id = db.Column(db.Integer)
+    comments = db.Column(db.String(100))
+    status = db.Column(db.String(100))
+    # the data version the shift was last posted or changed in, set by every INSERT and UPDATE of the shift table
+    data_version = db.Column(db.Integer, default=NEXT_DATA_VERSION, onupdate=NEXT_DATA_VERSION)
+    # the ShiftTemplate that posted the shift, if it was posted from one
+    template_id = db.Column(db.Integer)
+
+
+# shifts that started before the archive horizon, moved out of the shift table by the archive-shifts command (see
+# archive.py) so the tables and indexes behind the Shift List only hold the shifts people are still working. The
+# columns are copied from shift so the two can't drift apart, plus when each shift was archived
+class ShiftArchive(db.Model):
+    __table__ = db.Table(
+        'shift_archive',
+        *[column.copy() for column in Shift.__table__.columns],
+        db.Column('archived_at', db.DateTime),
+        # user details: a staff member's archived shifts in time order
+        db.Index('ix_shift_archive_picked_up_by', 'picked_up_by_id', 'start_at'),
+        # shift exports: archived shifts in a date range
+        db.Index('ix_shift_archive_start', 'start_at', 'shift_id'),
+    )
+
+
+# a shift that's posted every week on days_of_week (Python weekday numbers, Monday being 0, e.g. "0,2,4") from
+# start_date through end_date, or indefinitely when end_date is None. The generate-shifts command and the Shift
+# Templates page post the shifts from it (see schedules.py). Ids are never reused, as the shifts remember theirs
+class ShiftTemplate(db.Model):
+    __table_args__ = ({'sqlite_autoincrement': True},)
+
+    id = db.Column(db.Integer, primary_key=True)
+    location = db.Column(db.String(100), nullable=False)
+    area = db.Column(db.String(100), nullable=False)
+    role = db.Column(db.String(100), nullable=False)
+    days_of_week = db.Column(db.String(20), nullable=False)
+    start_time = db.Column(db.String(100), nullable=False)
+    end_time = db.Column(db.String(100), nullable=False)
+    start_date = db.Column(db.Date, nullable=False)
+    end_date = db.Column(db.Date)
+    comments = db.Column(db.String(100))
+    added_by_id = db.Column(db.Integer)
+    added_by_name = db.Column(db.String)
+
+
+# every change to a shift's status or who holds it, and every upload that changes its details, appended in the same
+# transaction as the change and never updated or deleted. id is the event's sequence number: AUTOINCREMENT never hands
+# out a number twice and SQLite only lets one transaction write at a time, so events are numbered in the order they
+# were committed. event_type is one of SHIFT_EVENT_TYPES, and status and picked_up_by_id are the shift's as they were
+# straight after the change
+class ShiftEvent(db.Model):
+    __table_args__ = (
+        # a shift's history, in order
+        db.Index('ix_shift_event_shift', 'shift_id', 'id'),
+        {'sqlite_autoincrement': True},
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    shift_id = db.Column(db.Integer, nullable=False)
+    event_type = db.Column(db.String(100), nullable=False)
+    status = db.Column(db.String(100))
+    picked_up_by_id = db.Column(db.Integer)
+    # the staff member who made the change, or None for changes made outside a request
+    actor_id = db.Column(db.Integer)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+
+# what can happen to a shift: posted (by an Admin or an upload), updated (its end time and comments changed by an
+# upsert upload while it's still up for grabs), claimed (accepted, waiting on approval), approved, denied (back up for
+# grabs), released (removed from whoever held it, back up for grabs) and assigned (given straight to a staff member, by
+# an Admin or auto-assignment)
+SHIFT_EVENT_TYPES = ['posted', 'updated', 'claimed', 'approved', 'denied', 'released', 'assigned']
+
+
+# shifts counted by the week they're on (week_start being its Monday), location, area and role, kept up to date as
+# shifts are posted, claimed, approved, denied and removed (see analytics.py) so the Coverage dashboard reads a row per
+# week instead of scanning every shift. posted counts the shifts posted and filled the ones held as Approved. claims
+# counts the requests staff made, and claim_seconds the time the shift had been up for grabs before each of the
+# timed_claims (the claims of shifts posted since the shift event log started). denied counts turned down requests
+class ShiftCoverage(db.Model):
+    __table_args__ = (
+        # the Coverage dashboard with a location filter
+        db.Index('ix_shift_coverage_location', 'location', 'week_start'),
+    )
+
+    week_start = db.Column(db.Date, primary_key=True)
+    location = db.Column(db.String(100), primary_key=True)
+    area = db.Column(db.String(100), primary_key=True)
+    role = db.Column(db.String(100), primary_key=True)
+    posted = db.Column(db.Integer, nullable=False, default=0)
+    filled = db.Column(db.Integer, nullable=False, default=0)
+    claims = db.Column(db.Integer, nullable=False, default=0)
+    timed_claims = db.Column(db.Integer, nullable=False, default=0)
+    claim_seconds = db.Column(db.Float, nullable=False, default=0.0)
+    denied = db.Column(db.Integer, nullable=False, default=0)
+
+
+# the Approved shifts each staff member holds, counted the same way as ShiftCoverage and kept up to date alongside it
+class StaffPickups(db.Model):
+    __table_args__ = (
+        # a staff member's pickups week by week
+        db.Index('ix_staff_pickups_user', 'user_id', 'week_start'),
+    )
+
+    week_start = db.Column(db.Date, primary_key=True)
+    location = db.Column(db.String(100), primary_key=True)
+    area = db.Column(db.String(100), primary_key=True)
+    role = db.Column(db.String(100), primary_key=True)
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    pickups = db.Column(db.Integer, nullable=False, default=0)
+
+
+# each staff member's StaffPickups added up over every week, location, area and role, kept up to date alongside it so
+# the all-time leaderboard reads its top rows straight off an index instead of adding up every staff member's weeks
+class StaffPickupTotals(db.Model):
+    __table_args__ = (
+        # the all-time leaderboard, most pickups first
+        db.Index('ix_staff_pickup_totals_pickups', 'pickups'),
+    )
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    pickups = db.Column(db.Integer, nullable=False, default=0)
+
+
+# notification emails waiting to be sent by the outbox worker (see the outbox-worker command), written in the same
+# transaction as the change they're about
+class EmailOutbox(db.Model):
+    __table_args__ = (db.Index('ix_email_outbox_due', 'status', 'next_attempt_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    to_addrs = db.Column(db.String(1000))
+    subject = db.Column(db.String(1000))
+    body = db.Column(db.Text)
+    status = db.Column(db.String(100), default='Pending')
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.String(1000))
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    next_attempt_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    sent_at = db.Column(db.DateTime)
+
+
+def get_user(user_id):
+    """
+    Returns the User with the given id (or None), loading each user at most once per request. Flask-Login's loader
+    fills this cache with the logged in user, so routes that need current_user's row get it without another query.
+    Ids are normalized to ints, so an id straight from the query string hits the same entry
+    """
+    try:
+        user_id = int(user_id)
+    except (TypeError, ValueError):
+        return None
+    users = g.setdefault('users', {})
+    if user_id not in users:
+        users[user_id] = User.query.get(user_id)
+    return users[user_id]
+
+
+def record_shift_events(event_type, condition, actor_id=None):
+    """
+    Appends an event_type ShiftEvent for each shift matching condition, with its status and picked_up_by_id as they
+    are now. Called after making the change and before committing it, and written with a single INSERT ... SELECT
+    however many shifts changed
+    """
+    recorded_at = datetime.datetime.utcnow()
+    changed_shifts = db.select([Shift.shift_id, sqlalchemy.literal(event_type), Shift.status, Shift.picked_up_by_id,
+                                sqlalchemy.literal(actor_id, db.Integer),
+                                sqlalchemy.literal(recorded_at, db.DateTime)]).where(condition).order_by(Shift.shift_id)
+    db.session.execute(ShiftEvent.__table__.insert().from_select(
+        ['shift_id', 'event_type', 'status', 'picked_up_by_id', 'actor_id', 'created_at'], changed_shifts))
+
+
+def find_user_by_email(email):
+    """
+    Looks up a user by email, ignoring case
+    """
+    return User.query.filter(func.lower(User.email) == (email or '').lower()).first()
+
+
+def parse_shift_time(text):
+    """
+    Reads a time entered like "8am", "7:30 PM" or "14:00", returning a datetime.time or None if it isn't a valid time
+    """
+    cleaned = re.sub(r'^(\d{1,2}:\d{2}):00', r'\1', (text or '').lower().replace(' ', ''))
+    match = re.match(TIME_PATTERN, cleaned)
+    if not match:
+        return None
+    hour, minute = int(match.group('hour')), int(match.group('minute') or 0)
+    if match.group('meridiem'):
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if match.group('meridiem') == 'pm' else 0)
+    if hour > 23 or minute > 59:
+        return None
+    return datetime.time(hour, minute)
+
+
+def format_shift_time(value):
+    """
+    Formats a datetime.time the way the app displays shift times, e.g. "8am" or "7:30pm"
+    """
+    minutes = f":{value.minute:02d}" if value.minute else ''
+    return f"{(value.hour + 11) % 12 + 1}{minutes}{'am' if value.hour < 12 else 'pm'}"
+
+
+def shift_datetimes(date, start_time, end_time):
+    """
+    Combines a shift's date with its start and end times, returning (start_at, end_at). A shift that ends at or before
+    the time it starts is taken to run past midnight into the next day
+    """
+    start_at = datetime.datetime.combine(date, start_time)
+    end_at = datetime.datetime.combine(date, end_time)
+    if end_at <= start_at:
+        end_at += datetime.timedelta(days=1)
+    return start_at, end_at
@@ -0,0 +1,51 @@
+from flask import Blueprint, current_app
+import click
+import time
+
+from models import db, EmailOutbox, get_user
+
+
+# the outbox worker command (flask outbox-worker), which has no pages of its own
+bp = Blueprint('outbox', __name__, cli_group=None)
+
+
+def queue_shift_email(accepted_shift, picked_up_by):
+    """
+    Adds the "your shift has been picked up" email for the shift's poster and the staff member picking it up to the
+    outbox. It's saved by the caller's commit along with the shift update, so the email goes out only if the pickup
+    does, and the outbox worker sends it without holding up the user's request
+    """
+    posted_by = get_user(accepted_shift.added_by_id)
+    contents = f"Your posted shift for {accepted_shift.date} at {accepted_shift.location} in the {accepted_shift.area} " \
+               f"area has been picked by: " \
+               f"{picked_up_by.name}\n" \
+               f"Please navigate to the application to approve or deny the {picked_up_by.name}'s request!\n\n" \
+                "From,\nYour trusty pals at iQueue"
+    db.session.add(EmailOutbox(
+        to_addrs=",".join([posted_by.email, picked_up_by.email]),
+        subject=f"Your {accepted_shift.date} shift has been picked up!!",
+        body=contents
+    ))
+
+
+@bp.cli.command('outbox-worker')
+@click.option('--once', is_flag=True, help='Send everything that is currently due and then exit.')
+@click.option('--poll-seconds', default=5.0, help='How long to wait before checking an empty outbox again.')
+def outbox_worker(once, poll_seconds):
+    """
+    Runs the background worker that sends the queued notification emails (flask outbox-worker)
+    """
+    # smtplib is only loaded by the worker, not by the web app
+    from mailer import OutboxMailer, drain_outbox
+    mailer = OutboxMailer(current_app.config)
+    try:
+        while True:
+            if drain_outbox(mailer) == current_app.config['OUTBOX_BATCH_SIZE']:
+                continue
+            # nothing else is due, so don't hold the SMTP connection open while idle
+            mailer.close()
+            if once:
+                break
+            time.sleep(poll_seconds)
+    finally:
+        mailer.close()
@@ -0,0 +1,174 @@
+from flask import request
+import sqlalchemy
+import sqlalchemy.orm
+
+import base64
+import datetime
+import json
+
+from models import db, User, Shift, ShiftArchive, MAX_SHIFT_HOURS
+
+
+# number of rows shown on each page of the Staff List and Shift List
+PAGE_SIZE = 50
+
+
+def overlapping_shifts_query(user_id, start_at, end_at):
+    """
+    The shifts the staff member already holds that overlap start_at to end_at. Because no shift is longer than
+    MAX_SHIFT_HOURS, only shifts starting within that window before start_at need checking, which keeps this a short
+    range scan on ix_shift_picked_up_by however long the staff member's history gets. It reads an alias of shift, so it
+    can also be used as a subquery of an UPDATE to shift
+    """
+    held = sqlalchemy.orm.aliased(Shift)
+    return db.session.query(held)\
+        .filter(held.picked_up_by_id == user_id,
+                held.start_at > start_at - datetime.timedelta(hours=MAX_SHIFT_HOURS),
+                held.start_at < end_at, held.end_at > start_at)
+
+
+def find_overlapping_shift(user_id, start_at, end_at):
+    """
+    Returns a shift the staff member already holds that overlaps start_at to end_at, or None
+    """
+    return overlapping_shifts_query(user_id, start_at, end_at).first()
+
+
+def encode_cursor(values):
+    """
+    Packs the sort key of the last row on a page into an opaque, URL-safe cursor string
+    """
+    return base64.urlsafe_b64encode(json.dumps(values, default=str).encode()).decode()
+
+
+def decode_cursor(cursor, order_columns):
+    """
+    Unpacks a cursor made by encode_cursor back into values for order_columns, or None if it isn't a valid cursor
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        if len(values) != len(order_columns):
+            return None
+        parsers = {db.Date: datetime.date.fromisoformat, db.DateTime: datetime.datetime.fromisoformat}
+        return [parsers.get(type(column.type), lambda unchanged: unchanged)(value)
+                for column, value in zip(order_columns, values)]
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_query(query, order_columns, cursor, page_size=PAGE_SIZE):
+    """
+    Limits a query to the page_size + 1 rows (sorted by order_columns) that come right after the row the cursor
+    points at. With an index on order_columns a page deep into the results costs the same as the first one, unlike
+    an OFFSET
+    """
+    values = decode_cursor(cursor, order_columns) if cursor else None
+    if values is not None:
+        query = query.filter(sqlalchemy.tuple_(*order_columns) > sqlalchemy.tuple_(
+            *[sqlalchemy.literal(value, column.type) for column, value in zip(order_columns, values)]))
+    return query.order_by(None).order_by(*order_columns).limit(page_size + 1)
+
+
+def keyset_page(query, order_columns, cursor, page_size=PAGE_SIZE):
+    """
+    Returns one page of a query sorted by order_columns (the last of which must be unique) along with the cursor for
+    the next page, or None on the last page
+    """
+    rows = keyset_query(query, order_columns, cursor, page_size).all()
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    return rows, encode_cursor([getattr(rows[-1], column.key) for column in order_columns])
+
+
+def feed_page(query, order_columns, since, page_size):
+    """
+    One page of a change feed: the rows after the since cursor (oldest first), the cursor to carry on from (since again
+    when there are none) and whether there are more waiting straight away
+    """
+    rows, next_cursor = keyset_page(query, order_columns, since, page_size=page_size)
+    more = next_cursor is not None
+    if not more:
+        next_cursor = encode_cursor([getattr(rows[-1], column.key) for column in order_columns]) if rows else since
+    return rows, next_cursor, more
+
+
+def parse_date_arg(name):
+    """
+    Reads a YYYY-MM-DD date from the query string, returning None if it's missing or not a valid date
+    """
+    try:
+        return datetime.date.fromisoformat(request.args.get(name, ''))
+    except ValueError:
+        return None
+
+
+def start_of_day(date):
+    """
+    Midnight at the start of the given date
+    """
+    return datetime.datetime.combine(date, datetime.time())
+
+
+def open_shifts_query(role, cur_date, location=None, end_date=None):
+    """
+    Unclaimed shifts from cur_date (up to end_date, if given) for staff in the given role (every role for Admins),
+    optionally at a single location. Backed by the ix_shift_open_board index
+    """
+    query = db.session.query(Shift).filter(Shift.picked_up_by_id == None, Shift.start_at >= start_of_day(cur_date))
+    if role != 'Admin':
+        query = query.filter(Shift.role == role)
+    if location:
+        query = query.filter(Shift.location == location)
+    if end_date:
+        query = query.filter(Shift.start_at < start_of_day(end_date + datetime.timedelta(days=1)))
+    return query.order_by(Shift.start_at, Shift.shift_id)
+
+
+def pending_requests_query(added_by_id, cur_date):
+    """
+    Shifts posted by added_by_id from cur_date onwards that are waiting on a pickup request to be approved or denied,
+    along with the name of the staff member requesting each one. Backed by the ix_shift_pending index
+    """
+    return db.session.query(Shift)\
+        .join(User, Shift.picked_up_by_id == User.id)\
+        .filter(Shift.status == 'Requested', Shift.start_at >= start_of_day(cur_date),
+                Shift.added_by_id == added_by_id)\
+        .order_by(Shift.start_at).with_entities(Shift.location, Shift.area, Shift.date, Shift.role,\
+                                                              Shift.start_time, Shift.end_time, Shift.comments,\
+                                                              Shift.shift_id, User.name)
+
+
+def live_and_archived_shifts(fields, condition):
+    """
+    The given fields of the shifts in both the shift and shift_archive tables that match condition (called with each
+    table's model), plus an "archived" flag. Filters and ordering on Shift columns apply to both halves, as long as
+    those columns are among the fields
+    """
+    live = db.session.query(*[getattr(Shift, field) for field in fields], sqlalchemy.literal(False).label('archived'))\
+        .filter(condition(Shift))
+    archived = db.session.query(*[getattr(ShiftArchive, field) for field in fields],
+                                sqlalchemy.literal(True).label('archived'))\
+        .filter(condition(ShiftArchive))
+    return live.union_all(archived)
+
+
+def user_shifts_query(user_id, fields):
+    """
+    The given fields of every shift a staff member has picked up, whether it's still in the shift table or has been
+    archived, in date order, plus an "archived" flag. fields has to include start_at (and shift_id, to page through
+    them). The two halves are backed by the ix_shift_picked_up_by and ix_shift_archive_picked_up_by indexes
+    """
+    return live_and_archived_shifts(fields, lambda table: table.picked_up_by_id == user_id).order_by(Shift.start_at)
+
+
+def shifts_between_query(start_date, end_date, fields):
+    """
+    The given fields of every shift, live or archived, starting from start_date through end_date, in date order, plus
+    an "archived" flag. fields has to include start_at and shift_id. Backed by the ix_shift_schedule and
+    ix_shift_archive_start indexes
+    """
+    window_start, window_end = start_of_day(start_date), start_of_day(end_date + datetime.timedelta(days=1))
+    return live_and_archived_shifts(fields, lambda table: sqlalchemy.and_(table.start_at >= window_start,
+                                                                          table.start_at < window_end))\
+        .order_by(Shift.start_at, Shift.shift_id)
@@ -0,0 +1,211 @@
+from flask import Blueprint, current_app, flash, redirect, render_template, request, url_for
+from flask_login import login_required, current_user
+import click
+import datetime
+import time
+from sqlalchemy import or_
+
+from cache import data_changed
+from forms import WEEKDAY_CHOICES, GenerateShiftsForm, ShiftTemplateForm
+from instrumentation import query_budget
+from models import db, Shift, ShiftTemplate, get_user, format_shift_time, parse_shift_time, shift_datetimes
+from shifts import post_new_shifts
+
+
+# recurring shifts: the Shift Templates page and the generate-shifts command, which post the shifts they describe
+bp = Blueprint('schedules', __name__, cli_group=None)
+
+# short day names for showing a template's days of the week, in weekday order
+WEEKDAY_NAMES = [name[:3] for _, name in WEEKDAY_CHOICES]
+
+
+def template_weekdays(template):
+    """
+    The weekday numbers (Monday is 0) a template posts a shift on
+    """
+    return sorted(int(day) for day in template.days_of_week.split(',') if day)
+
+
+def template_occurrences(template, first_day, last_day):
+    """
+    The dates from first_day through last_day that a template posts a shift on, in order
+    """
+    first_day = max(first_day, template.start_date)
+    if template.end_date is not None:
+        last_day = min(last_day, template.end_date)
+    days = []
+    for weekday in template_weekdays(template):
+        day = first_day + datetime.timedelta(days=(weekday - first_day.weekday()) % 7)
+        while day <= last_day:
+            days.append(day)
+            day += datetime.timedelta(days=7)
+    return sorted(days)
+
+
+def generate_shifts(first_day, last_day, location=None, actor_id=None):
+    """
+    Posts a shift for every day from first_day through last_day that a template (every one, or just location's) is
+    on, as posted by whoever added the template. Occurrences that have already started aren't posted, and ones that
+    have already been posted are skipped, so generating an overlapping range again only adds what's missing: days the
+    template has posted before (even if its times have been edited since) and shifts someone posted another way with
+    the same location, area, role and start. A day another run posts at the same time is skipped too, by
+    uq_shift_template_date. Returns (posted, skipped). Called before committing
+    """
+    templates = ShiftTemplate.query.filter(ShiftTemplate.start_date <= last_day,
+                                           or_(ShiftTemplate.end_date == None, ShiftTemplate.end_date >= first_day))
+    if location:
+        templates = templates.filter(ShiftTemplate.location == location)
+    templates = templates.order_by(ShiftTemplate.id).all()
+    if not templates:
+        return 0, 0
+
+    # read as plain rows rather than through the ORM, as there can be tens of thousands of them
+    already_posted = db.session.execute(
+        db.select([Shift.template_id, Shift.date, Shift.location, Shift.area, Shift.role, Shift.start_at])
+        .where(Shift.location.in_({template.location for template in templates}))
+        .where(Shift.date.between(first_day, last_day))
+        .where(Shift.area.in_({template.area for template in templates}))).fetchall()
+    template_days, posted_keys = set(), set()
+    for template_id, date, location, area, role, start_at in already_posted:
+        if template_id is not None:
+            template_days.add((template_id, date))
+        posted_keys.add((location, area, role, start_at))
+
+    new_shifts, skipped = [], 0
+    now = datetime.datetime.now()
+    for template in templates:
+        start_time, end_time = parse_shift_time(template.start_time), parse_shift_time(template.end_time)
+        # the columns every one of the template's shifts shares, read off the template once rather than for every day
+        template_shift = {
+            'location': template.location, 'role': template.role, 'area': template.area,
+            'start_time': template.start_time, 'end_time': template.end_time, 'added_by_id': template.added_by_id,
+            'added_by_name': template.added_by_name, 'comments': template.comments, 'status': 'Posted',
+            'template_id': template.id,
+        }
+        key_prefix = (template.location, template.area, template.role)
+        for day in template_occurrences(template, first_day, last_day):
+            start_at, end_at = shift_datetimes(day, start_time, end_time)
+            if start_at <= now:
+                continue
+            key = key_prefix + (start_at,)
+            if (template_shift['template_id'], day) in template_days or key in posted_keys:
+                skipped += 1
+                continue
+            posted_keys.add(key)
+            new_shifts.append(dict(template_shift, date=day, start_at=start_at, end_at=end_at))
+
+    # in time order, so that SQLite's writes to the indexes on start_at land together
+    new_shifts.sort(key=lambda shift: shift['start_at'])
+    posted = len(post_new_shifts(new_shifts, actor_id, skip_existing=True))
+    return posted, skipped + len(new_shifts) - posted
+
+
+@bp.route('/shifttemplates', methods=['GET', 'POST'])
+@login_required
+@query_budget(4)
+def shift_templates():
+    """
+    Lists the recurring shift templates, with the forms for adding a template and for posting the templates' shifts
+    through a date. Only Admins can manage templates
+    """
+    if get_user(current_user.id).role != 'Admin':
+        flash('Only Admins can manage shift templates.')
+        return redirect(url_for('shifts.shift'))
+    template_form = ShiftTemplateForm(prefix='template')
+    generate_form = GenerateShiftsForm(prefix='generate')
+    if template_form.validate_on_submit():
+        start_time = parse_shift_time(template_form.start_time.data)
+        end_time = parse_shift_time(template_form.end_time.data)
+        for field, value in [(template_form.start_time, start_time), (template_form.end_time, end_time)]:
+            if value is None:
+                field.errors = ['Enter a time like 8am or 7:30pm']
+        end_date = template_form.end_date.data
+        if end_date is not None and end_date < template_form.start_date.data:
+            template_form.end_date.errors = ["The last day can't be before the first"]
+        if start_time is not None and end_time is not None and not template_form.end_date.errors:
+            db.session.add(ShiftTemplate(
+                location=template_form.location.data,
+                area=template_form.area.data,
+                role=template_form.role.data,
+                days_of_week=','.join(str(day) for day in sorted(template_form.days_of_week.data)),
+                start_time=format_shift_time(start_time),
+                end_time=format_shift_time(end_time),
+                start_date=template_form.start_date.data,
+                end_date=end_date,
+                comments=template_form.comments.data,
+                added_by_id=current_user.id,
+                added_by_name=get_user(current_user.id).name
+            ))
+            db.session.commit()
+            flash('Template added. Post its shifts below.')
+            return redirect(url_for('schedules.shift_templates'))
+    if generate_form.end_date.data is None:
+        generate_form.end_date.data = datetime.date.today() + datetime.timedelta(
+            days=current_app.config['SCHEDULE_HORIZON_DAYS'])
+
+    templates = ShiftTemplate.query.order_by(ShiftTemplate.location, ShiftTemplate.area, ShiftTemplate.role,
+                                             ShiftTemplate.id).all()
+    return render_template('shift_templates.html', templates=templates, weekday_names=WEEKDAY_NAMES,
+                           template_weekdays=template_weekdays, template_form=template_form,
+                           generate_form=generate_form, logged_in=True)
+
+
+@bp.route('/shifttemplates/generate', methods=['POST'])
+@login_required
+def post_template_shifts():
+    """
+    Posts the templates' shifts from today through the date chosen on the Shift Templates page, skipping any that
+    have already been posted. Only Admins can post them
+    """
+    if get_user(current_user.id).role != 'Admin':
+        flash('Only Admins can manage shift templates.')
+        return redirect(url_for('shifts.shift'))
+    generate_form = GenerateShiftsForm(prefix='generate')
+    if not generate_form.validate_on_submit():
+        flash('Choose the last day to post shifts through.')
+        return redirect(url_for('schedules.shift_templates'))
+    started_at = time.perf_counter()
+    posted, skipped = generate_shifts(datetime.date.today(), generate_form.end_date.data, actor_id=current_user.id)
+    if posted:
+        data_changed()
+    db.session.commit()
+    flash(f"Posted {posted} shifts through {generate_form.end_date.data} and skipped {skipped} that were already "
+          f"posted, in {time.perf_counter() - started_at:.2f} seconds.")
+    return redirect(url_for('schedules.shift_templates'))
+
+
+@bp.route('/shifttemplates/remove', methods=['POST'])
+@login_required
+@query_budget(4)
+def remove_template():
+    """
+    Deletes a shift template so no more shifts are posted from it. The shifts it has already posted are kept
+    """
+    if get_user(current_user.id).role != 'Admin':
+        flash('Only Admins can manage shift templates.')
+        return redirect(url_for('shifts.shift'))
+    ShiftTemplate.query.filter_by(id=request.form.get('id', type=int)).delete()
+    db.session.commit()
+    return redirect(url_for('schedules.shift_templates'))
+
+
+@bp.cli.command('generate-shifts')
+@click.option('--days', type=click.IntRange(min=0),
+              help='Post shifts this many days ahead of today (SCHEDULE_HORIZON_DAYS by default).')
+@click.option('--location', help="Only post the shifts of this hospital's templates.")
+def generate_shifts_command(days, location):
+    """
+    Posts the shift templates' shifts from today through SCHEDULE_HORIZON_DAYS ahead (flask generate-shifts), skipping
+    any that have already been posted. Meant to be run every night, e.g. from cron:
+    "30 3 * * * cd /srv/staffing && flask generate-shifts"
+    """
+    days = current_app.config['SCHEDULE_HORIZON_DAYS'] if days is None else days
+    first_day = datetime.date.today()
+    last_day = first_day + datetime.timedelta(days=days)
+    started_at = time.perf_counter()
+    posted, skipped = generate_shifts(first_day, last_day, location)
+    if posted:
+        data_changed()
+    db.session.commit()
+    click.echo(f"Posted {posted} shifts through {last_day} and skipped {skipped} that were already posted, in "
+               f"{time.perf_counter() - started_at:.2f} seconds")
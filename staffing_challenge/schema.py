@@ -0,0 +1,233 @@
+from flask import Blueprint
+import click
+import datetime
+import sqlalchemy
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from invites import redact_invite_links
+from models import db, User, Shift, DataVersion, EmailOutbox, ShiftCoverage, ShiftEvent, StaffPickups, StaffPickupTotals
+from queries import encode_cursor, keyset_query, open_shifts_query, pending_requests_query, start_of_day, \
+    user_shifts_query
+
+
+# commands for creating, upgrading and checking the database (flask create-db, upgrade-db and explain-queries)
+bp = Blueprint('schema', __name__, cli_group=None)
+
+
+@bp.cli.command('create-db')
+def create_db():
+    """
+    Creates the database and the tables used in the db's model, skipping tables that already exist (flask create-db).
+    Use upgrade-db to bring the columns and indexes of an existing database up to date
+    """
+    db.create_all()
+    add_data_version()
+    click.echo("The database tables have been created")
+
+
+def add_data_version():
+    """
+    Adds the DataVersion row if the database doesn't have one yet. Returns True if it was added
+    """
+    if DataVersion.query.first() is not None:
+        return False
+    db.session.add(DataVersion(id=1))
+    db.session.commit()
+    return True
+
+
+def existing_index_names(table_name):
+    """
+    Names of the indexes that already exist on a table. SQLite's PRAGMA is used directly because SQLAlchemy's
+    reflection skips expression indexes such as uq_user_email
+    """
+    if db.engine.dialect.name == 'sqlite':
+        return {row[1] for row in db.session.execute(f'PRAGMA index_list("{table_name}")')}
+    return {index['name'] for index in sqlalchemy.inspect(db.engine).get_indexes(table_name)}
+
+
+def index_columns_changed(index):
+    """
+    Whether an existing SQLite index covers different columns than the model now declares for it. Expression indexes
+    and other databases are taken to be unchanged
+    """
+    if db.engine.dialect.name != 'sqlite' or \
+            not all(isinstance(expression, sqlalchemy.Column) for expression in index.expressions):
+        return False
+    declared = [expression.name for expression in index.expressions]
+    return declared != [row[2] for row in db.session.execute(f'PRAGMA index_info("{index.name}")')]
+
+
+def backfill_shift_times(batch_size=5000):
+    """
+    Fills in start_at/end_at for shifts saved before those columns existed by parsing their date and start/end time
+    text, a batch at a time. Returns how many shifts were filled in and how many have times that couldn't be read
+    """
+    import pandas as pd
+    from importers import parse_shift_times, shift_datetime_columns
+    filled, unreadable, last_id = 0, 0, 0
+    while True:
+        rows = db.session.query(Shift.shift_id, Shift.date, Shift.start_time, Shift.end_time)\
+            .filter(Shift.start_at == None, Shift.shift_id > last_id)\
+            .order_by(Shift.shift_id).limit(batch_size).all()
+        if not rows:
+            return filled, unreadable
+        last_id = rows[-1].shift_id
+        batch = pd.DataFrame(rows, columns=['shift_id', 'date', 'start_time', 'end_time'])
+        batch['start_at'], batch['end_at'] = shift_datetime_columns(
+            batch['date'], parse_shift_times(batch['start_time'].astype('string')),
+            parse_shift_times(batch['end_time'].astype('string')))
+        readable = batch[batch['start_at'].notna() & batch['end_at'].notna()]
+        db.session.bulk_update_mappings(Shift, readable[['shift_id', 'start_at', 'end_at']].to_dict('records'))
+        db.session.commit()
+        filled += len(readable)
+        unreadable += len(batch) - len(readable)
+
+
+def redact_sent_invites():
+    """
+    Redacts the invite links in emails that were sent (or given up on) before the outbox worker started doing so
+    itself. Returns how many emails were redacted
+    """
+    redacted = 0
+    for sent_email in EmailOutbox.query.filter(EmailOutbox.status.in_(['Sent', 'Failed']),
+                                               EmailOutbox.body.like('%/invite/%')):
+        body = redact_invite_links(sent_email.body)
+        if body != sent_email.body:
+            sent_email.body = body
+            redacted += 1
+    db.session.commit()
+    return redacted
+
+
+def upgrade_schema():
+    """
+    Brings an existing database up to date with the models, since db.create_all() only creates missing tables. Missing
+    tables are created, missing columns are added (as plain nullable columns, which is all SQLite's ALTER TABLE
+    allows), missing or changed indexes are (re)created, shift times are backfilled, new coverage tables are filled in
+    and sent invite emails are redacted. Returns a list of the changes made and a list of the indexes that could not
+    be created because the existing data breaks their uniqueness
+    """
+    changes, problems = [], []
+    existing_tables = set(sqlalchemy.inspect(db.engine).get_table_names())
+    db.create_all()
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            changes.append(f"created table {table.name}")
+            continue
+
+        existing_columns = {column['name'] for column in sqlalchemy.inspect(db.engine).get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing_columns:
+                column_type = column.type.compile(dialect=db.engine.dialect)
+                db.session.execute(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}')
+                db.session.commit()
+                changes.append(f"added column {table.name}.{column.name}")
+
+        existing_indexes = existing_index_names(table.name)
+        for index in table.indexes:
+            if index.name in existing_indexes:
+                if not index_columns_changed(index):
+                    continue
+                index.drop(bind=db.engine)
+            try:
+                index.create(bind=db.engine)
+                changes.append(f"created index {index.name}")
+            except IntegrityError as error:
+                problems.append(f"could not create unique index {index.name}: {error.orig}")
+
+    if add_data_version():
+        changes.append("added the data version row")
+    if {ShiftCoverage.__tablename__, StaffPickupTotals.__tablename__} - existing_tables:
+        from analytics import rebuild_analytics
+        coverage_rows, pickup_rows = rebuild_analytics()
+        changes.append(f"counted {coverage_rows} coverage rows and {pickup_rows} pickup rows")
+    filled, unreadable = backfill_shift_times()
+    if filled:
+        changes.append(f"filled in start_at/end_at for {filled} shifts")
+    if unreadable:
+        problems.append(f"{unreadable} shifts have start or end times that couldn't be read, fix them by hand")
+    redacted = redact_sent_invites()
+    if redacted:
+        changes.append(f"redacted the invite links in {redacted} sent emails")
+    return changes, problems
+
+
+@bp.cli.command('upgrade-db')
+def upgrade_db():
+    """
+    Applies any new tables, columns and indexes to an existing database (flask upgrade-db)
+    """
+    changes, problems = upgrade_schema()
+    for change in changes:
+        click.echo(change)
+    for problem in problems:
+        click.echo(problem, err=True)
+    if not changes and not problems:
+        click.echo("The database is already up to date")
+    if problems:
+        raise SystemExit(1)
+
+
+def hot_queries():
+    """
+    The queries behind the app's busiest pages, checked by the explain-queries command
+    """
+    cur_date = datetime.date.today()
+    return {
+        '/shift (staff)': open_shifts_query('RN', cur_date),
+        '/shift (admin)': open_shifts_query('Admin', cur_date),
+        '/shift (next page)': keyset_query(open_shifts_query('RN', cur_date), [Shift.start_at, Shift.shift_id],
+                                           encode_cursor([start_of_day(cur_date), 1])),
+        '/acceptshift (double booking)': Shift.query.filter(
+            Shift.picked_up_by_id == 1, Shift.start_at > start_of_day(cur_date) - datetime.timedelta(hours=24),
+            Shift.start_at < start_of_day(cur_date), Shift.end_at > start_of_day(cur_date)),
+        '/staff (next page)': keyset_query(User.query.filter(User.role != 'Admin'), [User.name, User.id],
+                                           encode_cursor(['Smith', 1])),
+        '/pendingrequests': pending_requests_query(1, cur_date),
+        '/userdetails': user_shifts_query(1, ['shift_id', 'start_at']),
+        '/login': User.query.filter(func.lower(User.email) == 'someone@example.com'),
+        '/api/v1/shift-events (staff)': keyset_query(
+            ShiftEvent.query.join(Shift, Shift.shift_id == ShiftEvent.shift_id).filter(Shift.role == 'RN'),
+            [ShiftEvent.id], encode_cursor([0])),
+        '/coverage': ShiftCoverage.query.filter(ShiftCoverage.week_start.between(cur_date, cur_date),
+                                                ShiftCoverage.location == 'Hospital 1'),
+        '/coverage (pickups)': StaffPickups.query.join(User, User.id == StaffPickups.user_id)
+        .filter(StaffPickups.week_start.between(cur_date, cur_date)),
+        '/coverage (all-time pickups)': StaffPickupTotals.query.order_by(StaffPickupTotals.pickups.desc()).limit(50),
+        'generate-shifts (already posted)': Shift.query.filter(Shift.location.in_(['Hospital 1']),
+                                                              Shift.date.between(cur_date, cur_date)),
+    }
+
+
+def explain_query(query):
+    """
+    Returns the rows of SQLite's EXPLAIN QUERY PLAN for a query
+    """
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = [compiled.params[name] for name in compiled.positiontup]
+    connection = db.engine.raw_connection()
+    try:
+        return connection.execute('EXPLAIN QUERY PLAN ' + str(compiled), params).fetchall()
+    finally:
+        connection.close()
+
+
+@bp.cli.command('explain-queries')
+def explain_queries():
+    """
+    Prints the query plan for each of the hot queries and exits with an error if any of them scans a whole table
+    instead of using an index (flask explain-queries)
+    """
+    full_scans = []
+    for name, query in hot_queries().items():
+        click.echo(name)
+        for row in explain_query(query):
+            detail = row[-1]
+            click.echo(f"    {detail}")
+            if detail.startswith('SCAN') and 'INDEX' not in detail:
+                full_scans.append(f"{name}: {detail}")
+    if full_scans:
+        click.echo("Queries doing full table scans:\n    " + "\n    ".join(full_scans), err=True)
+        raise SystemExit(1)
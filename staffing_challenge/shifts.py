@@ -0,0 +1,498 @@
+from flask import Blueprint, render_template, request, url_for, redirect, flash
+from flask_login import login_required, current_user
+import sqlalchemy
+from sqlalchemy import func
+
+import datetime
+import time
+from collections import Counter, namedtuple
+
+from analytics import count_claim, count_shift_changes, counted_shifts
+from cache import cached, conditional_get, data_changed, render_fragment
+from forms import ROLE_CHOICES, ShiftForm, AutoAssignForm
+from database import read_only
+from instrumentation import query_budget
+from models import db, User, Shift, MAX_SHIFT_HOURS, NEXT_DATA_VERSION, get_user, format_shift_time, parse_shift_time, \
+    record_shift_events, shift_datetimes
+from outbox import queue_shift_email
+from queries import PAGE_SIZE, find_overlapping_shift, keyset_page, open_shifts_query, overlapping_shifts_query, \
+    parse_date_arg, pending_requests_query, start_of_day
+
+
+# the Shift List, posting shifts, and picking up, approving, denying, removing and auto-assigning them
+bp = Blueprint('shifts', __name__)
+
+# what post_new_shifts reads back about each shift it posts: its id, the fields its coverage is counted by and its key
+PostedShift = namedtuple('PostedShift', ['shift_id', 'date', 'location', 'area', 'role', 'start_at', 'picked_up_by_id'])
+# most shift ids put in one IN (...) when recording the events for a batch of auto-assigned shifts (and their
+# coverage), and most runs of ids in one statement when recording the events for posted shifts
+EVENT_RECORD_BATCH_SIZE = 500
+
+
+@bp.route('/shift', methods=['GET', 'POST'])
+@login_required
+@query_budget(3)
+@read_only
+@conditional_get
+def shift():
+    """
+    Will query the available shifts matching the selected filters and populate the available shifts view a page at a
+    time. Staff only ever see shifts for their own role, Admins can filter by any role
+    """
+    cur_role = get_user(current_user.id).role
+    cur_date = datetime.date.today()
+    filters = {name: request.args[name] for name in ['role', 'location', 'start_date', 'end_date']
+               if request.args.get(name)}
+    board_role = filters.get('role', cur_role) if cur_role == 'Admin' else cur_role
+    start_date = max(parse_date_arg('start_date') or cur_date, cur_date)
+    board_page = (board_role, start_date, filters.get('location'), parse_date_arg('end_date'),
+                  request.args.get('after'))
+    rows, next_cursor = cached(('open_shift_rows',) + board_page, lambda: open_shift_rows(*board_page))
+    return render_template('shifts.html', rows=rows, filters=filters, next_cursor=next_cursor,
+                           roles=[role for role in ROLE_CHOICES if role != 'Admin'], logged_in=True, user=current_user)
+
+
+def open_shift_rows(role, start_date, location, end_date, cursor):
+    """
+    The rendered rows of one page of the Shift List and the cursor for the next page. Everyone in the same role looking
+    at the same page gets the same rows, so they're cached and shared between requests
+    """
+    available_shifts = open_shifts_query(role, start_date, location=location, end_date=end_date)\
+        .with_entities(Shift.shift_id, Shift.location, Shift.role, Shift.area, Shift.date, Shift.start_time,
+                       Shift.end_time, Shift.start_at, Shift.comments, Shift.added_by_name)
+    shift_page, next_cursor = keyset_page(available_shifts, [Shift.start_at, Shift.shift_id], cursor)
+    return render_fragment('shift_rows.html', shifts=shift_page), next_cursor
+
+
+def shift_form_datetimes(shift_form):
+    """
+    Reads the date and start/end times from a ShiftForm, returning (start_at, end_at). If any of them can't be read the
+    problem is attached to the form field so it shows on the form, and None is returned
+    """
+    start_time = parse_shift_time(shift_form.start_time.data)
+    end_time = parse_shift_time(shift_form.end_time.data)
+    for field, value in [(shift_form.start_time, start_time), (shift_form.end_time, end_time)]:
+        if value is None:
+            field.errors = ['Enter a time like 8am or 7:30pm']
+    if shift_form.date.data is None:
+        shift_form.date.errors = ['Enter a valid date']
+    if start_time is None or end_time is None or shift_form.date.data is None:
+        return None
+    return shift_datetimes(shift_form.date.data, start_time, end_time)
+
+
+@bp.route('/addshift', methods=['GET', 'POST'])
+@login_required
+@query_budget(6)
+def add_shift():
+    """
+    When not received from a "POST" type request, the user will be taken to the Add Shift form. When the user completes
+    that form, this function will store the input of the form and populate the shifts view with the data
+    """
+    shift_form = ShiftForm()
+    cur_user_name = get_user(current_user.id).name
+    if request.method == "POST":
+        shift_times = shift_form_datetimes(shift_form)
+        if shift_times is None:
+            return render_template("add_shift.html", form=shift_form, logged_in=True, current_user=current_user)
+        start_at, end_at = shift_times
+        new_shift = Shift(
+            location=shift_form.location.data,
+            role=shift_form.role.data,
+            area=shift_form.area.data,
+            date=shift_form.date.data,
+            start_time=format_shift_time(start_at.time()),
+            end_time=format_shift_time(end_at.time()),
+            start_at=start_at,
+            end_at=end_at,
+            added_by_id=current_user.id,
+            added_by_name=cur_user_name,
+            comments=shift_form.comments.data,
+            status='Posted'
+        )
+
+        db.session.add(new_shift)
+        db.session.flush()
+        record_shift_events('posted', Shift.shift_id == new_shift.shift_id, current_user.id)
+        count_shift_changes([new_shift], posted=1)
+        data_changed()
+        db.session.commit()
+
+        return redirect(url_for('shifts.shift'))
+
+    return render_template("add_shift.html", form=shift_form, logged_in=True, current_user=current_user)
+
+
+@bp.route('/addusershift', methods=['GET', 'POST'])
+@login_required
+@query_budget(13)
+def add_shift_for_user():
+    """
+    When not received from a "POST" type request, the user will be taken to the Add Shift form. When the user completes
+    that form, this function will store the input of the form and populate the shifts view with the data
+    """
+    shift_form_for_user = ShiftForm()
+    cur_user_name = get_user(current_user.id).name
+    user_id = request.args.get('id')
+    user_info = get_user(user_id)
+    if request.method == "POST":
+        shift_times = shift_form_datetimes(shift_form_for_user)
+        if shift_times is not None and find_overlapping_shift(user_id, *shift_times):
+            shift_form_for_user.start_time.errors = [f"{user_info.name} is already booked for an overlapping shift"]
+            shift_times = None
+        if shift_times is None:
+            return render_template("add_shift_staff.html", form=shift_form_for_user, logged_in=True,
+                                   current_user=current_user, user=user_info)
+        start_at, end_at = shift_times
+
+        new_shift = Shift(
+            location=shift_form_for_user.location.data,
+            role=shift_form_for_user.role.data,
+            area=shift_form_for_user.area.data,
+            date=shift_form_for_user.date.data,
+            start_time=format_shift_time(start_at.time()),
+            end_time=format_shift_time(end_at.time()),
+            start_at=start_at,
+            end_at=end_at,
+            added_by_id=current_user.id,
+            added_by_name=cur_user_name,
+            picked_up_by_id=user_id,
+            comments=shift_form_for_user.comments.data,
+            status='Approved'
+
+        )
+        db.session.add(new_shift)
+        db.session.flush()
+        record_shift_events('assigned', Shift.shift_id == new_shift.shift_id, current_user.id)
+        count_shift_changes([new_shift], posted=1, filled=1, pickups=1)
+        adjust_shifts_worked(user_id, 1)
+        data_changed()
+        db.session.commit()
+
+        return redirect(url_for('staff.staff'))
+
+    return render_template("add_shift_staff.html", form=shift_form_for_user, logged_in=True, current_user=current_user,
+                           user=user_info)
+
+
+def adjust_shifts_worked(user_id, change):
+    """
+    Adds change to a staff member's shifts_worked count inside the database (treating a missing count as 0), so
+    concurrent requests can't overwrite each other's update the way a read-modify-write in Python can
+    """
+    User.query.filter(User.id == user_id)\
+        .update({User.shifts_worked: func.coalesce(User.shifts_worked, 0) + change}, synchronize_session=False)
+
+
+def claim_shift(shift_id, user_id, start_at=None, end_at=None):
+    """
+    Claims a posted shift for a user with a single conditional UPDATE that only matches while the shift is still
+    unclaimed, so when several people accept the same shift at once exactly one of them gets it. Given the shift's
+    start_at and end_at, the same UPDATE also only matches while the user holds no shift overlapping it, so two
+    overlapping shifts accepted at once can't both be booked. Returns True if this user's claim succeeded
+    """
+    query = Shift.query.filter(Shift.shift_id == shift_id, Shift.picked_up_by_id == None, Shift.status == 'Posted')
+    if start_at is not None:
+        query = query.filter(~overlapping_shifts_query(user_id, start_at, end_at).exists())
+    claimed = query.update({Shift.picked_up_by_id: user_id, Shift.status: 'Requested'}, synchronize_session=False)
+    if claimed:
+        adjust_shifts_worked(user_id, 1)
+    return claimed == 1
+
+
+def release_shift(shift_id, user_id, statuses=None):
+    """
+    Puts a shift held by user_id back up for grabs and takes it off that user's shifts_worked count. Like claim_shift
+    this is a conditional UPDATE, so the shift is only released if that user still holds it (and, when statuses is
+    given, it's in one of those statuses). Returns True if the shift was released
+    """
+    query = Shift.query.filter(Shift.shift_id == shift_id, Shift.picked_up_by_id == user_id)
+    if statuses:
+        query = query.filter(Shift.status.in_(statuses))
+    released = query.update({Shift.picked_up_by_id: None, Shift.status: 'Posted'}, synchronize_session=False)
+    if released:
+        adjust_shifts_worked(user_id, -1)
+    return released == 1
+
+
+@bp.route('/acceptshift', methods=['GET', 'POST'])
+@login_required
+@query_budget(12)
+@read_only
+def accept_shift():
+    if request.method == "POST":
+        # Claim the shift for the user accepting it, unless they're already booked for an overlapping shift or
+        # someone else got to it first. Both are checked by the claim's UPDATE itself, so the lookup afterwards only
+        # picks which one to tell them about
+        cur_shift_id = request.form["id"]
+        shift_to_accept = Shift.query.get(cur_shift_id)
+        start_at, end_at = shift_to_accept.start_at, shift_to_accept.end_at
+        if not claim_shift(cur_shift_id, current_user.id, start_at, end_at):
+            db.session.rollback()
+            if start_at and find_overlapping_shift(current_user.id, start_at, end_at):
+                flash("You're already booked for a shift that overlaps this one.")
+            else:
+                flash('Sorry, this shift has already been picked up by someone else.')
+            return render_template("accept_shift.html", shift=shift_to_accept, logged_in=True), 409
+        count_claim(shift_to_accept)
+        record_shift_events('claimed', Shift.shift_id == cur_shift_id, current_user.id)
+        queue_shift_email(shift_to_accept, get_user(current_user.id))
+        data_changed()
+        db.session.commit()
+        return redirect(url_for('shifts.shift'))
+
+    shift_id = request.args.get('id')
+    cur_shift = Shift.query.get(shift_id)
+    return render_template("accept_shift.html", shift=cur_shift, logged_in=True)
+
+
+@bp.route('/removeshift', methods=['GET', 'POST'])
+@login_required
+@query_budget(12)
+@read_only
+def remove_shift():
+    if request.method == "POST":
+        # Update shift record with info about the shift being removed
+        cur_shift_id = request.form["id"]
+        shift_to_update = Shift.query.get(cur_shift_id)
+        cur_user = get_user(current_user.id)
+        if cur_user.role == 'Admin' or shift_to_update.picked_up_by_id == current_user.id:
+            if shift_to_update.picked_up_by_id is None:
+                # nobody holds the shift, so there's nothing to release
+                return redirect(url_for('staff.staff'))
+            if release_shift(cur_shift_id, shift_to_update.picked_up_by_id):
+                record_shift_events('released', Shift.shift_id == cur_shift_id, current_user.id)
+                # shift_to_update was loaded before the release, so it still has the old status and holder
+                if shift_to_update.status == 'Approved':
+                    count_shift_changes([shift_to_update], filled=-1, pickups=-1)
+                data_changed()
+                db.session.commit()
+            return redirect(url_for('staff.staff'))
+        else:
+            flash('You do not have permission to remove this shift!')
+            return render_template("remove_shift.html", shift=shift_to_update, logged_in=True, permission=False)
+
+    shift_id = request.args.get('id')
+    cur_shift = Shift.query.get(shift_id)
+    return render_template("remove_shift.html", shift=cur_shift, logged_in=True, permission=True)
+
+
+@bp.route('/approverequest', methods=['GET', 'POST'])
+@login_required
+@query_budget(11)
+@read_only
+def approve_request():
+    if request.method == "POST":
+        cur_shift_id = request.form["id"]
+        approved = Shift.query.filter(Shift.shift_id == cur_shift_id, Shift.status == 'Requested')\
+            .update({Shift.status: 'Approved'}, synchronize_session=False)
+        if approved:
+            record_shift_events('approved', Shift.shift_id == cur_shift_id, current_user.id)
+            count_shift_changes(counted_shifts(Shift.shift_id == cur_shift_id), filled=1, pickups=1)
+            data_changed()
+            db.session.commit()
+        return redirect(url_for('shifts.pending_requests'))
+
+    shift_id = request.args.get('id')
+    cur_shift = Shift.query.get(shift_id)
+    return render_template("approve_request.html", shift=cur_shift, logged_in=True)
+
+
+@bp.route('/denyrequest', methods=['GET', 'POST'])
+@login_required
+@query_budget(8)
+@read_only
+def deny_request():
+    if request.method == "POST":
+        cur_shift_id = request.form["id"]
+        shift_to_update = Shift.query.get(cur_shift_id)
+        if release_shift(cur_shift_id, shift_to_update.picked_up_by_id, statuses=['Requested']):
+            record_shift_events('denied', Shift.shift_id == cur_shift_id, current_user.id)
+            count_shift_changes([shift_to_update], denied=1)
+            data_changed()
+            db.session.commit()
+        return redirect(url_for('shifts.pending_requests'))
+
+    shift_id = request.args.get('id')
+    cur_shift = Shift.query.get(shift_id)
+    return render_template("deny_request.html", shift=cur_shift, logged_in=True)
+
+
+@bp.route('/pendingrequests', methods=['GET', 'POST'])
+@login_required
+@query_budget(3)
+@read_only
+@conditional_get
+def pending_requests():
+    cur_date = datetime.date.today()
+    rows = cached(('pending_request_rows', current_user.id, cur_date),
+                  lambda: render_fragment('pending_request_rows.html',
+                                          shifts=pending_requests_query(current_user.id, cur_date)))
+    return render_template('pending_requests.html', rows=rows, logged_in=True, user=current_user)
+
+
+def minutes_since_epoch(datetimes):
+    """
+    Converts a list of datetimes into an int64 array of minutes, the time format the assignment engine works in
+    """
+    import numpy as np
+    return np.array(datetimes, dtype='datetime64[m]').astype(np.int64)
+
+
+def load_assignment_inputs(start_date, end_date):
+    """
+    Reads what the assignment engine needs for a date range: the open shifts, the available non-Admin staff and every
+    booking that could overlap one of those shifts
+    """
+    import numpy as np
+    window_start = start_of_day(start_date)
+    window_end = start_of_day(end_date + datetime.timedelta(days=1))
+    open_shifts = db.session.query(Shift.shift_id, Shift.role, Shift.location, Shift.start_at, Shift.end_at)\
+        .filter(Shift.picked_up_by_id == None, Shift.status == 'Posted',
+                Shift.start_at >= window_start, Shift.start_at < window_end).all()
+    available_staff = db.session.query(User.id, User.role, User.location, User.can_float, User.shifts_worked)\
+        .filter(User.role != 'Admin', User.availability == 'Yes').all()
+    bookings = db.session.query(Shift.picked_up_by_id, Shift.start_at, Shift.end_at)\
+        .filter(Shift.start_at > window_start - datetime.timedelta(hours=MAX_SHIFT_HOURS),
+                Shift.start_at < window_end, Shift.picked_up_by_id != None).all()
+
+    shifts = {
+        'shift_id': np.array([row.shift_id for row in open_shifts], dtype=np.int64),
+        'role': [row.role for row in open_shifts],
+        'location': [row.location for row in open_shifts],
+        'start': minutes_since_epoch([row.start_at for row in open_shifts]),
+        'end': minutes_since_epoch([row.end_at for row in open_shifts]),
+    }
+    staff = {
+        'staff_id': np.array([row.id for row in available_staff], dtype=np.int64),
+        'role': [row.role for row in available_staff],
+        'location': [row.location for row in available_staff],
+        'can_float': np.array([row.can_float == 'Yes' for row in available_staff], dtype=bool),
+        'shifts_worked': np.array([row.shifts_worked or 0 for row in available_staff], dtype=np.float64),
+    }
+    booked = {
+        'staff_id': np.array([row.picked_up_by_id for row in bookings], dtype=np.int64),
+        'start': minutes_since_epoch([row.start_at for row in bookings]),
+        'end': minutes_since_epoch([row.end_at for row in bookings]),
+    }
+    return shifts, staff, booked
+
+
+def id_ranges(ids):
+    """
+    Sorted ids as a list of (first, last) runs of consecutive ids
+    """
+    ranges = []
+    for shift_id in ids:
+        if ranges and ranges[-1][1] == shift_id - 1:
+            ranges[-1][1] = shift_id
+        else:
+            ranges.append([shift_id, shift_id])
+    return [tuple(run) for run in ranges]
+
+
+def post_new_shifts(rows, actor_id, skip_existing=False):
+    """
+    Inserts a shift for each dict of column values in rows (all with the same columns) with a single executemany
+    INSERT, then records a "posted" event for each new shift and counts it as posted. The new shifts' ids are read back
+    with one SELECT keyed on their location, area, role and start_at (which no two rows may share), among the shifts
+    numbered after the last one before the INSERT and written in this transaction's data version, so neither shifts
+    that were already there nor ones another transaction committed in the meantime are mistaken for them. With
+    skip_existing, a row that would break a unique index (uq_shift_template_date, when another run of the same
+    template got there first) is left out instead of failing the transaction. Returns the new shifts' ids. Called
+    before committing
+    """
+    if not rows:
+        return []
+    last_shift_id = db.session.query(func.coalesce(func.max(Shift.shift_id), 0)).scalar()
+    insert = Shift.__table__.insert()
+    if skip_existing:
+        insert = insert.prefix_with('OR IGNORE')
+    db.session.execute(insert, rows)
+
+    keys = {(row['location'], row['area'], row['role'], row['start_at']) for row in rows}
+    # read as plain rows rather than through the ORM, as there can be tens of thousands of them, and each turned into a
+    # PostedShift once, as a result row converts a column's value again every time it's read
+    written = db.session.execute(
+        db.select([getattr(Shift, field) for field in PostedShift._fields])
+        .where(Shift.shift_id > last_shift_id).where(Shift.data_version == NEXT_DATA_VERSION)
+        .order_by(Shift.shift_id))
+    new_shifts = [shift for shift in (PostedShift(*row) for row in written)
+                  if (shift.location, shift.area, shift.role, shift.start_at) in keys]
+    new_shift_ids = [shift.shift_id for shift in new_shifts]
+    # an INSERT numbers its rows one after another, so the new shifts are a few runs of ids rather than thousands
+    ranges = id_ranges(new_shift_ids)
+    for batch_start in range(0, len(ranges), EVENT_RECORD_BATCH_SIZE):
+        batch = sqlalchemy.or_(*[Shift.shift_id.between(first, last)
+                                 for first, last in ranges[batch_start:batch_start + EVENT_RECORD_BATCH_SIZE]])
+        record_shift_events('posted', batch, actor_id)
+    count_shift_changes(new_shifts, posted=1)
+    return new_shift_ids
+
+
+def apply_assignments(shift_ids, staff_ids, actor_id):
+    """
+    Hands each shift to its assigned staff member as an Approved shift, records an "assigned" event for it, counts it
+    as filled and adds the shifts to their shifts_worked counts. Like claim_shift, each assignment is a conditional
+    UPDATE, so a shift someone picked up since the plan was made is left alone. Returns how many shifts were assigned
+    """
+    shift_table, user_table = Shift.__table__, User.__table__
+    assign = shift_table.update()\
+        .where(sqlalchemy.and_(shift_table.c.shift_id == sqlalchemy.bindparam('assigned_shift_id'),
+                               shift_table.c.picked_up_by_id == None, shift_table.c.status == 'Posted'))\
+        .values(picked_up_by_id=sqlalchemy.bindparam('assigned_staff_id'), status='Approved')
+    assigned, assigned_shift_ids = Counter(), []
+    for shift_id, staff_id in zip(shift_ids.tolist(), staff_ids.tolist()):
+        if db.session.execute(assign, {'assigned_shift_id': shift_id, 'assigned_staff_id': staff_id}).rowcount:
+            assigned[staff_id] += 1
+            assigned_shift_ids.append(shift_id)
+    for batch_start in range(0, len(assigned_shift_ids), EVENT_RECORD_BATCH_SIZE):
+        batch = Shift.shift_id.in_(assigned_shift_ids[batch_start:batch_start + EVENT_RECORD_BATCH_SIZE])
+        record_shift_events('assigned', batch, actor_id)
+        count_shift_changes(counted_shifts(batch), filled=1, pickups=1)
+    if assigned:
+        db.session.execute(
+            user_table.update().where(user_table.c.id == sqlalchemy.bindparam('assigned_staff_id'))
+            .values(shifts_worked=func.coalesce(user_table.c.shifts_worked, 0) + sqlalchemy.bindparam('assigned')),
+            [{'assigned_staff_id': staff_id, 'assigned': count} for staff_id, count in assigned.items()])
+    return sum(assigned.values())
+
+
+@bp.route('/autoassign', methods=['GET', 'POST'])
+@login_required
+def auto_assign():
+    """
+    Lets an Admin fill the open shifts in a date range automatically instead of picking people one shift at a time.
+    Previewing shows the proposed assignments without saving anything, and assigning re-runs the same matching on the
+    current data and saves it
+    """
+    cur_user = get_user(current_user.id)
+    if cur_user.role != 'Admin':
+        flash('Only Admins can auto-assign shifts.')
+        return redirect(url_for('shifts.shift'))
+
+    assign_form = AutoAssignForm()
+    if not assign_form.validate_on_submit():
+        return render_template('auto_assign.html', form=assign_form, logged_in=True)
+
+    # the assignment engine needs NumPy, which is only loaded once an Admin actually runs it
+    from assignment import assign_shifts
+    started_at = time.perf_counter()
+    shifts, staff, bookings = load_assignment_inputs(assign_form.start_date.data, assign_form.end_date.data)
+    shift_ids, staff_ids = assign_shifts(shifts, staff, bookings)
+    seconds = time.perf_counter() - started_at
+
+    if assign_form.commit.data:
+        assigned = apply_assignments(shift_ids, staff_ids, current_user.id)
+        data_changed()
+        db.session.commit()
+        flash(f"Assigned {assigned} of {len(shifts['shift_id'])} open shifts in {seconds:.2f} seconds.")
+        return redirect(url_for('shifts.auto_assign'))
+
+    # only the first page of the plan is shown, the counts cover all of it
+    preview_ids = dict(zip(shift_ids[:PAGE_SIZE].tolist(), staff_ids[:PAGE_SIZE].tolist()))
+    preview_shifts = Shift.query.filter(Shift.shift_id.in_(list(preview_ids))).order_by(Shift.start_at).all()
+    staff_names = dict(db.session.query(User.id, User.name).filter(User.id.in_(list(set(preview_ids.values())))))
+    plan = [(preview_shift, staff_names[preview_ids[preview_shift.shift_id]]) for preview_shift in preview_shifts]
+    return render_template('auto_assign.html', form=assign_form, plan=plan, planned=len(shift_ids),
+                           open_shifts=len(shifts['shift_id']), seconds=seconds, logged_in=True)
@@ -0,0 +1,165 @@
+from flask import Blueprint, render_template, request, url_for, redirect, flash
+from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
+
+from cache import cached, conditional_get, data_changed, render_fragment
+from forms import UserForm
+from database import read_only
+from instrumentation import query_budget
+from invites import issue_invite
+from models import db, User, get_user, find_user_by_email
+from queries import keyset_page, user_shifts_query
+
+
+# the Staff List and the pages for adding, editing and looking at staff members
+bp = Blueprint('staff', __name__)
+
+# the shift fields shown on a staff member's user details
+USER_SHIFT_FIELDS = ['shift_id', 'location', 'role', 'area', 'date', 'start_time', 'end_time', 'start_at', 'comments',
+                     'status', 'added_by_name']
+
+
+@bp.route('/staff', methods=['GET', 'POST'])
+@login_required
+@query_budget(5)
+@read_only
+@conditional_get
+def staff():
+    """
+    Will query non-Admin staff matching the selected filters and populate the staff list view a page at a time
+    """
+    filters = {name: request.args[name] for name in ['role', 'location', 'availability', 'can_float']
+               if request.args.get(name)}
+    after = request.args.get('after')
+    rows, next_cursor = cached(('staff_rows', tuple(sorted(filters.items())), after),
+                               lambda: staff_rows(filters, after))
+    roles, locations = cached('staff_facets', staff_facets)
+    return render_template('staff.html', rows=rows, roles=roles, locations=locations, filters=filters,
+                           next_cursor=next_cursor, logged_in=True, user=current_user)
+
+
+def staff_rows(filters, cursor):
+    """
+    The rendered rows of one page of the Staff List and the cursor for the next page
+    """
+    staff_query = db.session.query(User).filter(User.role != 'Admin').filter_by(**filters)
+    staff_page, next_cursor = keyset_page(staff_query, [User.name, User.id], cursor)
+    return render_fragment('staff_rows.html', staff=staff_page), next_cursor
+
+
+def staff_facets():
+    """
+    The sorted roles (other than Admin) and locations that the Staff List can be filtered by
+    """
+    role_list = db.session.query(User.role.distinct().label("roles"))
+    roles = [row.roles for row in role_list.all() if row.roles != 'Admin']
+    roles.sort()
+    location_list = db.session.query(User.location.distinct().label("locations"))
+    locations = [row.locations for row in location_list.all()]
+    locations.sort()
+    return roles, locations
+
+
+@bp.route('/adduser', methods=['GET', 'POST'])
+@login_required
+@query_budget(5)
+def add_user():
+    """
+    When not received from a "POST" type request, the user will be taken to the Add User form. When the user completes
+    that form, this function will store the input of the form and populate the staff list view with the data, and the
+    new staff member is sent an invite to set their password
+    """
+    user_form = UserForm()
+    cur_user_name = get_user(current_user.id).name
+    if request.method == "POST":
+        if find_user_by_email(user_form.email.data):
+            user_form.email.errors = ['A staff member with this email already exists']
+            return render_template("add_user.html", form=user_form, logged_in=True, current_user=current_user)
+        new_user = User(
+            name=user_form.name.data,
+            role=user_form.role.data,
+            location=user_form.location.data,
+            email=user_form.email.data,
+            phone_num=user_form.phone_num.data,
+            availability=user_form.availability.data,
+            can_float=user_form.can_float.data
+        )
+        # they're emailed a link to set their own password (nothing is hashed until they do)
+        issue_invite(new_user)
+
+        db.session.add(new_user)
+        data_changed()
+        db.session.commit()
+
+        return redirect(url_for('staff.staff'))
+
+    return render_template("add_user.html", form=user_form, logged_in=True, current_user=current_user)
+
+
+@bp.route('/edituser', methods=['GET', 'POST'])
+@login_required
+@query_budget(4)
+@read_only
+def edit_user():
+    if request.method == "POST":
+        user_id = request.form["id"]
+        user_to_update = get_user(user_id)
+        user_to_update.name = request.form["name"]
+        user_to_update.role = request.form["role"]
+        user_to_update.location = request.form["location"]
+        user_to_update.email = request.form["email"]
+        user_to_update.phone_num = request.form["phone_num"]
+        user_to_update.availability = request.form["availability"]
+        user_to_update.can_float = request.form["can_float"]
+        try:
+            data_changed()
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            flash('Another staff member already has that email, please use a different one.')
+            return render_template('edit_user.html', user=get_user(user_id), logged_in=True)
+        return redirect(url_for('staff.staff'))
+    user_id = request.args.get('id')
+    user_info = get_user(user_id)
+    return render_template('edit_user.html', user=user_info, logged_in=True)
+
+
+@bp.route('/sendinvite', methods=['POST'])
+@login_required
+@query_budget(5)
+def send_invite():
+    """
+    Sends a staff member a new invite to set their password, e.g. when the last one expired, replacing any earlier
+    invite. Only Admins can send invites, and only to staff who haven't set a password yet
+    """
+    user_id = request.form["id"]
+    if get_user(current_user.id).role != 'Admin':
+        flash('Only Admins can send invites.')
+        return redirect(url_for('staff.edit_user', id=user_id))
+    user_to_invite = get_user(user_id)
+    if user_to_invite.password is not None:
+        flash(f"{user_to_invite.name} has already set a password.")
+        return redirect(url_for('staff.edit_user', id=user_id))
+    issue_invite(user_to_invite)
+    db.session.commit()
+    flash(f"An invite has been sent to {user_to_invite.email}.")
+    return redirect(url_for('staff.edit_user', id=user_id))
+
+
+@bp.route('/userdetails', methods=['GET', 'POST'])
+@login_required
+@query_budget(4)
+@read_only
+@conditional_get
+def user_details():
+    shift_user_id = request.args.get('id', type=int)
+    user_name, rows = cached(('user_shift_rows', shift_user_id), lambda: user_shift_rows(shift_user_id))
+    return render_template('user_shifts.html', rows=rows, user_name=user_name, user_id=shift_user_id, logged_in=True)
+
+
+def user_shift_rows(user_id):
+    """
+    A staff member's name and the rendered rows of every shift they've picked up
+    """
+    return get_user(user_id).name, render_fragment('user_shift_rows.html',
+                                                   shifts=user_shifts_query(user_id, USER_SHIFT_FIELDS))
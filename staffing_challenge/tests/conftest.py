@@ -0,0 +1,99 @@
+import datetime
+import smtplib
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from app import create_app
+from cache import data_changed
+from models import db, User, Shift
+from schema import add_data_version
+
+
+# every seeded staff member logs in with this password
+PASSWORD = 'password123'
+# staff seeded alongside the Admin, enough for several to race for the same shift
+STAFF_COUNT = 8
+
+
+def make_app(db_path, **config):
+    """
+    The app on its own SQLite file, created and seeded with an Admin, STAFF_COUNT RNs and a week of open shifts posted
+    by the Admin starting tomorrow
+    """
+    app = create_app(dict({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'READ_DATABASE_URL': None,
+        'TESTING': True,
+        'WTF_CSRF_ENABLED': False,
+        'CACHE_TTL_SECONDS': 0,
+    }, **config))
+    with app.app_context():
+        db.create_all()
+        add_data_version()
+        # hashing is slow on purpose, so everyone shares one hash
+        password = generate_password_hash(PASSWORD, method='pbkdf2:sha256', salt_length=8)
+        admin = User(name='Admin', role='Admin', location='Hospital 1', email='admin@example.com', phone_num='1',
+                     availability='Yes', can_float='Yes', password=password, shifts_worked=0)
+        db.session.add(admin)
+        db.session.add_all([User(name=f'Nurse {number}', role='RN', location='Hospital 1',
+                                 email=f'nurse{number}@example.com', phone_num='1', availability='Yes',
+                                 can_float='Yes', password=password, shifts_worked=0)
+                            for number in range(STAFF_COUNT)])
+        db.session.flush()
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        for days in range(7):
+            day = tomorrow + datetime.timedelta(days=days)
+            start_at = datetime.datetime.combine(day, datetime.time(7))
+            db.session.add(Shift(location='Hospital 1', role='RN', area='ICU', date=day, start_time='7:00 AM',
+                                 end_time='7:00 PM', start_at=start_at, end_at=start_at + datetime.timedelta(hours=12),
+                                 added_by_id=admin.id, added_by_name=admin.name, status='Posted'))
+        # like every change made through the app, so the seeded shifts aren't newer than the data version
+        data_changed()
+        db.session.commit()
+    return app
+
+
+def log_in(app, email):
+    """
+    A test client logged in as the staff member with this email
+    """
+    client = app.test_client()
+    response = client.post('/login', data={'email': email, 'password': PASSWORD})
+    assert response.status_code == 302, f"couldn't log in as {email}"
+    return client
+
+
+def close_app(app):
+    """
+    Closes the app's database connections, so the test's SQLite file can be removed
+    """
+    with app.app_context():
+        db.session.remove()
+        db.get_engine(app).dispose()
+        db.get_engine(app, bind='read').dispose()
+
+
+class RecordingMailer:
+    """
+    Stands in for OutboxMailer, keeping the messages it's given instead of sending them, or failing every send
+    """
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.sent = []
+
+    def send(self, message):
+        if self.fail:
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent.append(message)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path / 'staffing.db')
+    yield app
+    close_app(app)
@@ -0,0 +1,122 @@
+import datetime
+import io
+
+import pytest
+
+from analytics import rebuild_analytics, week_start
+from archive import archive_shifts_before
+from conftest import log_in
+from models import db, User, Shift, ShiftCoverage, StaffPickups, StaffPickupTotals
+from queries import start_of_day
+
+
+def summary_tables(app):
+    """
+    Every row of ShiftCoverage, StaffPickups and StaffPickupTotals, leaving out rows that have been counted back down
+    to nothing (the counts kept as shifts change never delete a row, a rebuild only writes the ones it needs)
+    """
+    with app.app_context():
+        coverage = {(row.week_start, row.location, row.area, row.role):
+                    (row.posted, row.filled, row.claims, row.timed_claims, row.denied, row.claim_seconds)
+                    for row in ShiftCoverage.query if (row.posted, row.filled, row.claims, row.denied) != (0, 0, 0, 0)}
+        pickups = {(row.week_start, row.location, row.area, row.role, row.user_id): row.pickups
+                   for row in StaffPickups.query if row.pickups}
+        totals = {row.user_id: row.pickups for row in StaffPickupTotals.query if row.pickups}
+    return coverage, pickups, totals
+
+
+def assert_counts_match_a_rebuild(app):
+    coverage, pickups, totals = summary_tables(app)
+    with app.app_context():
+        rebuild_analytics()
+    rebuilt_coverage, rebuilt_pickups, rebuilt_totals = summary_tables(app)
+    assert pickups == rebuilt_pickups
+    assert totals == rebuilt_totals
+    assert coverage.keys() == rebuilt_coverage.keys()
+    for key, counts in coverage.items():
+        # a claim's time up for grabs is measured up to the moment it's counted, and the rebuild measures it up to its
+        # event, a few microseconds later
+        assert counts[:5] == rebuilt_coverage[key][:5], key
+        assert counts[5] == pytest.approx(rebuilt_coverage[key][5], abs=1)
+
+
+def shift_id_on(app, days_ahead):
+    with app.app_context():
+        day = datetime.date.today() + datetime.timedelta(days=days_ahead)
+        return Shift.query.filter_by(date=day, area='ICU').one().shift_id
+
+
+def test_counts_kept_as_shifts_change_match_a_rebuild(app):
+    with app.app_context():
+        nurse = User.query.filter_by(email='nurse5@example.com').one()
+        for days_ago in [200, 120, 3]:
+            start_at = start_of_day(datetime.date.today() - datetime.timedelta(days=days_ago)) + \
+                datetime.timedelta(hours=7)
+            db.session.add(Shift(location='Hospital 1', role='RN', area='ICU', date=start_at.date(), start_time='7am',
+                                 end_time='7pm', start_at=start_at, end_at=start_at + datetime.timedelta(hours=12),
+                                 status='Approved', picked_up_by_id=nurse.id, added_by_name='Admin'))
+        db.session.commit()
+        # the seeded shifts went straight into the database, so they're counted by a rebuild to start with
+        rebuild_analytics()
+
+    admin, nurse0, nurse1 = [log_in(app, f'{name}@example.com') for name in ['admin', 'nurse0', 'nurse1']]
+    later = (datetime.date.today() + datetime.timedelta(days=20)).isoformat()
+    assert admin.post('/addshift', data={'location': 'Hospital 2', 'role': 'CRNA', 'area': 'OR', 'date': later,
+                                         'start_time': '7am', 'end_time': '3pm', 'comments': ''}).status_code == 302
+    with app.app_context():
+        nurse2_id = User.query.filter_by(email='nurse2@example.com').one().id
+    assert admin.post(f'/addusershift?id={nurse2_id}', data={
+        'location': 'Hospital 2', 'role': 'RN', 'area': 'ER', 'date': later, 'start_time': '7am', 'end_time': '7pm',
+        'comments': ''}).status_code == 302
+
+    # claimed, denied, claimed again and approved
+    first = shift_id_on(app, 1)
+    for client, path in [(nurse0, '/acceptshift'), (admin, '/denyrequest'), (nurse0, '/acceptshift'),
+                         (admin, '/approverequest')]:
+        assert client.post(path, data={'id': first}).status_code == 302
+    # approved and then given up, and a request still waiting
+    second, third = shift_id_on(app, 2), shift_id_on(app, 3)
+    for client, path, shift_id in [(nurse1, '/acceptshift', second), (admin, '/approverequest', second),
+                                   (nurse1, '/removeshift', second), (nurse1, '/acceptshift', third)]:
+        assert client.post(path, data={'id': shift_id}).status_code == 302
+
+    # the rest of the week assigned automatically
+    window = {'start_date': (datetime.date.today() + datetime.timedelta(days=4)).isoformat(),
+              'end_date': (datetime.date.today() + datetime.timedelta(days=7)).isoformat()}
+    assert admin.post('/autoassign', data=dict(window, commit='Assign Shifts')).status_code == 302
+    # posted from a file and from a template
+    response = admin.post('/shift_upload', content_type='multipart/form-data', data={
+        'shifts-file': (io.BytesIO(f'location,role,area,date,start_time,end_time,comments\n'
+                                   f'Hospital 3,Scrub Tech,OR,{later},7am,7pm,\n'.encode()), 'shifts.csv'),
+        'shifts-mode': 'insert'})
+    assert response.status_code == 200
+    template_start = datetime.date.today() + datetime.timedelta(days=30)
+    assert admin.post('/shifttemplates', data={
+        'template-location': 'Hospital 1', 'template-role': 'RN', 'template-area': 'PACU',
+        'template-days_of_week': ['0', '3'], 'template-start_time': '7am', 'template-end_time': '7pm',
+        'template-start_date': template_start.isoformat(), 'template-comments': ''}).status_code == 302
+    assert admin.post('/shifttemplates/generate', data={
+        'generate-end_date': (template_start + datetime.timedelta(days=21)).isoformat()}).status_code == 302
+    # archived shifts are still counted
+    with app.app_context():
+        assert archive_shifts_before(start_of_day(datetime.date.today() - datetime.timedelta(days=90)),
+                                     batch_size=1) == 2
+
+    assert_counts_match_a_rebuild(app)
+    coverage, pickups, totals = summary_tables(app)
+    with app.app_context():
+        nurse_ids = {user.email: user.id for user in User.query}
+    # every filled shift is someone's pickup: the 3 worked before, the one assigned by hand, the first shift, and the
+    # 4 auto-assigned
+    assert sum(totals.values()) == sum(counts[1] for counts in coverage.values()) == 9
+    assert totals[nurse_ids['nurse2@example.com']] >= 1 and totals[nurse_ids['nurse5@example.com']] >= 3
+    # the first shift was claimed twice and denied once
+    first_week = (week_start(datetime.date.today() + datetime.timedelta(days=1)), 'Hospital 1', 'ICU', 'RN')
+    assert coverage[first_week][2] >= 2 and sum(counts[4] for counts in coverage.values()) == 1
+
+
+def test_rebuild_of_an_empty_database_writes_nothing(app):
+    with app.app_context():
+        Shift.query.delete()
+        db.session.commit()
+        assert rebuild_analytics() == (0, 0)
@@ -0,0 +1,100 @@
+import datetime
+import gzip
+import json
+
+import api
+from conftest import log_in
+from models import Shift
+
+
+def shift_dicts(body):
+    return [dict(zip(body['fields'], values)) for values in body['shifts']]
+
+
+def changes(client, since):
+    response = client.get('/api/v1/shifts/changes', query_string={'since': since})
+    assert response.status_code == 200
+    body = response.get_json()
+    return shift_dicts(body), body['cursor'], body['more']
+
+
+def first_shift_id(app):
+    with app.app_context():
+        return Shift.query.order_by(Shift.start_at).first().shift_id
+
+
+def post_shift(admin, role, days_ahead=10):
+    day = datetime.date.today() + datetime.timedelta(days=days_ahead)
+    response = admin.post('/addshift', data={'location': 'Hospital 1', 'role': role, 'area': 'ER',
+                                             'date': day.isoformat(), 'start_time': '7am', 'end_time': '7pm',
+                                             'comments': ''})
+    assert response.status_code == 302
+
+
+def test_change_feed_follows_a_shift_from_claim_to_approval(app):
+    staff = log_in(app, 'nurse0@example.com')
+    board = staff.get('/api/v1/shifts').get_json()
+    assert len(board['shifts']) == 7 and board['next'] is None
+    cursor = board['changes']
+    # nothing has changed since the board was loaded, and polling again doesn't move the cursor
+    assert changes(staff, cursor) == ([], cursor, False)
+
+    shift_id = first_shift_id(app)
+    assert log_in(app, 'nurse1@example.com').post('/acceptshift', data={'id': shift_id}).status_code == 302
+    changed, cursor, more = changes(staff, cursor)
+    assert [(shift['shift_id'], shift['status']) for shift in changed] == [(shift_id, 'Requested')]
+    assert changed[0]['picked_up_by_id'] is not None and not more
+    assert changes(staff, cursor)[0] == []
+
+    admin = log_in(app, 'admin@example.com')
+    assert admin.post('/approverequest', data={'id': shift_id}).status_code == 302
+    changed, cursor, _ = changes(staff, cursor)
+    assert [(shift['shift_id'], shift['status']) for shift in changed] == [(shift_id, 'Approved')]
+
+
+def test_change_feed_only_has_the_staff_members_role(app):
+    staff, admin = log_in(app, 'nurse0@example.com'), log_in(app, 'admin@example.com')
+    staff_cursor = staff.get('/api/v1/shifts').get_json()['changes']
+    admin_cursor = admin.get('/api/v1/shifts').get_json()['changes']
+    post_shift(admin, 'CRNA')
+    post_shift(admin, 'RN')
+    assert [shift['role'] for shift in changes(staff, staff_cursor)[0]] == ['RN']
+    assert sorted(shift['role'] for shift in changes(admin, admin_cursor)[0]) == ['CRNA', 'RN']
+
+
+def test_change_feed_pages_through_a_burst_of_changes(app, monkeypatch):
+    monkeypatch.setattr(api, 'CHANGES_PAGE_SIZE', 2)
+    staff, admin = log_in(app, 'nurse0@example.com'), log_in(app, 'admin@example.com')
+    cursor = staff.get('/api/v1/shifts').get_json()['changes']
+    for days_ahead in range(10, 15):
+        post_shift(admin, 'RN', days_ahead)
+    seen, more = [], True
+    while more:
+        changed, cursor, more = changes(staff, cursor)
+        assert len(changed) <= 2
+        seen.extend(shift['shift_id'] for shift in changed)
+    assert len(seen) == len(set(seen)) == 5
+
+
+def test_change_feed_rejects_a_bad_cursor(app):
+    staff = log_in(app, 'nurse0@example.com')
+    for since in ['', 'nonsense']:
+        response = staff.get('/api/v1/shifts/changes', query_string={'since': since})
+        assert response.status_code == 400
+        assert 'since must be a cursor' in response.get_json()['error']
+
+
+def test_large_responses_are_gzipped_for_clients_that_accept_it(app):
+    staff = log_in(app, 'nurse0@example.com')
+    plain = staff.get('/api/v1/shifts')
+    assert 'Content-Encoding' not in plain.headers
+    zipped = staff.get('/api/v1/shifts', headers={'Accept-Encoding': 'gzip'})
+    assert zipped.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in zipped.headers['Vary']
+    assert len(zipped.get_data()) < len(plain.get_data())
+    assert json.loads(gzip.decompress(zipped.get_data())) == plain.get_json()
+    # a response smaller than API_GZIP_MIN_BYTES isn't worth compressing
+    small = staff.get('/api/v1/me', headers={'Accept-Encoding': 'gzip'})
+    assert len(small.get_data()) < app.config['API_GZIP_MIN_BYTES']
+    assert 'Content-Encoding' not in small.headers
+    assert small.get_json()['email'] == 'nurse0@example.com'
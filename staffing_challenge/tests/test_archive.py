@@ -0,0 +1,90 @@
+import datetime
+
+import archive
+from archive import archive_shifts_before
+from conftest import log_in
+from models import db, User, Shift, ShiftArchive
+from queries import start_of_day, user_shifts_query
+
+
+def add_worked_shifts(app, email, days_ago):
+    """
+    Approved shifts held by the staff member, one starting at 7am the given number of days ago for each of days_ago
+    """
+    with app.app_context():
+        nurse = User.query.filter_by(email=email).one()
+        for days in days_ago:
+            start_at = start_of_day(datetime.date.today() - datetime.timedelta(days=days)) + datetime.timedelta(hours=7)
+            db.session.add(Shift(location='Hospital 1', role='RN', area=f'Past {days}', date=start_at.date(),
+                                 start_time='7am', end_time='7pm', start_at=start_at,
+                                 end_at=start_at + datetime.timedelta(hours=12), status='Approved',
+                                 picked_up_by_id=nurse.id, added_by_name='Admin'))
+        db.session.commit()
+        return nurse.id
+
+
+def cutoff(days):
+    return start_of_day(datetime.date.today() - datetime.timedelta(days=days))
+
+
+def test_old_shifts_are_archived_in_batches(app, monkeypatch):
+    add_worked_shifts(app, 'nurse0@example.com', [200, 150, 120, 100, 95, 91, 10])
+    batches, move_shift_batch = [], archive.move_shift_batch
+
+    def counting_move(*args):
+        moved = move_shift_batch(*args)
+        batches.append(moved)
+        return moved
+    monkeypatch.setattr(archive, 'move_shift_batch', counting_move)
+    with app.app_context():
+        assert archive_shifts_before(cutoff(90), batch_size=4) == 6
+        assert batches == [4, 2]
+        # oldest first
+        assert [shift.area for shift in ShiftArchive.query.order_by(ShiftArchive.start_at)] == \
+            ['Past 200', 'Past 150', 'Past 120', 'Past 100', 'Past 95', 'Past 91']
+        assert all(shift.archived_at is not None and shift.status == 'Approved' for shift in ShiftArchive.query)
+        assert Shift.query.filter(Shift.start_at < cutoff(90)).count() == 0
+        assert Shift.query.filter_by(area='Past 10').count() == 1
+        # running it again has nothing left to move
+        assert archive_shifts_before(cutoff(90), batch_size=4) == 0
+
+
+def test_newest_shift_is_never_archived(app):
+    add_worked_shifts(app, 'nurse0@example.com', [200, 150])
+    with app.app_context():
+        newest_id = db.session.query(db.func.max(Shift.shift_id)).scalar()
+        assert archive_shifts_before(cutoff(90), batch_size=10) == 1
+        assert Shift.query.get(newest_id).area == 'Past 150'
+
+
+def test_archive_command_uses_the_configured_horizon(app):
+    add_worked_shifts(app, 'nurse0@example.com', [200, 100, 40, 30])
+    app.config['ARCHIVE_AFTER_DAYS'] = 120
+    result = app.test_cli_runner().invoke(args=['archive-shifts', '--pause-seconds', '0'])
+    assert 'Archived 1 shifts' in result.output
+    result = app.test_cli_runner().invoke(args=['archive-shifts', '--days', '35', '--batch-size', '1',
+                                                '--pause-seconds', '0'])
+    assert 'Archived 2 shifts' in result.output
+    with app.app_context():
+        assert ShiftArchive.query.count() == 3
+
+
+def test_history_reads_live_and_archived_shifts_together(app):
+    nurse_id = add_worked_shifts(app, 'nurse0@example.com', [200, 150, 100, 60, 10, 5])
+    add_worked_shifts(app, 'nurse1@example.com', [180])
+    with app.app_context():
+        archive_shifts_before(cutoff(90), batch_size=2)
+        history = user_shifts_query(nurse_id, ['shift_id', 'area', 'start_at']).all()
+        assert [(shift.area, shift.archived) for shift in history] == [
+            ('Past 200', True), ('Past 150', True), ('Past 100', True), ('Past 60', False), ('Past 10', False),
+            ('Past 5', False)]
+
+    admin = log_in(app, 'admin@example.com')
+    page = admin.get(f'/userdetails?id={nurse_id}').get_data(as_text=True)
+    assert all(f'Past {days}' in page for days in [200, 150, 100, 60, 10, 5])
+    assert 'Past 180' not in page
+    # the API pages through both tables in date order
+    staff = log_in(app, 'nurse0@example.com')
+    body = staff.get(f'/api/v1/users/{nurse_id}/shifts').get_json()
+    assert [dict(zip(body['fields'], values))['area'] for values in body['shifts']] == \
+        ['Past 200', 'Past 150', 'Past 100', 'Past 60', 'Past 10', 'Past 5']
@@ -0,0 +1,111 @@
+import datetime
+
+import numpy as np
+
+from assignment import assign_shifts
+from conftest import log_in
+from models import db, User, Shift, ShiftEvent
+
+# minutes in an hour, the engine's times being minutes
+HOUR = 60
+
+
+def shift_arrays(*shifts):
+    """
+    The engine's shift arrays from (shift_id, role, location, start hour, length in hours) tuples
+    """
+    return {'shift_id': np.array([shift[0] for shift in shifts], dtype=np.int64),
+            'role': [shift[1] for shift in shifts], 'location': [shift[2] for shift in shifts],
+            'start': np.array([shift[3] * HOUR for shift in shifts], dtype=np.int64),
+            'end': np.array([(shift[3] + shift[4]) * HOUR for shift in shifts], dtype=np.int64)}
+
+
+def staff_arrays(*staff):
+    """
+    The engine's staff arrays from (staff_id, role, location, can_float, shifts_worked) tuples
+    """
+    return {'staff_id': np.array([member[0] for member in staff], dtype=np.int64),
+            'role': [member[1] for member in staff], 'location': [member[2] for member in staff],
+            'can_float': np.array([member[3] for member in staff], dtype=bool),
+            'shifts_worked': np.array([member[4] for member in staff], dtype=np.float64)}
+
+
+def booking_arrays(*bookings):
+    """
+    The engine's booking arrays from (staff_id, start hour, length in hours) tuples
+    """
+    return {'staff_id': np.array([booking[0] for booking in bookings], dtype=np.int64),
+            'start': np.array([booking[1] * HOUR for booking in bookings], dtype=np.int64),
+            'end': np.array([(booking[1] + booking[2]) * HOUR for booking in bookings], dtype=np.int64)}
+
+
+def assignments(shifts, staff, bookings=None, **options):
+    shift_ids, staff_ids = assign_shifts(shifts, staff, bookings or booking_arrays(), **options)
+    return dict(zip(shift_ids.tolist(), staff_ids.tolist()))
+
+
+def test_only_staff_in_the_shifts_role_are_assigned():
+    plan = assignments(shift_arrays((1, 'CRNA', 'Hospital 1', 7, 12), (2, 'RN', 'Hospital 1', 7, 12)),
+                       staff_arrays((10, 'RN', 'Hospital 1', True, 0), (11, 'RN', 'Hospital 1', True, 0)))
+    assert 1 not in plan
+    assert plan[2] in (10, 11)
+
+
+def test_staff_only_leave_their_hospital_if_they_can_float():
+    shifts = shift_arrays((1, 'RN', 'Hospital 2', 7, 12))
+    assert assignments(shifts, staff_arrays((10, 'RN', 'Hospital 1', False, 0))) == {}
+    assert assignments(shifts, staff_arrays((10, 'RN', 'Hospital 1', True, 0))) == {1: 10}
+    # someone at the hospital is preferred to a floater, unless they've worked more than FLOAT_PENALTY more shifts
+    assert assignments(shifts, staff_arrays((10, 'RN', 'Hospital 1', True, 0), (11, 'RN', 'Hospital 2', False, 1))) \
+        == {1: 11}
+    assert assignments(shifts, staff_arrays((10, 'RN', 'Hospital 1', True, 0), (11, 'RN', 'Hospital 2', False, 3))) \
+        == {1: 10}
+
+
+def test_staff_are_never_double_booked():
+    staff = staff_arrays((10, 'RN', 'Hospital 1', False, 0), (11, 'RN', 'Hospital 1', False, 5))
+    # 10 is already working through the first shift, so it goes to 11 despite their higher count
+    assert assignments(shift_arrays((1, 'RN', 'Hospital 1', 7, 12)), staff, booking_arrays((10, 12, 8))) == {1: 11}
+    # overlapping shifts go to different people, whether they're matched together or in different chunks
+    overlapping = shift_arrays((1, 'RN', 'Hospital 1', 7, 12), (2, 'RN', 'Hospital 1', 11, 8),
+                               (3, 'RN', 'Hospital 1', 15, 8))
+    for chunk_size in (512, 1):
+        plan = assignments(overlapping, staff, chunk_size=chunk_size)
+        assert set(plan) == {1, 2}
+        assert plan[1] != plan[2]
+    # back to back shifts don't overlap
+    assert assignments(shift_arrays((1, 'RN', 'Hospital 1', 7, 12), (2, 'RN', 'Hospital 1', 19, 12)),
+                       staff_arrays((10, 'RN', 'Hospital 1', False, 0))) == {1: 10, 2: 10}
+
+
+def test_work_is_spread_across_staff():
+    shifts = shift_arrays(*[(day, 'RN', 'Hospital 1', day * 24 + 7, 12) for day in range(6)])
+    staff = staff_arrays((10, 'RN', 'Hospital 1', False, 0), (11, 'RN', 'Hospital 1', False, 0),
+                         (12, 'RN', 'Hospital 1', False, 2))
+    plan = assignments(shifts, staff)
+    assert len(plan) == 6
+    # counting the shifts they'd already worked, nobody ends up more than one shift ahead of anyone else
+    totals = [list(plan.values()).count(staff_id) + worked for staff_id, worked in [(10, 0), (11, 0), (12, 2)]]
+    assert max(totals) - min(totals) <= 1
+
+
+def test_auto_assign_previews_then_assigns(app):
+    admin = log_in(app, 'admin@example.com')
+    tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+    window = {'start_date': tomorrow.isoformat(), 'end_date': (tomorrow + datetime.timedelta(days=6)).isoformat()}
+
+    preview = admin.post('/autoassign', data=dict(window, preview='Preview Assignments'))
+    assert preview.status_code == 200
+    assert 'Nurse' in preview.get_data(as_text=True)
+    with app.app_context():
+        assert Shift.query.filter(Shift.picked_up_by_id != None).count() == 0
+
+    assert admin.post('/autoassign', data=dict(window, commit='Assign Shifts')).status_code == 302
+    with app.app_context():
+        assigned = Shift.query.filter(Shift.picked_up_by_id != None).all()
+        assert len(assigned) == 7
+        assert all(shift.status == 'Approved' for shift in assigned)
+        # a shift a day across 8 nurses, so nobody gets two
+        assert len({shift.picked_up_by_id for shift in assigned}) == 7
+        assert ShiftEvent.query.filter_by(event_type='assigned').count() == 7
+        assert db.session.query(db.func.sum(User.shifts_worked)).scalar() == 7
@@ -0,0 +1,88 @@
+import pytest
+
+from cache import VersionedCache
+from conftest import close_app, log_in, make_app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def cached_app(tmp_path):
+    app = make_app(tmp_path / 'staffing.db', CACHE_TTL_SECONDS=60)
+    yield app
+    close_app(app)
+
+
+def loader(values):
+    """
+    A load function returning the next of values each time it's called
+    """
+    values = iter(values)
+    return lambda: next(values)
+
+
+def test_entries_last_until_the_data_version_moves_on():
+    cache = VersionedCache(max_entries=10, ttl_seconds=60)
+    load = loader(['first', 'second'])
+    assert cache.get('facets', 1, load) == 'first'
+    assert cache.get('facets', 1, load) == 'first'
+    assert cache.get('facets', 2, load) == 'second'
+    assert cache.stats()['hits'] == 1 and cache.stats()['misses'] == 2
+
+
+def test_entries_expire_after_their_ttl():
+    clock = FakeClock()
+    cache = VersionedCache(max_entries=10, ttl_seconds=60, clock=clock)
+    load = loader(['first', 'second'])
+    assert cache.get('facets', 1, load) == 'first'
+    clock.now = 59
+    assert cache.get('facets', 1, load) == 'first'
+    clock.now = 61
+    assert cache.get('facets', 1, load) == 'second'
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = VersionedCache(max_entries=2, ttl_seconds=60)
+    cache.get('a', 1, lambda: 'a')
+    cache.get('b', 1, lambda: 'b')
+    # reading a makes b the least recently used
+    cache.get('a', 1, lambda: 'reloaded')
+    cache.get('c', 1, lambda: 'c')
+    assert list(cache.entries) == ['a', 'c']
+    assert cache.get('b', 1, lambda: 'reloaded') == 'reloaded'
+    assert cache.stats()['evictions'] == 2
+
+
+def test_ttl_of_zero_turns_the_cache_off():
+    cache = VersionedCache(max_entries=10, ttl_seconds=0)
+    load = loader(['first', 'second'])
+    assert cache.get('facets', 1, load) == 'first'
+    assert cache.get('facets', 1, load) == 'second'
+    assert cache.stats()['entries'] == 0
+
+
+def test_staff_list_is_served_from_the_cache_until_staff_change(cached_app):
+    admin = log_in(cached_app, 'admin@example.com')
+    first_page = admin.get('/staff').get_data(as_text=True)
+    assert '<option value="Hospital 9"' not in first_page
+    misses = admin.get('/metrics/cache').get_json()['misses']
+    # the rows and the role and location filters both come from the cache
+    assert admin.get('/staff').status_code == 200
+    stats = admin.get('/metrics/cache').get_json()
+    assert stats['misses'] == misses and stats['hits'] >= 2
+
+    response = admin.post('/adduser', data={'name': 'Cached Nurse', 'role': 'CRNA', 'location': 'Hospital 9',
+                                            'email': 'cached@example.com', 'phone_num': '1', 'can_float': 'Yes',
+                                            'availability': 'Yes'})
+    assert response.status_code == 302
+    page = admin.get('/staff').get_data(as_text=True)
+    assert 'cached@example.com' in page
+    # the new role and location show up in the filters too
+    assert '<option value="Hospital 9"' in page and '<option value="CRNA"' in page
+    assert admin.get('/metrics/cache').get_json()['misses'] >= misses + 2
@@ -0,0 +1,37 @@
+import threading
+
+from conftest import STAFF_COUNT, log_in
+from models import db, User, Shift, ShiftEvent
+
+
+def test_one_claim_wins_when_staff_accept_a_shift_at_once(app):
+    """
+    Every RN accepts the same shift at the same moment: exactly one of them gets it, it's logged as claimed once and
+    only the winner's shifts_worked goes up
+    """
+    with app.app_context():
+        shift_id = Shift.query.order_by(Shift.start_at).first().shift_id
+        emails = [user.email for user in User.query.filter_by(role='RN')]
+    clients = [log_in(app, email) for email in emails]
+    assert len(clients) == STAFF_COUNT
+
+    start = threading.Barrier(len(clients))
+    statuses = [None] * len(clients)
+
+    def accept(number):
+        start.wait()
+        statuses[number] = clients[number].post('/acceptshift', data={'id': shift_id}).status_code
+
+    threads = [threading.Thread(target=accept, args=(number,)) for number in range(len(clients))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(statuses) == [302] + [409] * (len(clients) - 1)
+    with app.app_context():
+        shift = Shift.query.get(shift_id)
+        assert shift.status == 'Requested'
+        assert ShiftEvent.query.filter_by(shift_id=shift_id, event_type='claimed').count() == 1
+        assert db.session.query(db.func.sum(User.shifts_worked)).scalar() == 1
+        assert User.query.get(shift.picked_up_by_id).shifts_worked == 1
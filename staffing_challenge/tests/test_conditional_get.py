@@ -0,0 +1,60 @@
+import pytest
+
+from conftest import close_app, log_in, make_app
+from models import Shift
+
+
+@pytest.fixture(params=[0, 60], ids=['uncached', 'cached'])
+def app(request, tmp_path):
+    # the ETags are the same whether or not the table rows are cached
+    app = make_app(tmp_path / 'staffing.db', CACHE_TTL_SECONDS=request.param)
+    yield app
+    close_app(app)
+
+
+def first_shift_id(app):
+    with app.app_context():
+        return Shift.query.order_by(Shift.start_at).first().shift_id
+
+
+@pytest.mark.parametrize('page', ['/shift', '/staff', '/pendingrequests'])
+def test_unchanged_page_is_not_modified(app, page):
+    admin = log_in(app, 'admin@example.com')
+    response = admin.get(page)
+    assert response.status_code == 200
+    etag, weak = response.get_etag()
+    assert etag and not weak
+    assert 'no-cache' in response.headers['Cache-Control'] and 'private' in response.headers['Cache-Control']
+    assert response.last_modified is None
+
+    refreshed = admin.get(page, headers={'If-None-Match': f'"{etag}"'})
+    assert refreshed.status_code == 304
+    assert refreshed.get_data() == b''
+    assert refreshed.get_etag() == (etag, False)
+
+
+def test_change_to_the_data_sends_the_page_again(app):
+    staff = log_in(app, 'nurse0@example.com')
+    etag, _ = staff.get('/shift').get_etag()
+    # someone else claiming a shift takes it off the board
+    shift_id = first_shift_id(app)
+    assert log_in(app, 'nurse1@example.com').post('/acceptshift', data={'id': shift_id}).status_code == 302
+    response = staff.get('/shift', headers={'If-None-Match': f'"{etag}"'})
+    assert response.status_code == 200
+    assert response.get_etag()[0] != etag
+    assert f'id={shift_id}"' not in response.get_data(as_text=True)
+
+
+def test_etag_is_per_user_and_per_url(app):
+    nurse, other_nurse = log_in(app, 'nurse0@example.com'), log_in(app, 'nurse1@example.com')
+    etag, _ = nurse.get('/shift').get_etag()
+    assert other_nurse.get('/shift', headers={'If-None-Match': f'"{etag}"'}).status_code == 200
+    assert nurse.get('/shift?location=Hospital+1', headers={'If-None-Match': f'"{etag}"'}).status_code == 200
+
+
+def test_page_with_a_flashed_message_is_sent_in_full(app):
+    staff = log_in(app, 'nurse0@example.com')
+    etag, _ = staff.get('/shift').get_etag()
+    # staff can't open the Auto-Assign page, and are sent to the Shift List with a message saying so
+    assert staff.get('/autoassign').status_code == 302
+    assert staff.get('/shift', headers={'If-None-Match': f'"{etag}"'}).status_code == 200
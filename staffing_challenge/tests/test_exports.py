@@ -0,0 +1,133 @@
+import csv
+import datetime
+import io
+
+import openpyxl
+
+import exports
+from archive import archive_shifts_before
+from conftest import STAFF_COUNT, log_in
+from exports import SHIFT_EXPORT_FIELDS, STAFF_EXPORT_FIELDS
+from models import db, User, Shift
+from queries import start_of_day
+
+
+def csv_rows(response):
+    assert response.status_code == 200
+    assert response.mimetype == 'text/csv'
+    return list(csv.reader(io.StringIO(response.get_data(as_text=True))))
+
+
+def xlsx_sheets(response):
+    assert response.status_code == 200
+    workbook = openpyxl.load_workbook(io.BytesIO(response.get_data()), read_only=True)
+    return {sheet.title: [list(row) for row in sheet.values] for sheet in workbook.worksheets}
+
+
+def add_worked_shift(app, email, days_ago):
+    """
+    An approved 7am shift held by the staff member, days_ago days before today
+    """
+    with app.app_context():
+        nurse = User.query.filter_by(email=email).one()
+        start_at = start_of_day(datetime.date.today() - datetime.timedelta(days=days_ago)) + \
+            datetime.timedelta(hours=7)
+        db.session.add(Shift(location='Hospital 1', role='RN', area=f'Past {days_ago}', date=start_at.date(),
+                             start_time='7am', end_time='7pm', start_at=start_at,
+                             end_at=start_at + datetime.timedelta(hours=12), status='Approved',
+                             picked_up_by_id=nurse.id, added_by_name='Admin'))
+        db.session.commit()
+        return nurse.id
+
+
+def test_staff_export_has_every_staff_member_but_the_admins(app):
+    admin = log_in(app, 'admin@example.com')
+    response = admin.get('/export/staff.csv')
+    assert response.headers['Content-Disposition'] == 'attachment; filename="staff.csv"'
+    header, *rows = csv_rows(response)
+    assert header == STAFF_EXPORT_FIELDS
+    assert [row[header.index('email')] for row in rows] == [f'nurse{number}@example.com'
+                                                            for number in range(STAFF_COUNT)]
+    assert rows[0][header.index('name'):header.index('phone_num') + 1] == \
+        ['Nurse 0', 'RN', 'Hospital 1', 'nurse0@example.com', '1']
+
+
+def test_staff_export_uses_the_staff_list_filters(app):
+    with app.app_context():
+        User.query.filter_by(email='nurse3@example.com').update({'availability': 'No'})
+        db.session.commit()
+    admin = log_in(app, 'admin@example.com')
+    _, *rows = csv_rows(admin.get('/export/staff.csv?availability=No'))
+    assert [row[1] for row in rows] == ['Nurse 3']
+    _, *rows = csv_rows(admin.get('/export/staff.csv?role=CRNA'))
+    assert rows == []
+
+
+def test_staff_export_as_excel(app):
+    admin = log_in(app, 'admin@example.com')
+    response = admin.get('/export/staff.xlsx')
+    assert response.mimetype == exports.EXPORT_MIMETYPES['xlsx']
+    sheets = xlsx_sheets(response)
+    assert list(sheets) == ['Staff']
+    assert sheets['Staff'][0] == STAFF_EXPORT_FIELDS
+    assert len(sheets['Staff']) == STAFF_COUNT + 1
+
+
+def test_long_excel_export_carries_on_in_another_sheet(app, monkeypatch):
+    monkeypatch.setattr(exports, 'XLSX_MAX_ROWS', 4)
+    sheets = xlsx_sheets(log_in(app, 'admin@example.com').get('/export/staff.xlsx'))
+    # each sheet has its own header
+    assert list(sheets) == ['Staff', 'Staff 2', 'Staff 3']
+    assert [len(rows) for rows in sheets.values()] == [4, 4, 3]
+    assert all(rows[0] == STAFF_EXPORT_FIELDS for rows in sheets.values())
+
+
+def test_csv_export_is_streamed_in_batches(app, monkeypatch):
+    monkeypatch.setattr(exports, 'EXPORT_BATCH_SIZE', 3)
+    response = log_in(app, 'admin@example.com').get('/export/staff.csv', buffered=False)
+    chunks = list(response.response)
+    response.close()
+    # the header, then 3, 3 and the last 2 staff
+    assert [chunk.count(b'\n') for chunk in chunks] == [1, 3, 3, 2]
+
+
+def test_shift_history_export_includes_archived_shifts(app):
+    nurse_id = add_worked_shift(app, 'nurse0@example.com', 200)
+    add_worked_shift(app, 'nurse0@example.com', 10)
+    add_worked_shift(app, 'nurse1@example.com', 5)
+    with app.app_context():
+        archive_shifts_before(start_of_day(datetime.date.today() - datetime.timedelta(days=90)), batch_size=10)
+    response = log_in(app, 'nurse0@example.com').get(f'/export/users/{nurse_id}/shifts.csv')
+    assert response.headers['Content-Disposition'] == f'attachment; filename="shifts_user_{nurse_id}.csv"'
+    header, *rows = csv_rows(response)
+    assert header == SHIFT_EXPORT_FIELDS + ['archived']
+    assert [(row[header.index('area')], row[header.index('archived')]) for row in rows] == \
+        [('Past 200', 'True'), ('Past 10', 'False')]
+
+
+def test_shift_export_covers_the_chosen_days(app):
+    admin = log_in(app, 'admin@example.com')
+    first_day = datetime.date.today() + datetime.timedelta(days=2)
+    last_day = first_day + datetime.timedelta(days=2)
+    response = admin.get('/export/shifts.csv', query_string={'start_date': first_day.isoformat(),
+                                                             'end_date': last_day.isoformat()})
+    header, *rows = csv_rows(response)
+    assert [row[header.index('date')] for row in rows] == [(first_day + datetime.timedelta(days=days)).isoformat()
+                                                          for days in range(3)]
+    assert {row[header.index('status')] for row in rows} == {'Posted'}
+    sheets = xlsx_sheets(admin.get('/export/shifts.xlsx', query_string={'start_date': first_day.isoformat(),
+                                                                        'end_date': last_day.isoformat()}))
+    assert len(sheets['Shifts']) == 4
+    # the days are required and have to be in order
+    assert admin.get('/export/shifts.csv', query_string={'start_date': last_day.isoformat(),
+                                                         'end_date': first_day.isoformat()}).status_code == 302
+
+
+def test_staff_can_only_export_their_own_shifts(app):
+    staff = log_in(app, 'nurse0@example.com')
+    with app.app_context():
+        other_id = User.query.filter_by(email='nurse1@example.com').one().id
+    for path in ['/export/staff.csv', '/export/shifts.csv?start_date=2020-01-01&end_date=2020-01-02',
+                 f'/export/users/{other_id}/shifts.xlsx']:
+        response = staff.get(path)
+        assert response.status_code == 302 and response.location.endswith('/upload')
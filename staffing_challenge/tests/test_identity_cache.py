@@ -0,0 +1,66 @@
+import re
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import event
+
+from conftest import log_in
+from models import db, Shift
+
+
+# a SELECT looking up a user by id (the table is quoted on databases where user is a reserved word). Pages that list
+# staff alongside shifts join the user table instead, which isn't a lookup
+USER_LOOKUP = re.compile(r'^\s*SELECT\b.*\bFROM\s+"?user"?\s+WHERE\s+"?user"?\.id\s*=', re.IGNORECASE | re.DOTALL)
+
+
+@contextmanager
+def user_lookups(app):
+    """
+    Collects the lookups of users by id run through the app's engines, primary and read, while the block runs
+    """
+    statements = []
+
+    def collect(conn, cursor, statement, parameters, context, executemany):
+        if USER_LOOKUP.match(statement):
+            statements.append(statement)
+
+    with app.app_context():
+        engines = {db.get_engine(app), db.get_engine(app, bind='read')}
+    for engine in engines:
+        event.listen(engine, 'before_cursor_execute', collect)
+    try:
+        yield statements
+    finally:
+        for engine in engines:
+            event.remove(engine, 'before_cursor_execute', collect)
+
+
+@pytest.mark.parametrize('email, page', [
+    ('nurse0@example.com', '/shift'),
+    ('nurse0@example.com', '/api/v1/me'),
+    ('admin@example.com', '/shift'),
+    ('admin@example.com', '/addshift'),
+    ('admin@example.com', '/pendingrequests'),
+    ('admin@example.com', '/shifttemplates'),
+])
+def test_page_loads_the_logged_in_user_once(app, email, page):
+    """
+    Flask-Login's loader and the route's own check of the user's role share one lookup of the user's row
+    """
+    client = log_in(app, email)
+    with user_lookups(app) as statements:
+        assert client.get(page).status_code == 200
+    assert len(statements) == 1, statements
+
+
+def test_claiming_a_shift_loads_each_user_once(app):
+    """
+    Claiming a shift looks up the staff member claiming it and the Admin who posted it once each, though both are
+    needed again for the pickup email
+    """
+    with app.app_context():
+        shift_id = Shift.query.order_by(Shift.start_at).first().shift_id
+    client = log_in(app, 'nurse0@example.com')
+    with user_lookups(app) as statements:
+        assert client.post('/acceptshift', data={'id': shift_id}).status_code == 302
+    assert len(statements) == 2, statements
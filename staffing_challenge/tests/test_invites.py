@@ -0,0 +1,107 @@
+import datetime
+
+from conftest import PASSWORD, RecordingMailer, log_in
+from mailer import drain_outbox
+from models import db, User, EmailOutbox
+
+
+def add_staff_member(app, email):
+    admin = log_in(app, 'admin@example.com')
+    response = admin.post('/adduser', data={'name': 'New Nurse', 'role': 'RN', 'location': 'Hospital 1',
+                                            'email': email, 'phone_num': '1', 'can_float': 'Yes',
+                                            'availability': 'Yes'})
+    assert response.status_code == 302
+
+
+def invite_token(text):
+    return text.split('/invite/', 1)[1].split()[0]
+
+
+def test_sent_invite_keeps_no_token(app):
+    add_staff_member(app, 'new@example.com')
+    mailer = RecordingMailer()
+    with app.app_context():
+        assert drain_outbox(mailer) == 1
+        body = EmailOutbox.query.one().body
+    token = invite_token(mailer.sent[0].get_content())
+    assert token not in body
+    assert '/invite/[redacted]' in body
+    # the link that went out still works
+    assert app.test_client().get(f'/invite/{token}').status_code == 200
+
+
+def test_failed_invite_keeps_no_token(app):
+    app.config['OUTBOX_MAX_ATTEMPTS'] = 1
+    add_staff_member(app, 'new@example.com')
+    with app.app_context():
+        token = invite_token(EmailOutbox.query.one().body)
+        assert drain_outbox(RecordingMailer(fail=True)) == 1
+        failed_email = EmailOutbox.query.one()
+        assert failed_email.status == 'Failed'
+        assert token not in failed_email.body
+
+
+def outbox_token(app, email):
+    """
+    The token in the latest invite link queued for email, before it's sent
+    """
+    with app.app_context():
+        return invite_token(EmailOutbox.query.filter_by(to_addrs=email).order_by(EmailOutbox.id.desc()).first().body)
+
+
+def test_accepted_invite_sets_the_password_once(app):
+    add_staff_member(app, 'new@example.com')
+    token = outbox_token(app, 'new@example.com')
+    client = app.test_client()
+    # until the invite is accepted there's no password to log in with
+    response = client.post('/login', data={'email': 'new@example.com', 'password': PASSWORD})
+    assert response.location.endswith('/login')
+
+    assert client.get(f'/invite/{token}').status_code == 200
+    mismatched = client.post(f'/invite/{token}', data={'password': PASSWORD, 'confirm': 'something else'})
+    assert mismatched.status_code == 200
+    response = client.post(f'/invite/{token}', data={'password': PASSWORD, 'confirm': PASSWORD})
+    assert response.status_code == 302 and response.location.endswith('/staff')
+    # accepting logs them in
+    assert client.get('/api/v1/me').get_json()['email'] == 'new@example.com'
+    with app.app_context():
+        user = User.query.filter_by(email='new@example.com').one()
+        assert user.invite_token_hash is None and user.invite_expires_at is None
+
+    assert log_in(app, 'new@example.com').get('/api/v1/me').status_code == 200
+    # the link can't be used again, e.g. to change the password
+    response = app.test_client().post(f'/invite/{token}', data={'password': 'another one', 'confirm': 'another one'})
+    assert response.location.endswith('/login')
+    log_in(app, 'new@example.com')
+
+
+def test_expired_invite_is_refused(app):
+    add_staff_member(app, 'new@example.com')
+    token = outbox_token(app, 'new@example.com')
+    with app.app_context():
+        user = User.query.filter_by(email='new@example.com').one()
+        user.invite_expires_at = datetime.datetime.utcnow() - datetime.timedelta(minutes=1)
+        db.session.commit()
+    for response in [app.test_client().get(f'/invite/{token}'),
+                     app.test_client().post(f'/invite/{token}', data={'password': PASSWORD, 'confirm': PASSWORD})]:
+        assert response.status_code == 302 and response.location.endswith('/login')
+    with app.app_context():
+        assert User.query.filter_by(email='new@example.com').one().password is None
+
+
+def test_new_invite_replaces_the_last_one(app):
+    add_staff_member(app, 'new@example.com')
+    old_token = outbox_token(app, 'new@example.com')
+    with app.app_context():
+        user_id = User.query.filter_by(email='new@example.com').one().id
+    admin = log_in(app, 'admin@example.com')
+    assert admin.post('/sendinvite', data={'id': user_id}).status_code == 302
+    token = outbox_token(app, 'new@example.com')
+    assert token != old_token
+    assert app.test_client().get(f'/invite/{old_token}').status_code == 302
+    assert app.test_client().post(f'/invite/{token}', data={'password': PASSWORD, 'confirm': PASSWORD}).status_code \
+        == 302
+    # once the password is set there's nothing to invite them to
+    assert admin.post('/sendinvite', data={'id': user_id}).status_code == 302
+    with app.app_context():
+        assert EmailOutbox.query.filter_by(to_addrs='new@example.com').count() == 2
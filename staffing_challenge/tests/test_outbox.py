@@ -0,0 +1,134 @@
+import datetime
+import smtplib
+
+import mailer
+from conftest import RecordingMailer, log_in
+from mailer import OutboxMailer, drain_outbox
+from models import db, EmailOutbox, Shift
+
+
+class CountingSMTP:
+    """
+    Stands in for smtplib.SMTP, counting the connections opened and optionally dropping one after drop_after sends
+    """
+    opened = 0
+    drop_after = None
+
+    def __init__(self, host, port, timeout=None):
+        CountingSMTP.opened += 1
+        self.sent = 0
+
+    def starttls(self):
+        pass
+
+    def login(self, user, password):
+        pass
+
+    def send_message(self, message):
+        if CountingSMTP.drop_after is not None and self.sent == CountingSMTP.drop_after:
+            CountingSMTP.drop_after = None
+            raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        self.sent += 1
+
+    def quit(self):
+        pass
+
+
+def first_shift_id(app):
+    with app.app_context():
+        return Shift.query.order_by(Shift.start_at).first().shift_id
+
+
+def queue_emails(app, count):
+    with app.app_context():
+        db.session.add_all([EmailOutbox(to_addrs=f'nurse{number}@example.com', subject='Hello', body='Hello')
+                            for number in range(count)])
+        db.session.commit()
+
+
+def make_due(app):
+    with app.app_context():
+        EmailOutbox.query.update({EmailOutbox.next_attempt_at: datetime.datetime.utcnow()})
+        db.session.commit()
+
+
+def test_claiming_a_shift_queues_its_email(app):
+    shift_id = first_shift_id(app)
+    assert log_in(app, 'nurse0@example.com').post('/acceptshift', data={'id': shift_id}).status_code == 302
+    # losing the race rolls the claim back, email and all
+    assert log_in(app, 'nurse1@example.com').post('/acceptshift', data={'id': shift_id}).status_code == 409
+    with app.app_context():
+        queued_email = EmailOutbox.query.one()
+        assert queued_email.status == 'Pending' and queued_email.attempts == 0
+        assert queued_email.to_addrs == 'admin@example.com,nurse0@example.com'
+        assert 'Nurse 0' in queued_email.body
+
+        recording_mailer = RecordingMailer()
+        assert drain_outbox(recording_mailer) == 1
+        assert recording_mailer.sent[0]['To'] == 'admin@example.com, nurse0@example.com'
+        assert EmailOutbox.query.one().status == 'Sent'
+        # nothing is sent twice
+        assert drain_outbox(recording_mailer) == 0
+
+
+def test_failed_email_is_retried_with_backoff(app):
+    app.config.update(OUTBOX_MAX_ATTEMPTS=3, OUTBOX_RETRY_SECONDS=30)
+    queue_emails(app, 1)
+    with app.app_context():
+        failing_mailer = RecordingMailer(fail=True)
+        for attempt, delay in [(1, 30), (2, 60)]:
+            before = datetime.datetime.utcnow()
+            assert drain_outbox(failing_mailer) == 1
+            queued_email = EmailOutbox.query.one()
+            assert (queued_email.status, queued_email.attempts) == ('Pending', attempt)
+            assert 'Connection unexpectedly closed' in queued_email.last_error
+            wait = queued_email.next_attempt_at - before
+            assert datetime.timedelta(seconds=delay) <= wait < datetime.timedelta(seconds=delay + 5)
+            # it isn't due again until the delay is up
+            assert drain_outbox(failing_mailer) == 0
+            make_due(app)
+
+        assert drain_outbox(failing_mailer) == 1
+        assert EmailOutbox.query.one().status == 'Failed'
+        make_due(app)
+        assert drain_outbox(RecordingMailer()) == 0
+
+
+def test_email_sent_on_a_retry(app):
+    queue_emails(app, 1)
+    with app.app_context():
+        assert drain_outbox(RecordingMailer(fail=True)) == 1
+        make_due(app)
+        assert drain_outbox(RecordingMailer()) == 1
+        sent_email = EmailOutbox.query.one()
+        assert (sent_email.status, sent_email.attempts) == ('Sent', 2)
+        assert sent_email.sent_at is not None
+
+
+def test_outbox_drains_in_batches(app):
+    queue_emails(app, 5)
+    with app.app_context():
+        recording_mailer = RecordingMailer()
+        assert drain_outbox(recording_mailer, batch_size=2) == 2
+        assert drain_outbox(recording_mailer, batch_size=2) == 2
+        assert drain_outbox(recording_mailer, batch_size=2) == 1
+        # oldest first
+        assert [message['To'] for message in recording_mailer.sent] == [f'nurse{number}@example.com'
+                                                                         for number in range(5)]
+
+
+def test_mailer_reuses_one_connection(app, monkeypatch):
+    monkeypatch.setattr(mailer.smtplib, 'SMTP', CountingSMTP)
+    monkeypatch.setattr(CountingSMTP, 'opened', 0)
+    queue_emails(app, 4)
+    with app.app_context():
+        outbox_mailer = OutboxMailer(app.config)
+        assert drain_outbox(outbox_mailer) == 4
+        assert CountingSMTP.opened == 1
+        # a dropped connection is opened again and the message still goes out
+        queue_emails(app, 2)
+        monkeypatch.setattr(CountingSMTP, 'drop_after', 4)
+        assert drain_outbox(outbox_mailer) == 2
+        assert CountingSMTP.opened == 2
+        outbox_mailer.close()
+        assert EmailOutbox.query.filter_by(status='Sent').count() == 6
@@ -0,0 +1,87 @@
+import datetime
+import html
+import re
+
+from conftest import STAFF_COUNT, log_in
+from models import db, User, Shift
+from queries import PAGE_SIZE, decode_cursor, encode_cursor, keyset_page, open_shifts_query
+
+
+def add_staff(app, count, name, **fields):
+    with app.app_context():
+        db.session.add_all([User(**dict(dict(name=name, role='RN', location='Hospital 1', phone_num='1',
+                                             availability='Yes', can_float='Yes', shifts_worked=0), **fields),
+                                 email=f"{name.replace(' ', '').lower()}{number}@example.com")
+                            for number in range(count)])
+        db.session.commit()
+
+
+def every_page(query, order_columns, page_size):
+    pages, cursor = [], None
+    while True:
+        rows, cursor = keyset_page(query, order_columns, cursor, page_size=page_size)
+        pages.append(rows)
+        if cursor is None:
+            return pages
+
+
+def page_emails(response):
+    text = response.get_data(as_text=True)
+    next_link = re.search(r'<a href="([^"]+)">Next page</a>', text)
+    return re.findall(r'<td>([^<@]+@example\.com)</td>', text), next_link and html.unescape(next_link.group(1))
+
+
+def test_staff_pages_split_ties_on_name(app):
+    add_staff(app, 7, 'Same Name')
+    with app.app_context():
+        order_columns = [User.name, User.id]
+        staff_query = User.query.filter(User.role != 'Admin')
+        pages = every_page(staff_query, order_columns, page_size=3)
+        assert [len(page) for page in pages] == [3, 3, 3, 3, 3]
+        paged = [user.id for page in pages for user in page]
+        assert paged == [user.id for user in staff_query.order_by(User.name, User.id)]
+        # a page that holds exactly the rest of the rows is the last one
+        assert keyset_page(staff_query, order_columns, None, page_size=STAFF_COUNT + 7)[1] is None
+
+
+def test_shift_pages_split_ties_on_start_time(app):
+    with app.app_context():
+        start_at = datetime.datetime.combine(datetime.date.today() + datetime.timedelta(days=3), datetime.time(7))
+        db.session.add_all([Shift(location='Hospital 2', role='RN', area=f'Area {number}', date=start_at.date(),
+                                  start_time='7am', end_time='7pm', start_at=start_at,
+                                  end_at=start_at + datetime.timedelta(hours=12), status='Posted')
+                            for number in range(5)])
+        db.session.commit()
+        board = open_shifts_query('RN', datetime.date.today())
+        order_columns = [Shift.start_at, Shift.shift_id]
+        pages = every_page(board, order_columns, page_size=2)
+        paged = [shift.shift_id for page in pages for shift in page]
+        assert paged == [shift.shift_id for shift in board]
+        assert len(paged) == len(set(paged)) == 12
+        # the cursor carries the datetime of the last row on the page back in as a datetime
+        cursor = encode_cursor([pages[0][-1].start_at, pages[0][-1].shift_id])
+        assert decode_cursor(cursor, order_columns) == [pages[0][-1].start_at, pages[0][-1].shift_id]
+
+
+def test_bad_cursor_starts_from_the_first_page(app):
+    with app.app_context():
+        first_page = keyset_page(User.query, [User.name, User.id], None, page_size=2)[0]
+        for cursor in ['not a cursor', encode_cursor(['only one value'])]:
+            assert keyset_page(User.query, [User.name, User.id], cursor, page_size=2)[0] == first_page
+
+
+def test_staff_list_pages_through_everyone_with_filters(app):
+    # more than a page of staff sharing a name, with some who are filtered out among them
+    add_staff(app, PAGE_SIZE, 'Tied Nurse')
+    add_staff(app, 5, 'Tied Nurse Away', availability='No')
+    admin = log_in(app, 'admin@example.com')
+    seen, url, pages = [], '/staff?availability=Yes', 0
+    while url:
+        response = admin.get(url)
+        assert response.status_code == 200
+        emails, url = page_emails(response)
+        seen.extend(emails)
+        pages += 1
+    assert pages == 2
+    assert len(seen) == len(set(seen)) == PAGE_SIZE + STAFF_COUNT
+    assert not any(email.startswith('tiednurseaway') for email in seen)
@@ -0,0 +1,111 @@
+import datetime
+import re
+
+import pytest
+
+from conftest import PASSWORD, close_app, log_in, make_app
+from models import User, Shift, EmailOutbox, ShiftTemplate
+
+
+@pytest.fixture
+def app(tmp_path):
+    # a request that runs more SQL statements than its route's query_budget raises QueryBudgetExceeded
+    app = make_app(tmp_path / 'staffing.db', QUERY_BUDGETS_ENFORCED=True)
+    yield app
+    close_app(app)
+
+
+def check(response, status):
+    assert response.status_code == status, response.data[:500]
+    return response
+
+
+def shift_data(days_ahead):
+    date = datetime.date.today() + datetime.timedelta(days=days_ahead)
+    return {'location': 'Hospital 1', 'role': 'RN', 'area': 'ICU', 'date': date.isoformat(), 'start_time': '7pm',
+            'end_time': '7:00 AM', 'comments': ''}
+
+
+def test_every_budgeted_route_stays_within_its_budget(app):
+    """
+    Walks through the app as an Admin and two RNs, hitting every route with a query budget (including the write paths
+    that do the most work, such as approving a claimed shift), against the seeded database
+    """
+    with app.app_context():
+        nurse, other_nurse = [user.id for user in User.query.filter_by(role='RN').order_by(User.id).limit(2)]
+        first_shift, second_shift = [shift.shift_id for shift in Shift.query.order_by(Shift.start_at).limit(2)]
+    admin = log_in(app, 'admin@example.com')
+    staff = log_in(app, 'nurse0@example.com')
+    other_staff = log_in(app, 'nurse1@example.com')
+
+    # the Admin's pages
+    check(admin.get('/staff'), 200)
+    check(admin.get('/shift'), 200)
+    check(admin.get('/addshift'), 200)
+    check(admin.post('/addshift', data=shift_data(20)), 302)
+    check(admin.get(f'/addusershift?id={other_nurse}'), 200)
+    check(admin.post(f'/addusershift?id={other_nurse}', data=shift_data(21)), 302)
+    check(admin.get('/adduser'), 200)
+    check(admin.post('/adduser', data={'name': 'New Nurse', 'role': 'RN', 'location': 'Hospital 1',
+                                       'email': 'new@example.com', 'phone_num': '1', 'can_float': 'Yes',
+                                       'availability': 'Yes'}), 302)
+    check(admin.get(f'/edituser?id={nurse}'), 200)
+    check(admin.post('/edituser', data={'id': nurse, 'name': 'Nurse 0', 'role': 'RN', 'location': 'Hospital 1',
+                                        'email': 'nurse0@example.com', 'phone_num': '2', 'can_float': 'Yes',
+                                        'availability': 'Yes'}), 302)
+    with app.app_context():
+        new_nurse = User.query.filter_by(email='new@example.com').one().id
+    check(admin.post('/sendinvite', data={'id': new_nurse}), 302)
+    check(admin.get(f'/userdetails?id={other_nurse}'), 200)
+    check(admin.get('/coverage'), 200)
+    check(admin.get('/shifttemplates'), 200)
+    start_date = datetime.date.today() + datetime.timedelta(days=40)
+    check(admin.post('/shifttemplates', data={
+        'template-location': 'Hospital 1', 'template-role': 'RN', 'template-area': 'ICU',
+        'template-days_of_week': ['0', '2', '4'], 'template-start_time': '7am', 'template-end_time': '7pm',
+        'template-start_date': start_date.isoformat(), 'template-comments': ''}), 302)
+    with app.app_context():
+        template = ShiftTemplate.query.one().id
+    check(admin.post('/shifttemplates/remove', data={'id': template}), 302)
+
+    # staff claiming shifts, one of them losing the race for the first
+    check(staff.get('/shift'), 200)
+    changes = check(staff.get('/api/v1/shifts'), 200).get_json()['changes']
+    check(staff.get(f'/acceptshift?id={first_shift}'), 200)
+    check(staff.post('/acceptshift', data={'id': first_shift}), 302)
+    check(other_staff.post('/acceptshift', data={'id': first_shift}), 409)
+    check(other_staff.post('/acceptshift', data={'id': second_shift}), 302)
+
+    # the Admin answering the requests and taking a shift back
+    check(admin.get('/pendingrequests'), 200)
+    check(admin.get('/api/v1/pending'), 200)
+    check(admin.get(f'/approverequest?id={first_shift}'), 200)
+    check(admin.post('/approverequest', data={'id': first_shift}), 302)
+    check(admin.get(f'/denyrequest?id={second_shift}'), 200)
+    check(admin.post('/denyrequest', data={'id': second_shift}), 302)
+    check(admin.get(f'/removeshift?id={first_shift}'), 200)
+    check(admin.post('/removeshift', data={'id': first_shift}), 302)
+
+    # the API and the Shift List's live updates
+    check(staff.get('/api/v1/me'), 200)
+    assert check(staff.get(f'/api/v1/shifts/changes?since={changes}'), 200).get_json()['shifts']
+    check(staff.get('/api/v1/shift-events'), 200)
+    check(staff.get(f'/api/v1/users/{nurse}/shifts'), 200)
+    stream = check(staff.get('/shifts/events', buffered=False), 200)
+    # reading the first chunk starts the stream, so closing it unsubscribes it from the broker
+    assert next(iter(stream.response)).startswith(b'retry:')
+    stream.close()
+
+    # the new staff member setting their password from the invite email
+    with app.app_context():
+        invite = EmailOutbox.query.filter_by(to_addrs='new@example.com').order_by(EmailOutbox.id.desc()).first()
+    token = re.search(r'/invite/(\S+)', invite.body).group(1)
+    invited = app.test_client()
+    check(invited.get(f'/invite/{token}'), 200)
+    check(invited.post(f'/invite/{token}', data={'password': PASSWORD, 'confirm': PASSWORD}), 302)
+
+    budgeted = {endpoint for endpoint, view in app.view_functions.items() if hasattr(view, 'query_budget')}
+    budgeted |= set(app.config['QUERY_BUDGETS'])
+    routes = app.extensions['route_metrics'].snapshot()
+    assert budgeted - set(routes) == set(), 'budgeted routes the test never requested'
+    assert all(route['over_budget'] == 0 for route in routes.values())
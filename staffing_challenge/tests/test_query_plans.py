@@ -0,0 +1,42 @@
+import re
+
+import pytest
+
+from schema import explain_query, hot_queries
+
+
+# the index each hot query must be answered from, keyed by its name in schema.hot_queries
+EXPECTED_INDEXES = {
+    '/shift (staff)': 'ix_shift_open_board',
+    '/shift (next page)': 'ix_shift_open_board',
+    '/shift (admin)': 'ix_shift_picked_up_by',
+    '/acceptshift (double booking)': 'ix_shift_picked_up_by',
+    '/userdetails': 'ix_shift_picked_up_by',
+    '/pendingrequests': 'ix_shift_pending',
+    '/staff (next page)': 'ix_user_name',
+    '/login': 'uq_user_email',
+    '/coverage': 'ix_shift_coverage_location',
+    'generate-shifts (already posted)': 'ix_shift_posting',
+}
+
+
+def plan_details(app, name):
+    with app.app_context():
+        return [row[-1] for row in explain_query(hot_queries()[name])]
+
+
+@pytest.mark.parametrize('name, index', EXPECTED_INDEXES.items())
+def test_hot_query_uses_its_index(app, name, index):
+    details = plan_details(app, name)
+    assert any(re.search(rf'USING (COVERING )?INDEX {index}\b', detail) for detail in details), details
+    # SQLite before 3.36 says "SCAN TABLE shift", later versions "SCAN shift"
+    assert not any(re.match(r'SCAN (TABLE )?shift\b', detail) and 'INDEX' not in detail for detail in details), \
+        details
+
+
+def test_no_hot_query_scans_a_whole_table(app):
+    with app.app_context():
+        names = list(hot_queries())
+    full_scans = [(name, detail) for name in names for detail in plan_details(app, name)
+                  if detail.startswith('SCAN') and 'INDEX' not in detail]
+    assert not full_scans
@@ -0,0 +1,85 @@
+import datetime
+
+from models import db, User, Shift, ShiftEvent, ShiftTemplate
+from schedules import generate_shifts
+
+
+def add_template(app, location='Hospital 1', area='ICU', days_of_week='0,1,2,3,4,5,6', start_time='7am',
+                 end_time='7pm', start_days_ahead=1, end_days_ahead=None):
+    """
+    A template added by the Admin for RNs, starting start_days_ahead days from today
+    """
+    today = datetime.date.today()
+    end_date = None if end_days_ahead is None else today + datetime.timedelta(days=end_days_ahead)
+    with app.app_context():
+        admin = User.query.filter_by(role='Admin').one()
+        template = ShiftTemplate(location=location, area=area, role='RN', days_of_week=days_of_week,
+                                 start_time=start_time, end_time=end_time,
+                                 start_date=today + datetime.timedelta(days=start_days_ahead), end_date=end_date,
+                                 comments='', added_by_id=admin.id, added_by_name=admin.name)
+        db.session.add(template)
+        db.session.commit()
+        return template.id
+
+
+def generate(app, first_days_ahead, last_days_ahead, location=None):
+    today = datetime.date.today()
+    with app.app_context():
+        result = generate_shifts(today + datetime.timedelta(days=first_days_ahead),
+                                 today + datetime.timedelta(days=last_days_ahead), location)
+        db.session.commit()
+        return result
+
+
+def test_generating_again_posts_nothing_new(app):
+    template_id = add_template(app, area='PACU')
+    assert generate(app, 0, 13) == (13, 0)
+    assert generate(app, 0, 13) == (0, 13)
+    # a longer range only adds the days that are missing
+    assert generate(app, 0, 20) == (7, 13)
+    with app.app_context():
+        shifts = Shift.query.filter_by(template_id=template_id).all()
+        assert len(shifts) == 20
+        assert len({shift.date for shift in shifts}) == 20
+        assert ShiftEvent.query.filter_by(event_type='posted').count() == 20
+
+
+def test_shifts_already_posted_another_way_are_skipped(app):
+    # the seeded ICU shifts are the same location, area, role and start as the template's first week
+    template_id = add_template(app)
+    assert generate(app, 0, 13) == (6, 7)
+    with app.app_context():
+        assert Shift.query.filter_by(area='ICU').count() == 13
+        assert Shift.query.filter_by(template_id=template_id).count() == 6
+
+
+def test_days_a_template_has_posted_are_skipped_after_it_changes(app):
+    template_id = add_template(app, area='PACU', days_of_week='0,3')
+    posted, _ = generate(app, 0, 27)
+    with app.app_context():
+        ShiftTemplate.query.filter_by(id=template_id).update({'start_time': '8am', 'end_time': '8pm'})
+        db.session.commit()
+    assert generate(app, 0, 27) == (0, posted)
+    with app.app_context():
+        assert {shift.start_time for shift in Shift.query.filter_by(template_id=template_id)} == {'7am'}
+
+
+def test_only_future_occurrences_within_the_template_are_posted(app):
+    add_template(app, area='PACU', start_days_ahead=-10, end_days_ahead=4)
+    assert generate(app, -10, -1) == (0, 0)
+    posted, skipped = generate(app, -10, 30)
+    with app.app_context():
+        dates = sorted(date for date, in db.session.query(Shift.date).filter_by(area='PACU'))
+    assert skipped == 0 and posted in (4, 5)
+    assert dates[-1] == datetime.date.today() + datetime.timedelta(days=4)
+    assert dates[0] >= datetime.date.today()
+
+
+def test_location_filter_and_command(app):
+    add_template(app, area='PACU')
+    add_template(app, location='Hospital 2', area='ER')
+    assert generate(app, 0, 6, location='Hospital 2') == (6, 0)
+    result = app.test_cli_runner().invoke(args=['generate-shifts', '--days', '6'])
+    assert 'Posted 6 shifts' in result.output and 'skipped 6' in result.output
+    result = app.test_cli_runner().invoke(args=['generate-shifts', '--days', '6'])
+    assert 'Posted 0 shifts' in result.output and 'skipped 12' in result.output
@@ -0,0 +1,100 @@
+import datetime
+
+import pytest
+
+import api
+import shifts
+from conftest import log_in
+from models import db, User, Shift, ShiftEvent
+
+
+def user_id(app, email):
+    with app.app_context():
+        return User.query.filter_by(email=email).one().id
+
+
+def shift_history(app, shift_id):
+    with app.app_context():
+        return [(event.event_type, event.status, event.picked_up_by_id, event.actor_id)
+                for event in ShiftEvent.query.filter_by(shift_id=shift_id).order_by(ShiftEvent.id)]
+
+
+def event_feed(client, after=None):
+    response = client.get('/api/v1/shift-events', query_string={'after': after} if after else {})
+    assert response.status_code == 200
+    body = response.get_json()
+    return [dict(zip(body['fields'], values)) for values in body['events']], body['cursor'], body['more']
+
+
+def test_every_transition_is_logged_in_order(app):
+    admin, staff = log_in(app, 'admin@example.com'), log_in(app, 'nurse0@example.com')
+    admin_id, nurse_id = user_id(app, 'admin@example.com'), user_id(app, 'nurse0@example.com')
+    day = datetime.date.today() + datetime.timedelta(days=20)
+    assert admin.post('/addshift', data={'location': 'Hospital 1', 'role': 'RN', 'area': 'ER',
+                                         'date': day.isoformat(), 'start_time': '7am', 'end_time': '7pm',
+                                         'comments': ''}).status_code == 302
+    with app.app_context():
+        shift_id = Shift.query.filter_by(area='ER').one().shift_id
+
+    for client, path in [(staff, '/acceptshift'), (admin, '/denyrequest'), (staff, '/acceptshift'),
+                         (admin, '/approverequest'), (admin, '/removeshift')]:
+        assert client.post(path, data={'id': shift_id}).status_code == 302
+    assert shift_history(app, shift_id) == [
+        ('posted', 'Posted', None, admin_id),
+        ('claimed', 'Requested', nurse_id, nurse_id),
+        ('denied', 'Posted', None, admin_id),
+        ('claimed', 'Requested', nurse_id, nurse_id),
+        ('approved', 'Approved', nurse_id, admin_id),
+        ('released', 'Posted', None, admin_id),
+    ]
+    with app.app_context():
+        ids = [event.id for event in ShiftEvent.query.order_by(ShiftEvent.created_at, ShiftEvent.id)]
+    assert ids == sorted(ids)
+
+
+def test_event_feed_pages_in_order_from_its_cursor(app, monkeypatch):
+    monkeypatch.setattr(api, 'CHANGES_PAGE_SIZE', 2)
+    staff = log_in(app, 'nurse0@example.com')
+    with app.app_context():
+        shift_ids = [shift.shift_id for shift in Shift.query.order_by(Shift.start_at).limit(3)]
+    # claims made on different days don't overlap
+    for shift_id in shift_ids:
+        assert staff.post('/acceptshift', data={'id': shift_id}).status_code == 302
+
+    seen, cursor, more = [], None, True
+    while more:
+        events, cursor, more = event_feed(staff, cursor)
+        assert len(events) <= 2
+        seen.extend(events)
+    assert [(event['shift_id'], event['event_type']) for event in seen] == [(shift_id, 'claimed')
+                                                                           for shift_id in shift_ids]
+    assert [event['id'] for event in seen] == sorted(event['id'] for event in seen)
+    # caught up, the cursor stays where it is until something else happens
+    assert event_feed(staff, cursor) == ([], cursor, False)
+    assert staff.post('/removeshift', data={'id': shift_ids[0]}).status_code == 302
+    events, _, _ = event_feed(staff, cursor)
+    assert [(event['shift_id'], event['event_type']) for event in events] == [(shift_ids[0], 'released')]
+
+
+def test_event_is_only_logged_if_its_change_is_saved(app, monkeypatch):
+    def fail_to_queue(shift, picked_up_by):
+        raise RuntimeError('the outbox is unavailable')
+    monkeypatch.setattr(shifts, 'queue_shift_email', fail_to_queue)
+    staff = log_in(app, 'nurse0@example.com')
+    with app.app_context():
+        shift_id = Shift.query.order_by(Shift.start_at).first().shift_id
+    # the claim and its event are written before the email is queued, and all rolled back together
+    with pytest.raises(RuntimeError):
+        staff.post('/acceptshift', data={'id': shift_id})
+    with app.app_context():
+        assert ShiftEvent.query.count() == 0
+        assert db.session.query(Shift.status, Shift.picked_up_by_id).filter_by(shift_id=shift_id).one() == \
+            ('Posted', None)
+
+
+def test_lost_claim_is_not_logged(app):
+    with app.app_context():
+        shift_id = Shift.query.order_by(Shift.start_at).first().shift_id
+    assert log_in(app, 'nurse0@example.com').post('/acceptshift', data={'id': shift_id}).status_code == 302
+    assert log_in(app, 'nurse1@example.com').post('/acceptshift', data={'id': shift_id}).status_code == 409
+    assert [event[0] for event in shift_history(app, shift_id)] == ['claimed']
@@ -0,0 +1,105 @@
+import datetime
+import io
+
+from conftest import log_in
+from models import Shift, ShiftEvent
+
+
+SHIFT_FILE_HEADER = 'location,role,area,date,start_time,end_time,comments'
+
+
+def shift_file(*lines):
+    return '\n'.join((SHIFT_FILE_HEADER,) + lines) + '\n'
+
+
+def upload_shifts(client, contents, mode):
+    response = client.post('/shift_upload', content_type='multipart/form-data', data={
+        'shifts-file': (io.BytesIO(contents.encode()), 'shifts.csv'), 'shifts-mode': mode})
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def upload_day(days_ahead=30):
+    return (datetime.date.today() + datetime.timedelta(days=days_ahead)).isoformat()
+
+
+def event_count(app, event_type):
+    with app.app_context():
+        return ShiftEvent.query.filter_by(event_type=event_type).count()
+
+
+def test_upsert_only_logs_shifts_it_changes(app):
+    admin = log_in(app, 'admin@example.com')
+    day = upload_day()
+    upload_shifts(admin, shift_file(f'Hospital 2,RN,ER,{day},7am,7pm,first', f'Hospital 2,RN,OR,{day},7am,7pm,'),
+                  'insert')
+
+    # the OR shift is uploaded as it already is, only the ER shift's comments change
+    report = upload_shifts(admin, shift_file(f'Hospital 2,RN,ER,{day},7am,7pm,second',
+                                             f'Hospital 2,RN,OR,{day},7am,7pm,'), 'upsert')
+    assert 'Rows updated: 1' in report
+    assert 'Rows already up to date: 1' in report
+    assert event_count(app, 'updated') == 1
+    with app.app_context():
+        assert Shift.query.filter_by(location='Hospital 2', area='ER').one().comments == 'second'
+
+    # uploading the same file again changes nothing at all
+    report = upload_shifts(admin, shift_file(f'Hospital 2,RN,ER,{day},7am,7pm,second',
+                                             f'Hospital 2,RN,OR,{day},7am,7pm,'), 'upsert')
+    assert 'Rows updated: 0' in report
+    assert 'Rows already up to date: 2' in report
+    assert event_count(app, 'updated') == 1
+
+
+def test_insert_normalizes_times_and_skips_duplicates(app):
+    admin = log_in(app, 'admin@example.com')
+    tomorrow, day = upload_day(1), upload_day()
+    # the first row is the seeded ICU shift written another way, the last two are the same shift twice
+    report = upload_shifts(admin, shift_file(f'Hospital 1,RN,ICU,{tomorrow},07:00:00,7pm,',
+                                             f'Hospital 2,RN,ER,{day},7 PM,730am,overnight',
+                                             f'Hospital 2,RN,OR,{day},7am,3pm,',
+                                             f'Hospital 2,RN,OR,{day},7:00am,3pm,'), 'insert')
+    assert 'Rows added: 2' in report
+    assert 'shift has already been posted' in report
+    assert 'shift appears more than once in the file' in report
+    with app.app_context():
+        overnight = Shift.query.filter_by(location='Hospital 2', area='ER').one()
+        assert (overnight.start_time, overnight.end_time) == ('7pm', '7:30am')
+        assert overnight.start_at == datetime.datetime.fromisoformat(f'{day}T19:00')
+        assert overnight.end_at - overnight.start_at == datetime.timedelta(hours=12, minutes=30)
+        assert overnight.status == 'Posted' and overnight.added_by_name == 'Admin'
+        assert Shift.query.filter_by(location='Hospital 2', area='OR').count() == 1
+    assert event_count(app, 'posted') == 2
+
+
+def test_dry_run_reports_without_saving(app):
+    admin = log_in(app, 'admin@example.com')
+    day = upload_day()
+    report = upload_shifts(admin, shift_file(f'Hospital 2,RN,ER,{day},7am,7pm,', f'Hospital 2,RN,OR,{day},7am,7pm,',
+                                             f'Hospital 2,Surgeon,OR,{day},7am,7pm,'), 'dry_run')
+    assert 'This was a dry run, nothing has been saved.' in report
+    assert 'Rows added: 2' in report
+    assert 'role is not a valid choice' in report
+    with app.app_context():
+        assert Shift.query.filter_by(location='Hospital 2').count() == 0
+    assert event_count(app, 'posted') == 0
+
+
+def test_upsert_leaves_picked_up_shifts_alone(app):
+    with app.app_context():
+        shift_id = Shift.query.order_by(Shift.start_at).first().shift_id
+    assert log_in(app, 'nurse0@example.com').post('/acceptshift', data={'id': shift_id}).status_code == 302
+    admin = log_in(app, 'admin@example.com')
+    tomorrow, day = upload_day(1), upload_day()
+    report = upload_shifts(admin, shift_file(f'Hospital 1,RN,ICU,{tomorrow},7am,3pm,shorter',
+                                             f'Hospital 1,RN,ICU,{upload_day(2)},7am,3pm,shorter',
+                                             f'Hospital 2,RN,ER,{day},7am,7pm,'), 'upsert')
+    assert 'Rows added: 1' in report
+    assert 'Rows updated: 1' in report
+    assert 'shift is already posted and has been picked up' in report
+    with app.app_context():
+        claimed = Shift.query.get(shift_id)
+        assert (claimed.end_time, claimed.comments) == ('7:00 PM', None)
+        updated = Shift.query.filter_by(date=datetime.date.fromisoformat(upload_day(2)), area='ICU').one()
+        assert (updated.end_time, updated.comments) == ('3pm', 'shorter')
+        assert updated.end_at - updated.start_at == datetime.timedelta(hours=8)
@@ -0,0 +1,91 @@
+import io
+
+import openpyxl
+from werkzeug.datastructures import FileStorage
+
+from conftest import log_in
+from importers import read_upload_chunks, STAFF_UPLOAD_COLUMNS
+from models import User, EmailOutbox
+
+
+STAFF_FILE_HEADER = 'name,role,location,email,phone_num,can_float'
+
+
+def staff_file(*lines):
+    return '\n'.join((STAFF_FILE_HEADER,) + lines) + '\n'
+
+
+def upload_staff(client, contents, filename='roster.csv'):
+    response = client.post('/upload', content_type='multipart/form-data', data={
+        'staff-file': (io.BytesIO(contents if isinstance(contents, bytes) else contents.encode()), filename)})
+    assert response.status_code == 200
+    return response.get_data(as_text=True)
+
+
+def staff_workbook(rows):
+    workbook = openpyxl.Workbook()
+    workbook.active.append(STAFF_FILE_HEADER.split(','))
+    for row in rows:
+        workbook.active.append(row)
+    contents = io.BytesIO()
+    workbook.save(contents)
+    return contents.getvalue()
+
+
+def test_roster_adds_valid_rows_and_reports_the_rest(app):
+    admin = log_in(app, 'admin@example.com')
+    report = upload_staff(admin, staff_file(
+        'Ann Added,RN,Hospital 1,ann@example.com,555,Yes',
+        'Bob Added,CRNA,Hospital 2,bob@example.com,,',
+        'Existing Nurse,RN,Hospital 1,NURSE0@example.com,555,Yes',
+        'Ann Again,RN,Hospital 1,Ann@Example.com,555,Yes',
+        'Bad Role,Surgeon,Hospital 1,bad@example.com,555,Yes',
+        ',RN,Hospital 1,not-an-email,555,Maybe'))
+    assert 'Rows read: 6' in report
+    assert 'Rows added: 2' in report
+    with app.app_context():
+        added = {user.email: user for user in User.query.filter(User.email.in_(['ann@example.com',
+                                                                                 'bob@example.com']))}
+        assert set(added) == {'ann@example.com', 'bob@example.com'}
+        assert added['bob@example.com'].can_float == 'N/A'
+        assert all(user.password is None and user.invite_token_hash for user in added.values())
+        assert sorted(email.to_addrs for email in EmailOutbox.query) == ['ann@example.com', 'bob@example.com']
+        assert User.query.filter_by(email='bad@example.com').count() == 0
+    # each rejected row is reported against its line in the file
+    assert 'a staff member with this email already exists' in report
+    assert 'email appears more than once in the file' in report
+    assert 'role is not a valid choice' in report
+    assert 'name is required' in report
+    assert 'email is not valid' in report
+    assert 'can_float must be Yes, No or N/A' in report
+
+
+def test_roster_missing_a_column_adds_nobody(app):
+    admin = log_in(app, 'admin@example.com')
+    report = upload_staff(admin, 'name,role,location,email\nAnn Added,RN,Hospital 1,ann@example.com\n')
+    assert 'The file is missing the following columns: phone_num, can_float' in report
+    with app.app_context():
+        assert User.query.filter_by(email='ann@example.com').count() == 0
+        assert EmailOutbox.query.count() == 0
+
+
+def test_excel_roster_streams_in_chunks_numbered_by_line():
+    contents = staff_workbook([['Ann Added', 'RN', 'Hospital 1', 'ann@example.com', '555', 'Yes'],
+                               [None] * 6,
+                               ['Bob Added', 'CRNA', 'Hospital 2', 'bob@example.com', 555, None],
+                               ['Cy Added', 'RN', 'Hospital 1', 'cy@example.com', '555', 'No']])
+    chunks = list(read_upload_chunks(FileStorage(io.BytesIO(contents), filename='roster.xlsx'),
+                                     STAFF_UPLOAD_COLUMNS, chunk_size=2))
+    # the blank row is skipped, but still counted in the line numbers
+    assert [chunk.index.tolist() for chunk in chunks] == [[2, 4], [5]]
+    assert chunks[0].loc[4, 'phone_num'] == '555'
+    assert chunks[0].loc[4, 'can_float'] == ''
+
+
+def test_excel_roster_upload(app):
+    admin = log_in(app, 'admin@example.com')
+    report = upload_staff(admin, staff_workbook([['Ann Added', 'RN', 'Hospital 1', 'ann@example.com', '555', 'Yes']]),
+                          filename='roster.xlsx')
+    assert 'Rows added: 1' in report
+    with app.app_context():
+        assert User.query.filter_by(email='ann@example.com').one().name == 'Ann Added'
@@ -0,0 +1,149 @@
+from flask import Blueprint, current_app, flash, redirect, render_template, request, url_for, send_from_directory
+from flask_login import login_required, current_user
+from werkzeug.datastructures import FileStorage
+import click
+
+from database import read_only
+from exports import SHIFT_EXPORT_FIELDS, STAFF_EXPORT_FIELDS, export_response
+from forms import UploadForm, ShiftUploadForm
+from models import db, User, get_user
+from queries import parse_date_arg, shifts_between_query, user_shifts_query
+
+
+# the Batch Files page: downloading the templates, uploading completed ones and exporting staff and shifts, plus the
+# provision-staff command for loading a roster from the command line
+bp = Blueprint('uploads', __name__, cli_group=None)
+
+# the formats the exports come in
+EXPORT_FORMATS = 'any(csv, xlsx)'
+
+
+@bp.route('/downloadstaff')
+@login_required
+def download_staff():
+    """
+    In the batch files page, if the download button is selected for downloading the staff template, the user will
+    have the staff_roster_template excel doc downloaded to their computer
+    """
+    return send_from_directory('static', filename="files/staff_roster_template.xlsx")
+
+
+@bp.route('/downloadshifts')
+@login_required
+def download_shifts():
+    """
+    In the batch files page, if the download button is selected for downloading the shifts template, the user will
+    have the shifts_template excel doc downloaded to their computer
+    """
+    return send_from_directory('static', filename="files/shifts_template.xlsx")
+
+
+@bp.route(f"/export/staff.<{EXPORT_FORMATS}:file_format>")
+@login_required
+@read_only
+def export_staff(file_format):
+    """
+    Downloads the Staff List, with the same role, location, availability and can_float filters as the page, as a CSV or
+    Excel file. Only Admins can export staff
+    """
+    if get_user(current_user.id).role != 'Admin':
+        flash('Only Admins can export staff.')
+        return redirect(url_for('uploads.upload'))
+    filters = [getattr(User, name) == request.args[name] for name in ['role', 'location', 'availability', 'can_float']
+               if request.args.get(name)]
+    staff_query = db.session.query(*[getattr(User, field) for field in STAFF_EXPORT_FIELDS])\
+        .filter(User.role != 'Admin', *filters).order_by(User.name, User.id)
+    return export_response('staff', file_format, STAFF_EXPORT_FIELDS, staff_query, 'Staff')
+
+
+@bp.route(f"/export/users/<int:user_id>/shifts.<{EXPORT_FORMATS}:file_format>")
+@login_required
+@read_only
+def export_user_shifts(user_id, file_format):
+    """
+    Downloads every shift a staff member has picked up, archived ones included, as a CSV or Excel file. Staff can
+    export their own, Admins can export anyone's
+    """
+    if user_id != current_user.id and get_user(current_user.id).role != 'Admin':
+        flash("Only Admins can export other staff members' shifts.")
+        return redirect(url_for('uploads.upload'))
+    return export_response(f"shifts_user_{user_id}", file_format, SHIFT_EXPORT_FIELDS + ['archived'],
+                           user_shifts_query(user_id, SHIFT_EXPORT_FIELDS), 'Shift History')
+
+
+@bp.route(f"/export/shifts.<{EXPORT_FORMATS}:file_format>")
+@login_required
+@read_only
+def export_shifts(file_format):
+    """
+    Downloads every shift starting from start_date through end_date, archived ones included, as a CSV or Excel file.
+    Only Admins can export shifts
+    """
+    if get_user(current_user.id).role != 'Admin':
+        flash('Only Admins can export shifts.')
+        return redirect(url_for('uploads.upload'))
+    start_date, end_date = parse_date_arg('start_date'), parse_date_arg('end_date')
+    if start_date is None or end_date is None or end_date < start_date:
+        flash('Choose the first and last day of the shifts to export.')
+        return redirect(url_for('uploads.upload'))
+    return export_response(f"shifts_{start_date}_to_{end_date}", file_format, SHIFT_EXPORT_FIELDS + ['archived'],
+                           shifts_between_query(start_date, end_date, SHIFT_EXPORT_FIELDS), 'Shifts')
+
+
+@bp.route('/upload', methods=['GET', 'POST'])
+@login_required
+def upload():
+    """
+    Takes a completed staff roster template (.xlsx or .csv) from the Batch Files page and adds the staff members in it.
+    The user is shown a report of how many rows were added, which rows were skipped and why, and how fast the file
+    was processed
+    """
+    staff_upload_form = UploadForm(prefix='staff')
+    if staff_upload_form.validate_on_submit():
+        # pandas and openpyxl are only loaded once someone actually uploads a file
+        from importers import import_staff_roster
+        report = import_staff_roster(staff_upload_form.file.data)
+        return render_template('upload_report.html', report=report, upload_name='Staff Roster',
+                               next_page=url_for('staff.staff'), logged_in=True)
+
+    return render_template('batch_files.html', staff_upload_form=staff_upload_form,
+                           shift_upload_form=ShiftUploadForm(prefix='shifts'), logged_in=True)
+
+
+@bp.route('/shift_upload', methods=['GET', 'POST'])
+@login_required
+def shift_upload():
+    """
+    Takes a completed shifts template (.xlsx or .csv) from the Batch Files page and posts the shifts in it, checking
+    for shifts that have already been posted. The user is shown a report of what was added, updated and skipped
+    """
+    shift_upload_form = ShiftUploadForm(prefix='shifts')
+    if shift_upload_form.validate_on_submit():
+        from importers import import_shifts
+        cur_user = get_user(current_user.id)
+        report = import_shifts(shift_upload_form.file.data, shift_upload_form.mode.data, cur_user)
+        return render_template('upload_report.html', report=report, upload_name='Shift',
+                               next_page=url_for('shifts.shift'), logged_in=True)
+
+    return render_template('batch_files.html', staff_upload_form=UploadForm(prefix='staff'),
+                           shift_upload_form=shift_upload_form, logged_in=True)
+
+
+@bp.cli.command('provision-staff')
+@click.argument('roster', type=click.Path(exists=True, dir_okay=False))
+def provision_staff(roster):
+    """
+    Adds the staff in a completed staff roster template (.xlsx or .csv) the same way the Batch Files upload does, for
+    rosters too big to wait on in a browser (flask provision-staff ROSTER). Each new staff member is emailed an
+    invite, whose links start with APP_BASE_URL
+    """
+    from importers import import_staff_roster
+    # invite links are built as if for a request to the app at APP_BASE_URL
+    request_context = current_app.test_request_context(base_url=current_app.config['APP_BASE_URL'])
+    with open(roster, 'rb') as roster_file, request_context:
+        report = import_staff_roster(FileStorage(roster_file, filename=roster))
+    for line_number, message in report['errors']:
+        click.echo(f"Row {line_number}: {message}" if line_number else message)
+    click.echo(f"Read {report['rows_read']} rows, added {report['inserted']} staff and queued {report['invited']} "
+               f"invites in {report['seconds']:.2f} seconds ({report['rows_per_second']:.0f} rows/sec), skipped "
+               f"{len(report['errors'])} rows")